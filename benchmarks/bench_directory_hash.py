@@ -0,0 +1,227 @@
+"""
+Benchmark directory_hash.calculate_directory_hash over synthetic script trees.
+
+Builds reproducible trees in a temporary directory (many tiny files, deep
+nesting, a few huge files, excluded __pycache__ noise) and measures, for
+each hashing configuration, cold-cache and warm-cache throughput (files/s,
+MB/s), syscall counts and peak RSS. Every measurement runs in a fresh child
+process so peak RSS and counters are not shared between measurements.
+
+Cold cache is obtained by asking the kernel to drop each file's cached
+pages (posix_fadvise DONTNEED); where that is not available only warm
+numbers are meaningful and the report says so.
+
+Usage:
+    python benchmarks/bench_directory_hash.py [--scale 1.0] [--output report.json]
+    python benchmarks/bench_directory_hash.py --compare old.json new.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+import directory_hash
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+DEFAULT_REPORT = os.path.join(RESULTS_DIR, "directory_hash_latest.json")
+
+DEFAULT_EXCLUDES = ['__pycache__', '.git', '.vscode']
+
+
+def _keep_nothing(rel_path, content, content_hash):
+    pass
+
+# Hashing configurations supported by directory_hash: name -> keyword arguments
+CONFIGS = {
+    "default_excludes": dict(exclude_dirs=DEFAULT_EXCLUDES),
+    "no_excludes": dict(exclude_dirs=[]),
+    "on_file_callback": dict(exclude_dirs=DEFAULT_EXCLUDES, on_file=_keep_nothing),
+    "ignore_rules": dict(exclude_dirs=DEFAULT_EXCLUDES, ignore_rules=["*.pyc", "*.bin", "!huge0.bin", "/d4*/"]),
+}
+
+
+def _write_file(path, size, rng):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        remaining = size
+        while remaining > 0:
+            chunk = min(remaining, 1 << 20)
+            f.write(rng.randbytes(chunk))
+            remaining -= chunk
+
+
+def build_trees(root, scale):
+    """Create the synthetic trees under root; returns {tree name: path}."""
+    rng = random.Random(1234)
+    trees = {}
+
+    path = trees["many_tiny"] = os.path.join(root, "many_tiny")
+    for i in range(int(5000 * scale)):
+        _write_file(os.path.join(path, f"d{i % 50}", f"f{i}.txt"), 64 + i % 256, rng)
+
+    path = trees["deep_nesting"] = os.path.join(root, "deep_nesting")
+    for branch in range(int(20 * scale) or 1):
+        current = os.path.join(path, f"b{branch}")
+        for level in range(40):
+            current = os.path.join(current, f"l{level}")
+            _write_file(os.path.join(current, "x.py"), 512, rng)
+
+    path = trees["few_huge"] = os.path.join(root, "few_huge")
+    for i in range(3):
+        _write_file(os.path.join(path, f"huge{i}.bin"), int(64 * 2**20 * scale), rng)
+
+    path = trees["pycache_noise"] = os.path.join(root, "pycache_noise")
+    for i in range(int(200 * scale) or 1):
+        package = os.path.join(path, f"pkg{i % 20}")
+        _write_file(os.path.join(package, f"m{i}.py"), 2048, rng)
+        for j in range(10):
+            _write_file(os.path.join(package, "__pycache__", f"m{i}.{j}.cpython-311.pyc"), 4096, rng)
+
+    return trees
+
+
+def drop_page_cache(path):
+    """Ask the kernel to evict the cached pages of every file under path."""
+    if not hasattr(os, "posix_fadvise"):
+        return False
+    for root, dirs, files in os.walk(path):
+        for filename in files:
+            fd = os.open(os.path.join(root, filename), os.O_RDONLY)
+            try:
+                os.fsync(fd)
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            finally:
+                os.close(fd)
+    return True
+
+
+def _read_proc_io():
+    try:
+        with open("/proc/self/io", 'r') as f:
+            return {key: int(value) for key, value in (line.split(":") for line in f)}
+    except OSError:
+        return None
+
+
+def measure(tree_path, config_name, cold):
+    """Run one hashing measurement; executed in a fresh child process."""
+    import resource
+
+    counts = {"open": 0, "os.scandir": 0, "os.listdir": 0}
+
+    def audit(event, args):
+        if event in counts:
+            counts[event] += 1
+
+    cache_dropped = drop_page_cache(tree_path) if cold else False
+
+    # Count what the hashed tree contributes (files and bytes actually hashed)
+    files = []
+    def count_file(rel_path, content, content_hash):
+        files.append(len(content))
+
+    kwargs = dict(CONFIGS[config_name])
+    user_callback = kwargs.pop("on_file", None)
+    def on_file(rel_path, content, content_hash):
+        count_file(rel_path, content, content_hash)
+        if user_callback is not None:
+            user_callback(rel_path, content, content_hash)
+
+    sys.addaudithook(audit)
+    io_before = _read_proc_io()
+    start = time.perf_counter()
+    directory_hash.calculate_directory_hash(tree_path, verbose=False, on_file=on_file, **kwargs)
+    elapsed = time.perf_counter() - start
+    io_after = _read_proc_io()
+
+    total_bytes = sum(files)
+    result = {
+        "seconds": elapsed,
+        "files": len(files),
+        "bytes": total_bytes,
+        "files_per_s": len(files) / elapsed if elapsed else None,
+        "mb_per_s": total_bytes / 2**20 / elapsed if elapsed else None,
+        "opens": counts["open"],
+        "dir_scans": counts["os.scandir"] + counts["os.listdir"],
+        # ru_maxrss is KiB on Linux, bytes on macOS
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (2**20 if sys.platform == "darwin" else 2**10),
+        "cache_dropped": cache_dropped,
+    }
+    if io_before and io_after:
+        result["read_syscalls"] = io_after["syscr"] - io_before["syscr"]
+        result["disk_read_mb"] = (io_after["read_bytes"] - io_before["read_bytes"]) / 2**20
+    return result
+
+
+def run_benchmark(scale, repeat):
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "scale": scale,
+        "repeat": repeat,
+        "results": {},
+    }
+    with tempfile.TemporaryDirectory() as root:
+        print(f"Building synthetic trees in {root} (scale {scale})...")
+        trees = build_trees(root, scale)
+
+        for tree_name, tree_path in trees.items():
+            for config_name in CONFIGS:
+                for cache_state in ("cold", "warm"):
+                    runs = []
+                    for _ in range(repeat):
+                        # A fresh process per run keeps peak RSS and counters per measurement
+                        with ProcessPoolExecutor(max_workers=1) as executor:
+                            runs.append(executor.submit(measure, tree_path, config_name, cache_state == "cold").result())
+                    best = min(runs, key=lambda r: r["seconds"])
+                    key = f"{tree_name}/{config_name}/{cache_state}"
+                    report["results"][key] = best
+                    print(f"{key:<45} {best['files']:>6} files {best['mb_per_s']:>9.1f} MB/s "
+                          f"{best['files_per_s']:>10.0f} files/s {best.get('read_syscalls', 0):>7} reads "
+                          f"{best['peak_rss_mb']:>7.1f} MB RSS")
+    return report
+
+
+def compare_reports(old_path, new_path):
+    """Print per-measurement throughput changes between two reports."""
+    with open(old_path, 'r') as f:
+        old = json.load(f)["results"]
+    with open(new_path, 'r') as f:
+        new = json.load(f)["results"]
+    print(f"{'measurement':<45} {'old MB/s':>9} {'new MB/s':>9} {'change':>8} {'old RSS':>8} {'new RSS':>8}")
+    for key in sorted(set(old) & set(new)):
+        change = new[key]["mb_per_s"] / old[key]["mb_per_s"] - 1 if old[key]["mb_per_s"] else 0.0
+        print(f"{key:<45} {old[key]['mb_per_s']:>9.1f} {new[key]['mb_per_s']:>9.1f} {change:>+8.0%} "
+              f"{old[key]['peak_rss_mb']:>8.1f} {new[key]['peak_rss_mb']:>8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiplier for tree sizes (e.g. 0.1 for a quick run)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement (the fastest is kept)")
+    parser.add_argument("--output", default=DEFAULT_REPORT, help="Where to write the JSON report")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="Compare two existing reports and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare_reports(*args.compare)
+        return 0
+
+    report = run_benchmark(args.scale, args.repeat)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
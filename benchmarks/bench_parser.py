@@ -0,0 +1,149 @@
+"""
+Benchmark expression validation, parsing, script-name collection and
+evaluation (with a no-op executor) on generated expressions.
+
+Results are written to a JSON report. When a baseline report exists, every
+timing is compared with it and the run fails (exit code 1) if any of them
+regressed by more than the threshold.
+
+Usage:
+    python benchmarks/bench_parser.py                    # compare with the baseline
+    python benchmarks/bench_parser.py --save-baseline    # record a new baseline
+    python benchmarks/bench_parser.py --threshold 0.10 --repeat 7
+"""
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import foo
+from expression_gen import generate_expression
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+DEFAULT_BASELINE = os.path.join(RESULTS_DIR, "parser_baseline.json")
+DEFAULT_REPORT = os.path.join(RESULTS_DIR, "parser_latest.json")
+
+# Each case exercises a different shape of expression
+CASES = {
+    "wide_flat": dict(depth=1, fan_out=2000, arg_density=1.0),
+    "balanced": dict(depth=5, fan_out=5, arg_density=1.0),
+    "deep_narrow": dict(depth=12, fan_out=2, arg_density=0.5),
+    "arg_heavy": dict(depth=3, fan_out=10, arg_density=6.0),
+    "quoted_escaped": dict(depth=3, fan_out=10, arg_density=3.0, quote_ratio=0.8, escape_ratio=0.5),
+    "non_circuit_mix": dict(depth=4, fan_out=6, operator_mix={"&": 1, "|": 1}, not_ratio=0.3),
+}
+
+
+def noop_executor(script_name, args, verify_hash=False, expected_hash=None):
+    """Executor that succeeds for even-numbered scripts without running anything."""
+    return 0 if int(script_name[1:]) % 2 == 0 else 1
+
+
+def best_time(func, repeat):
+    """Minimum wall time of func() over repeat runs, with orchestrator output silenced."""
+    best = None
+    for _ in range(repeat):
+        # Like timeit, keep garbage collection pauses out of the measurement
+        gc.collect()
+        gc.disable()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+                start = time.perf_counter()
+                func()
+                elapsed = time.perf_counter() - start
+        finally:
+            gc.enable()
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run_case(params, repeat):
+    expression = generate_expression(**params)
+    with contextlib.redirect_stdout(io.StringIO()):
+        tree = foo.parse_logical_expression(expression)
+    if tree is None:
+        raise ValueError(f"Generated expression did not parse: {params}")
+
+    return {
+        "chars": len(expression),
+        "leaves": len(foo.collect_script_names_from_tree(tree)),
+        "validate": best_time(lambda: foo.validate_expression_format(expression), repeat),
+        "parse": best_time(lambda: foo.parse_logical_expression(expression), repeat),
+        "collect": best_time(lambda: foo.collect_script_names_from_tree(tree), repeat),
+        "evaluate": best_time(lambda: tree.evaluate(noop_executor), repeat),
+    }
+
+
+def compare(report, baseline, threshold):
+    """Print a comparison table and return the list of regressions."""
+    regressions = []
+    print(f"{'case':<18} {'metric':<9} {'baseline ms':>12} {'current ms':>11} {'change':>8}")
+    for case, metrics in report["cases"].items():
+        base_metrics = baseline["cases"].get(case)
+        if base_metrics is None:
+            continue
+        for metric in ("validate", "parse", "collect", "evaluate"):
+            base, current = base_metrics[metric], metrics[metric]
+            change = (current - base) / base if base else 0.0
+            flag = "  REGRESSED" if change > threshold else ""
+            print(f"{case:<18} {metric:<9} {base * 1000:>12.2f} {current * 1000:>11.2f} {change:>+8.0%}{flag}")
+            if flag:
+                regressions.append((case, metric, change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline JSON report")
+    parser.add_argument("--output", default=DEFAULT_REPORT, help="Where to write this run's JSON report")
+    parser.add_argument("--save-baseline", action="store_true", help="Write this run as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.20,
+                        help="Allowed slowdown before failing, as a fraction (default 0.20)")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per measurement (the minimum is kept)")
+    parser.add_argument("--cases", nargs="+", choices=sorted(CASES), help="Only run these cases")
+    args = parser.parse_args()
+
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 10000))
+
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "repeat": args.repeat,
+        "cases": {},
+    }
+    for case in args.cases or CASES:
+        report["cases"][case] = run_case(CASES[case], args.repeat)
+        metrics = report["cases"][case]
+        print(f"{case:<18} {metrics['leaves']:>6} leaves  validate {metrics['validate'] * 1000:8.2f} ms  "
+              f"parse {metrics['parse'] * 1000:8.2f} ms  collect {metrics['collect'] * 1000:7.2f} ms  "
+              f"evaluate {metrics['evaluate'] * 1000:8.2f} ms")
+
+    target = args.baseline if args.save_baseline else args.output
+    os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok=True)
+    with open(target, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport written to {target}")
+
+    if args.save_baseline or not os.path.exists(args.baseline):
+        return 0
+
+    with open(args.baseline, 'r') as f:
+        baseline = json.load(f)
+    print()
+    regressions = compare(report, baseline, args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} measurement(s) regressed by more than {args.threshold:.0%}")
+        return 1
+    print(f"\nNo regression above {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
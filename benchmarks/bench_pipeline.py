@@ -0,0 +1,100 @@
+"""
+Measure the time saved by overlapping the DB hash fetch with parsing and
+local folder hashing (foo.fetch_hashes_and_parse).
+
+The DB is simulated by an SQLite hash store that sleeps before answering,
+and the script folders are synthetic trees in a temporary directory.
+
+Usage: python benchmarks/bench_pipeline.py [--latency 0.3] [--scripts 20] [--files 200] [--repeat 5]
+"""
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import directory_hash
+import foo
+import hash_store
+
+
+class SlowSQLiteHashStore(hash_store.SQLiteHashStore):
+    """SQLite hash store that adds a fixed round-trip latency to every fetch"""
+    def __init__(self, path, latency):
+        super().__init__(path)
+        self.latency = latency
+
+    def fetch_hashes(self):
+        time.sleep(self.latency)
+        return super().fetch_hashes()
+
+
+def build_script_folders(root, script_count, files_per_script, file_size):
+    """Create script folders S0..Sn under root, each with many small files."""
+    names = []
+    for i in range(script_count):
+        name = f"S{i}"
+        folder = os.path.join(root, name)
+        os.makedirs(os.path.join(folder, "data"))
+        with open(os.path.join(folder, f"{name}.py"), 'w') as f:
+            f.write(f"def {name}():\n    return 'ok'\n")
+        for j in range(files_per_script):
+            with open(os.path.join(folder, "data", f"file{j}.txt"), 'wb') as f:
+                f.write(os.urandom(file_size))
+        names.append(name)
+    return names
+
+
+def time_mode(expression, pipelined, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        # The orchestrator prints progress; keep the benchmark output readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            tree, script_hashes, local_hashes = foo.fetch_hashes_and_parse(expression, pipelined=pipelined)
+        timings.append(time.perf_counter() - start)
+        assert tree is not None and all(script_hashes[n] == h for n, h in local_hashes.items())
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--latency", type=float, default=0.3, help="Simulated DB round trip in seconds")
+    parser.add_argument("--scripts", type=int, default=20, help="Number of script folders")
+    parser.add_argument("--files", type=int, default=200, help="Files per script folder")
+    parser.add_argument("--file-size", type=int, default=4096, help="Size of each file in bytes")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per mode (median is reported)")
+    args = parser.parse_args()
+
+    original_cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as root:
+        names = build_script_folders(root, args.scripts, args.files, args.file_size)
+        os.chdir(root)
+        try:
+            store = SlowSQLiteHashStore(os.path.join(root, "hashes.sqlite3"), args.latency)
+            store.upsert_hashes(directory_hash.generate_hashes_for_directories(
+                [os.path.join(root, n) for n in names], verbose=False))
+            hash_store.set_hash_store(store)
+
+            expression = "&& [ " + ", ".join(f"({n})" for n in names) + " ]"
+            sequential = time_mode(expression, False, args.repeat)
+            pipelined = time_mode(expression, True, args.repeat)
+        finally:
+            os.chdir(original_cwd)
+            hash_store.close_hash_store()
+
+    print(f"Simulated DB latency: {args.latency * 1000:.0f} ms, "
+          f"{args.scripts} folders x {args.files} files of {args.file_size} bytes")
+    print(f"Sequential: {sequential * 1000:8.1f} ms")
+    print(f"Pipelined:  {pipelined * 1000:8.1f} ms")
+    print(f"Saved:      {(sequential - pipelined) * 1000:8.1f} ms "
+          f"({(1 - pipelined / sequential) * 100:.0f}%)")
+
+
+if __name__ == "__main__":
+    main()
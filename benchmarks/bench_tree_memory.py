@@ -0,0 +1,76 @@
+"""
+Compare the memory used by the object tree (foo.parse_logical_expression)
+and the compact struct-of-arrays tree (compact_tree.parse_compact).
+
+Retained memory is what the parsed tree keeps alive after parsing; peak
+memory includes temporaries created while parsing. Both are measured with
+tracemalloc, so absolute timings are slower than a normal run.
+
+Usage: python benchmarks/bench_tree_memory.py [--leaves 100000 1000000] [--fan-out 10]
+"""
+import argparse
+import contextlib
+import gc
+import io
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import compact_tree
+import foo
+
+
+def generate_expression(leaf_count, fan_out, script_count=50):
+    """Build a balanced expression of nested && / || groups with leaf_count scripts."""
+    leaves = []
+    for i in range(leaf_count):
+        name = f"S{i % script_count}"
+        leaves.append(f"({name}:{i % 7},x)" if i % 3 else f"({name})")
+
+    level = 0
+    nodes = leaves
+    while len(nodes) > 1:
+        operator = "&&" if level % 2 == 0 else "||"
+        nodes = [f"{operator} [ {', '.join(nodes[i:i + fan_out])} ]" for i in range(0, len(nodes), fan_out)]
+        level += 1
+    return nodes[0]
+
+
+def measure(parse_func, expression):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        tree = parse_func(expression)
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert tree is not None
+    del tree
+    return retained, peak, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--leaves", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--fan-out", type=int, default=10)
+    args = parser.parse_args()
+
+    # Deep trees are fine for the compact parser; give the recursive one room too
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 10000))
+
+    print(f"{'leaves':>9} {'representation':<14} {'retained MB':>12} {'peak MB':>9} {'parse s':>8}")
+    for leaf_count in args.leaves:
+        expression = generate_expression(leaf_count, args.fan_out)
+        for label, parse_func in (("objects", foo.parse_logical_expression),
+                                  ("compact", compact_tree.parse_compact)):
+            retained, peak, elapsed = measure(parse_func, expression)
+            print(f"{leaf_count:>9} {label:<14} {retained / 2**20:>12.1f} {peak / 2**20:>9.1f} {elapsed:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""
+End-to-end check of distributed execution on 127.0.0.1.
+
+Starts three 'foo.py --worker' processes on a temporary script root and
+drives them with in-process coordinators (distributed.RemoteExecutor):
+
+    results       outcomes of passing and failing scripts come back, and
+                  jobs are spread over the workers
+    slots         a one-slot worker shared by two coordinators runs one
+                  job at a time
+    cancellation  cancelling a dispatched job stops it on the worker
+    heartbeat     a worker that stops responding (SIGSTOP) is declared lost
+                  and its running job fails
+    refusals      jobs naming a path instead of a script folder, or sent
+                  with a hash other than the registered one, do not run
+
+The workers read the registered hashes from an SQLite hash store in the
+script root.
+
+Usage:
+    python benchmarks/check_distributed.py [--keep]
+"""
+import argparse
+import asyncio
+import os
+import re
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+import directory_hash
+import distributed
+import hash_store
+import run_events
+
+EXCLUDE_DIRS = ['__pycache__', '.git', '.vscode']
+HASH_STORE_FILE = "hashes.sqlite3"
+
+SCRIPTS = {
+    "Ok": "def Ok(*args):\n    return 'ok'\n",
+    "Fail": "def Fail(*args):\n    raise RuntimeError('failing on purpose')\n",
+    "Sleep": (
+        "import asyncio\n"
+        "async def Sleep(seconds, marker=None):\n"
+        "    await asyncio.sleep(float(seconds))\n"
+        "    if marker:\n"
+        "        open(marker, 'w').close()\n"
+    ),
+}
+
+
+def build_root(root):
+    """Write the check scripts, register their hashes and return them."""
+    hashes = {}
+    for name, source in SCRIPTS.items():
+        folder = os.path.join(root, name)
+        os.makedirs(folder)
+        with open(os.path.join(folder, f"{name}.py"), 'w') as f:
+            f.write(source)
+        hashes[name] = directory_hash.calculate_directory_hash(folder, EXCLUDE_DIRS, verbose=False)
+    store = hash_store.SQLiteHashStore(os.path.join(root, HASH_STORE_FILE))
+    store.upsert_hashes(hashes)
+    store.close()
+    return hashes
+
+
+class WorkerProcess:
+    """A 'foo.py --worker' child process; its output is collected in lines."""
+    def __init__(self, root, slots):
+        self.lines = []
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.join(ROOT_DIR, "foo.py"), "--worker", "127.0.0.1:0",
+             "--slots", str(slots), "--root", root],
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+            env={**os.environ, "PYTHONUNBUFFERED": "1", "HASH_STORE_BACKEND": "sqlite",
+                 "HASH_STORE_SQLITE_PATH": os.path.join(root, HASH_STORE_FILE)})
+        self._listening = threading.Event()
+        self.address = None
+        threading.Thread(target=self._read, daemon=True).start()
+        if not self._listening.wait(30):
+            self.stop()
+            raise RuntimeError("Worker did not start:\n" + "".join(self.lines))
+
+    def _read(self):
+        for line in self.process.stdout:
+            self.lines.append(line)
+            match = re.search(r"listening on ([\d.]+:\d+)", line)
+            if match:
+                self.address = match.group(1)
+                self._listening.set()
+
+    def output(self):
+        return "".join(self.lines)
+
+    def stop(self):
+        if self.process.poll() is None:
+            self.process.send_signal(signal.SIGCONT)
+            self.process.kill()
+        self.process.wait()
+
+
+async def run_recorded(remote, script_name, args=()):
+    """Run a script remotely; returns (result, worker_id)."""
+    with run_events.node_record() as record:
+        result = await remote.run(script_name, list(args))
+    return result, record.get("worker")
+
+
+async def check_results(workers, hashes):
+    async with distributed.RemoteExecutor([w.address for w in workers], hashes) as remote:
+        outcomes = await asyncio.gather(
+            run_recorded(remote, "Ok"), run_recorded(remote, "Fail"),
+            *(run_recorded(remote, "Sleep", ["0.5"]) for _ in range(4)))
+    results = [result for result, _ in outcomes]
+    used = {worker_id for _, worker_id in outcomes}
+    assert results == [0, 1, 0, 0, 0, 0], f"unexpected results {results}"
+    assert len(used) == len(workers), f"jobs ran on {len(used)} of {len(workers)} workers"
+    return f"results {results} on {len(used)} workers"
+
+
+async def check_slots(worker, hashes):
+    # Each coordinator respects the announced slot; the worker has to hold back the other's job
+    async with distributed.RemoteExecutor([worker.address], hashes) as first, \
+            distributed.RemoteExecutor([worker.address], hashes) as second:
+        started = time.monotonic()
+        results = await asyncio.gather(first.run("Sleep", ["1"]), second.run("Sleep", ["1"]))
+        elapsed = time.monotonic() - started
+    assert results == [0, 0], f"unexpected results {results}"
+    assert elapsed >= 1.9, f"two 1s jobs on one slot took {elapsed:.2f}s"
+    return f"two 1s jobs on one slot took {elapsed:.2f}s"
+
+
+async def check_cancellation(worker, hashes, root):
+    marker = os.path.join(root, "cancelled.marker")
+    async with distributed.RemoteExecutor([worker.address], hashes) as remote:
+        task = asyncio.create_task(remote.run("Sleep", ["2", marker]))
+        await asyncio.sleep(0.5)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        await asyncio.sleep(2.5)
+        # The slot is free again: a new job runs straight away
+        result = await remote.run("Ok", [])
+    assert not os.path.exists(marker), "the cancelled job ran to completion"
+    assert "=== CANCELLED Sleep" in worker.output(), "the worker did not report the cancellation"
+    assert result == 0, f"job after the cancellation returned {result}"
+    return "job stopped on the worker"
+
+
+async def check_heartbeat_loss(worker, hashes):
+    async with distributed.RemoteExecutor([worker.address], hashes) as remote:
+        task = asyncio.create_task(remote.run("Sleep", ["30"]))
+        await asyncio.sleep(0.5)
+        worker.process.send_signal(signal.SIGSTOP)
+        started = time.monotonic()
+        result = await asyncio.wait_for(task, distributed.HEARTBEAT_TIMEOUT + 10)
+        elapsed = time.monotonic() - started
+        alive = [w.alive for w in remote.workers]
+    worker.process.send_signal(signal.SIGCONT)
+    assert result == 1, f"job on the stopped worker returned {result}"
+    assert alive == [False], "the stopped worker is still considered alive"
+    return f"worker lost after {elapsed:.1f}s, job failed"
+
+
+async def check_refusals(worker, hashes):
+    # A coordinator's hashes are only compared with the worker's registered ones
+    forged = {**hashes, "Ok": "0" * 32, "../Ok": hashes["Ok"]}
+    async with distributed.RemoteExecutor([worker.address], forged) as remote:
+        results = await asyncio.gather(remote.run("../Ok", []), remote.run("Ok", []))
+    output = worker.output()
+    assert results == [1, 1], f"unexpected results {results}"
+    assert "Invalid script name '../Ok'" in output, "the path was not rejected"
+    assert "is not the registered one" in output, "the forged hash was not rejected"
+    return "path and forged hash refused"
+
+
+async def run_checks(workers, hashes, root):
+    checks = [
+        ("results", lambda: check_results(workers[:2], hashes)),
+        ("slots", lambda: check_slots(workers[2], hashes)),
+        ("cancellation", lambda: check_cancellation(workers[0], hashes, root)),
+        ("heartbeat", lambda: check_heartbeat_loss(workers[1], hashes)),
+        ("refusals", lambda: check_refusals(workers[2], hashes)),
+    ]
+    failures = 0
+    for name, check in checks:
+        try:
+            detail = await check()
+            print(f"PASS {name:<13} {detail}")
+        except AssertionError as e:
+            failures += 1
+            print(f"FAIL {name:<13} {e}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--keep", action="store_true", help="Keep the script root and print worker output")
+    args = parser.parse_args()
+
+    # Lose a silent worker sooner than in production
+    distributed.HEARTBEAT_TIMEOUT = 3.0
+
+    root = tempfile.mkdtemp(prefix="check_distributed_")
+    workers = []
+    try:
+        hashes = build_root(root)
+        workers = [WorkerProcess(root, 2), WorkerProcess(root, 2), WorkerProcess(root, 1)]
+        failures = asyncio.run(run_checks(workers, hashes, root))
+    finally:
+        for worker in workers:
+            worker.stop()
+        if args.keep:
+            for worker in workers:
+                print(f"\n--- worker {worker.address} ---\n{worker.output()}")
+            print(f"Script root kept in {root}")
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+    print("All checks passed" if not failures else f"{failures} check(s) failed")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
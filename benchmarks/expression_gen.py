@@ -0,0 +1,72 @@
+"""
+Deterministic generator of logical expressions for benchmarks.
+
+The same parameters and seed always produce the same expression, so
+timings from different runs and machines describe the same workload.
+"""
+import random
+
+# Relative weights of the operators used for inner nodes
+DEFAULT_OPERATOR_MIX = {"&&": 4, "||": 2, "&": 1, "|": 1}
+
+
+def _generate_argument(rng, quote_ratio, escape_ratio):
+    value = f"a{rng.randrange(1000)}"
+    if rng.random() < quote_ratio:
+        # Quoted argument keeping a comma inside one argument
+        value = f"{value},{rng.randrange(1000)}"
+        if rng.random() < escape_ratio:
+            # Escaped quotes become part of the argument
+            value = f'\\"{value}\\"'
+        return f'"{value}"'
+    return value
+
+
+def _generate_leaf(rng, script_count, arg_density, quote_ratio, escape_ratio):
+    name = f"S{rng.randrange(script_count)}"
+    # arg_density is the mean number of arguments per script
+    arg_count = 0
+    while rng.random() < arg_density / (arg_density + 1):
+        arg_count += 1
+    if not arg_count:
+        return f"({name})"
+    args = [_generate_argument(rng, quote_ratio, escape_ratio) for _ in range(arg_count)]
+    return f"({name}:{','.join(args)})"
+
+
+def generate_expression(depth=4, fan_out=4, arg_density=1.0, quote_ratio=0.1, escape_ratio=0.2,
+                        operator_mix=None, not_ratio=0.1, script_count=20, seed=0):
+    """
+    Generate a random but reproducible logical expression.
+
+    Args:
+        depth (int): Number of operator levels above the leaves
+        fan_out (int): Children per operator
+        arg_density (float): Mean number of arguments per script
+        quote_ratio (float): Share of arguments that are quoted (and contain a comma)
+        escape_ratio (float): Share of quoted arguments that also contain escaped quotes
+        operator_mix (dict): Relative weights of '&&', '||', '&' and '|'
+        not_ratio (float): Probability that a node is wrapped in '!'
+        script_count (int): Number of distinct script names (S0..Sn)
+        seed (int): Random seed
+
+    Returns:
+        str: The expression; it has fan_out ** depth script leaves
+    """
+    rng = random.Random(seed)
+    operator_mix = operator_mix or DEFAULT_OPERATOR_MIX
+    operators = list(operator_mix)
+    weights = [operator_mix[op] for op in operators]
+
+    def build(level):
+        if level == 0:
+            node = _generate_leaf(rng, script_count, arg_density, quote_ratio, escape_ratio)
+        else:
+            operator = rng.choices(operators, weights)[0]
+            children = ", ".join(build(level - 1) for _ in range(fan_out))
+            node = f"{operator} [ {children} ]"
+        if rng.random() < not_ratio:
+            node = f"!{node}"
+        return node
+
+    return build(depth)
@@ -0,0 +1,216 @@
+import hashlib
+import hmac
+import importlib.util
+import marshal
+import os
+import secrets
+import stat
+import tempfile
+import threading
+
+# Shared by every process and batch job of the same user; kept outside the
+# script folders so it never affects their directory hash
+DEFAULT_CACHE_DIR = os.environ.get(
+    "SCRIPT_BYTECODE_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "script_bytecode"))
+DEFAULT_MAX_BYTES = int(os.environ.get("SCRIPT_BYTECODE_CACHE_BYTES", 256 * 1024 * 1024))
+
+# Entry header: interpreter magic number + HMAC-SHA256 of the marshalled code
+_HEADER_SIZE = len(importlib.util.MAGIC_NUMBER) + 32
+# Per-user secret authenticating the entries, created in the cache directory
+_KEY_FILE = "key"
+_KEY_SIZE = 32
+_O_NOFOLLOW = getattr(os, "O_NOFOLLOW", 0)
+
+
+class BytecodeCache:
+    """
+    Compiled script code objects keyed by the verified source hash.
+
+    Unlike __pycache__, entries are not validated by mtime: the key is derived
+    from the MD5 of the exact source bytes that passed hash verification (plus
+    the file name and the interpreter's magic number), so a hit is always the
+    compilation of the verified source. Entries are written atomically, hits
+    refresh the entry's mtime, and the least recently used entries are evicted
+    when the cache grows past max_bytes.
+
+    Entries are executed, so they are authenticated with an HMAC keyed by a
+    secret only this user can read, and files are opened without following
+    symbolic links. On POSIX the cache is not used at all unless its
+    directory is owned by the current user and closed to everyone else (0700).
+    """
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._key = None
+        self._disabled = False
+
+    @staticmethod
+    def _check_private(st, what):
+        if os.name != "posix":
+            return
+        if st.st_uid != os.getuid() or st.st_mode & 0o077:
+            raise OSError(f"{what} must be owned by the current user and private (0700 / 0600)")
+
+    def _load_key(self):
+        """The HMAC key, created on first use. Raises OSError if the cache directory is not private."""
+        os.makedirs(self.cache_dir, mode=0o700, exist_ok=True)
+        st = os.lstat(self.cache_dir)  # makedirs does not fix the mode of an existing directory
+        if not stat.S_ISDIR(st.st_mode):
+            raise OSError(f"{self.cache_dir} is not a directory")
+        self._check_private(st, self.cache_dir)
+
+        key_path = os.path.join(self.cache_dir, _KEY_FILE)
+        if not os.path.lexists(key_path):
+            fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")  # Created 0600
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(secrets.token_bytes(_KEY_SIZE))
+                os.link(temp_path, key_path)  # Fails if another process created the key first
+            except FileExistsError:
+                pass
+            finally:
+                os.remove(temp_path)
+
+        fd = os.open(key_path, os.O_RDONLY | _O_NOFOLLOW)
+        with os.fdopen(fd, 'rb') as f:
+            self._check_private(os.fstat(f.fileno()), key_path)
+            key = f.read()
+        if len(key) != _KEY_SIZE:
+            raise OSError(f"{key_path} is not a bytecode cache key")
+        return key
+
+    def _get_key(self):
+        """The HMAC key, or None if the cache cannot be used safely (warned about once)."""
+        with self._lock:
+            if self._key is None and not self._disabled:
+                try:
+                    self._key = self._load_key()
+                except OSError as e:
+                    self._disabled = True
+                    print(f"Warning: Bytecode cache disabled: {e}")
+            return self._key
+
+    def _entry_path(self, source_hash, filename):
+        key = hashlib.md5(
+            importlib.util.MAGIC_NUMBER + source_hash.encode('utf-8') + b"\0" + filename.encode('utf-8'))
+        return os.path.join(self.cache_dir, f"{key.hexdigest()}.bin")
+
+    def _read(self, path, key):
+        try:
+            fd = os.open(path, os.O_RDONLY | _O_NOFOLLOW)
+            with os.fdopen(fd, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+
+        magic = data[:len(importlib.util.MAGIC_NUMBER)]
+        mac = data[len(magic):_HEADER_SIZE]
+        payload = data[_HEADER_SIZE:]
+        if (magic != importlib.util.MAGIC_NUMBER
+                or not hmac.compare_digest(hmac.new(key, payload, hashlib.sha256).digest(), mac)):
+            return None  # Corrupt, tampered with or written by another interpreter version
+        try:
+            code = marshal.loads(payload)
+        except (EOFError, ValueError, TypeError):
+            return None
+
+        try:
+            os.utime(path)  # Mark as recently used for LRU eviction
+        except OSError:
+            pass
+        return code
+
+    def _write(self, path, code, key):
+        payload = marshal.dumps(code)
+        data = importlib.util.MAGIC_NUMBER + hmac.new(key, payload, hashlib.sha256).digest() + payload
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except OSError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits in max_bytes."""
+        entries = []
+        total = 0
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return
+        for name in names:
+            if not name.endswith(".bin"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue  # Removed concurrently by another process
+            entries.append((st.st_mtime_ns, st.st_size, path))
+            total += st.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def load_or_compile(self, source, source_hash, filename):
+        """
+        Return the code object for verified source bytes.
+
+        Args:
+            source (bytes): Verified Python source
+            source_hash (str): MD5 of source, as computed during verification
+            filename (str): File name shown in tracebacks
+
+        Returns:
+            code: Compiled code, taken from the cache when possible
+        """
+        key = self._get_key()
+        if key is None:
+            return compile(source, filename, 'exec')
+        path = self._entry_path(source_hash, filename)
+        code = self._read(path, key)
+        if code is not None:
+            with self._lock:
+                self.hits += 1
+            return code
+
+        with self._lock:
+            self.misses += 1
+        code = compile(source, filename, 'exec')
+        try:
+            self._write(path, code, key)
+            self.evict()
+        except OSError as e:
+            # The cache is an optimisation only; never fail a script because of it
+            print(f"Warning: Could not write bytecode cache entry {path}: {e}")
+        return code
+
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+def get_bytecode_cache():
+    """
+    Return the process-wide bytecode cache, or None if disabled
+    (SCRIPT_BYTECODE_CACHE_DIR set to an empty string).
+    """
+    global _shared_cache
+    if not DEFAULT_CACHE_DIR:
+        return None
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = BytecodeCache()
+        return _shared_cache
@@ -0,0 +1,311 @@
+from array import array
+
+import logical_expression
+
+# Node kinds stored in CompactTree.kinds
+SCRIPT, AND, OR, NOT = 0, 1, 2, 3
+
+_NO_RESULT = -1
+
+
+class CompactTree:
+    """
+    Struct-of-arrays representation of an expression tree.
+
+    Every node is an index into parallel arrays instead of a Python object:
+    kind, circuit-breaking flag, interned script name and argument tuple,
+    and a slice of a shared child index array. Script names and argument
+    tuples are interned, so repeated leaves cost a few bytes each. Use
+    parse_compact() to build one directly from an expression, and
+    CompactTree.root for a view with the usual node API.
+    """
+    def __init__(self):
+        self.kinds = array('B')
+        self.circuit_breaking = array('B')
+        self.name_ids = array('i')
+        self.args_ids = array('i')
+        self.child_start = array('i')
+        self.child_count = array('i')
+        self.child_index = array('i')
+        self.results = array('b')
+        self.names = []
+        self.args_table = []
+        self.cached_results = {}  # Sparse: node index -> result reused by --resume
+        self._name_lookup = {}
+        self._args_lookup = {}
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def add_node(self, kind, circuit_breaking=False, name=None, args=None):
+        """Append a node without children and return its index."""
+        name_id = args_id = -1
+        if name is not None:
+            name_id = self._name_lookup.get(name)
+            if name_id is None:
+                name_id = self._name_lookup[name] = len(self.names)
+                self.names.append(name)
+            args = tuple(args or ())
+            args_id = self._args_lookup.get(args)
+            if args_id is None:
+                args_id = self._args_lookup[args] = len(self.args_table)
+                self.args_table.append(args)
+
+        self.kinds.append(kind)
+        self.circuit_breaking.append(1 if circuit_breaking else 0)
+        self.name_ids.append(name_id)
+        self.args_ids.append(args_id)
+        self.child_start.append(len(self.child_index))
+        self.child_count.append(0)
+        self.results.append(_NO_RESULT)
+        return len(self.kinds) - 1
+
+    def set_children(self, index, children):
+        """Store the children of a node as one contiguous slice of child_index."""
+        self.child_start[index] = len(self.child_index)
+        self.child_count[index] = len(children)
+        self.child_index.extend(children)
+
+    def children_of(self, index):
+        start = self.child_start[index]
+        return self.child_index[start:start + self.child_count[index]]
+
+    def script_names(self):
+        """Unique script names used in the tree (like collect_script_names_from_tree)."""
+        used = set(self.name_ids)
+        return [name for name_id, name in enumerate(self.names) if name_id in used]
+
+    def leaf_count(self):
+        return self.kinds.count(SCRIPT)
+
+    def view(self, index, path="0"):
+        """Return a node view for index; path is the node's position in the tree."""
+        return _VIEW_CLASSES[self.kinds[index]](self, index, path)
+
+    @property
+    def root(self):
+        return self.view(0) if len(self.kinds) else None
+
+
+class _NodeView:
+    """Thin view giving a CompactTree node the attributes of logical_expression.Node"""
+    __slots__ = ('tree', 'index', 'path')
+
+    def __init__(self, tree, index, path):
+        self.tree = tree
+        self.index = index
+        self.path = path
+
+    @property
+    def result(self):
+        value = self.tree.results[self.index]
+        return None if value == _NO_RESULT else bool(value)
+
+    @result.setter
+    def result(self, value):
+        self.tree.results[self.index] = _NO_RESULT if value is None else int(value)
+
+    def _child_views(self):
+        return [self.tree.view(child, f"{self.path}.{position}")
+                for position, child in enumerate(self.tree.children_of(self.index))]
+
+
+class ScriptView(_NodeView):
+    __slots__ = ()
+    evaluate = logical_expression.ScriptNode.evaluate
+    evaluate_async = logical_expression.ScriptNode.evaluate_async
+    _finish = logical_expression.ScriptNode._finish
+    __str__ = logical_expression.ScriptNode.__str__
+
+    @property
+    def name(self):
+        return self.tree.names[self.tree.name_ids[self.index]]
+
+    @property
+    def args(self):
+        # A list, as ScriptNode.args: scripts and their output see the same value either way
+        return list(self.tree.args_table[self.tree.args_ids[self.index]])
+
+    @property
+    def result(self):
+        value = self.tree.results[self.index]
+        return None if value == _NO_RESULT else value
+
+    @result.setter
+    def result(self, value):
+        self.tree.results[self.index] = _NO_RESULT if value is None else int(value)
+
+    @property
+    def cached_result(self):
+        return self.tree.cached_results.get(self.index)
+
+    @cached_result.setter
+    def cached_result(self, value):
+        if value is None:
+            self.tree.cached_results.pop(self.index, None)
+        else:
+            self.tree.cached_results[self.index] = value
+
+
+class _OperatorView(_NodeView):
+    __slots__ = ()
+    __str__ = logical_expression.LogicalOperatorNode.__str__
+
+    @property
+    def children(self):
+        return self._child_views()
+
+    @property
+    def circuit_breaking(self):
+        return bool(self.tree.circuit_breaking[self.index])
+
+
+class AndView(_OperatorView):
+    __slots__ = ()
+    evaluate = logical_expression.AndNode.evaluate
+    evaluate_async = logical_expression.AndNode.evaluate_async
+
+    @property
+    def operator(self):
+        return "&&" if self.circuit_breaking else "&"
+
+
+class OrView(_OperatorView):
+    __slots__ = ()
+    evaluate = logical_expression.OrNode.evaluate
+    evaluate_async = logical_expression.OrNode.evaluate_async
+
+    @property
+    def operator(self):
+        return "||" if self.circuit_breaking else "|"
+
+
+class NotView(_NodeView):
+    __slots__ = ()
+    evaluate = logical_expression.NotNode.evaluate
+    evaluate_async = logical_expression.NotNode.evaluate_async
+    __str__ = logical_expression.NotNode.__str__
+
+    @property
+    def child(self):
+        children = self._child_views()
+        return children[0] if children else None
+
+
+_VIEW_CLASSES = {SCRIPT: ScriptView, AND: AndView, OR: OrView, NOT: NotView}
+
+_OPERATORS = (("&&", AND, True), ("||", OR, True), ("&", AND, False), ("|", OR, False))
+
+
+def parse_compact(expression):
+    """
+    Parse a logical expression straight into a CompactTree.
+
+    Accepts the same syntax as logical_expression.parse_logical_expression
+    and builds the same tree, without allocating a Python object per node.
+    The parser is iterative, so deeply nested expressions do not hit the
+    recursion limit.
+
+    Returns:
+        CompactTree: The parsed tree, or None if the expression is invalid
+    """
+    is_valid, error_msg = logical_expression.validate_expression_format(expression)
+    if not is_valid:
+        print(f"Error in expression format: {error_msg}")
+        logical_expression.print_expression_help()
+        return None
+
+    expr = logical_expression.normalize_expression(expression)
+    n = len(expr)
+    tree = CompactTree()
+
+    # Frames of operators whose children are being parsed: [index, child list]
+    # or NOT nodes waiting for their child: [index, None]
+    stack = []
+    pos = 0
+    mode = "expr"
+    value = None
+
+    while True:
+        if mode == "expr":
+            while pos < n and expr[pos].isspace():
+                pos += 1
+            mode = "done"
+            value = None
+            if pos >= n:
+                continue
+
+            if expr[pos] == "!":
+                value = tree.add_node(NOT)
+                pos += 1
+                while pos < n and expr[pos].isspace():
+                    pos += 1
+                if pos < n:
+                    stack.append([value, None])
+                    mode = "expr"
+                else:
+                    print("Warning: Missing expression after NOT operator")
+                continue
+
+            for token, kind, circuit_breaking in _OPERATORS:
+                if expr.startswith(token, pos) and (len(token) == 2 or pos + 1 >= n or expr[pos + 1] != token):
+                    value = tree.add_node(kind, circuit_breaking)
+                    pos += len(token)
+                    while pos < n and expr[pos].isspace():
+                        pos += 1
+                    if pos < n and expr[pos] == "[":
+                        pos += 1
+                        stack.append([value, []])
+                        mode = "children"
+                    else:
+                        print(f"Warning: Missing opening bracket for operator '{token}'")
+                    break
+            else:
+                if expr[pos] == "(":
+                    leaf, pos = logical_expression.parse_script_node(expr, pos)
+                    value = tree.add_node(SCRIPT, name=leaf.name, args=leaf.args)
+                else:
+                    print(f"Warning: Unexpected character at position {pos}: '{expr[pos]}'")
+                    while pos < n and expr[pos] not in "()[],&|":
+                        pos += 1
+
+        elif mode == "children":
+            if pos < n and expr[pos] != "]":
+                while pos < n and (expr[pos].isspace() or expr[pos] == ","):
+                    pos += 1
+                if pos < n and expr[pos] != "]":
+                    mode = "expr"
+                    continue
+
+            index, children = stack.pop()
+            if pos < n and expr[pos] == "]":
+                pos += 1
+            else:
+                operator = "&&" if tree.kinds[index] == AND else "||"
+                if not tree.circuit_breaking[index]:
+                    operator = operator[0]
+                print(f"Warning: Missing closing bracket for operator '{operator}'")
+            tree.set_children(index, children)
+            value = index
+            mode = "done"
+
+        else:  # "done": deliver value to the enclosing frame
+            if not stack:
+                break
+            frame = stack[-1]
+            if frame[1] is None:
+                stack.pop()
+                if value is not None:
+                    tree.set_children(frame[0], [value])
+                else:
+                    print("Warning: Missing expression after NOT operator")
+                value = frame[0]
+            else:
+                if value is not None:
+                    frame[1].append(value)
+                mode = "children"
+
+    if pos < n:
+        print(f"Warning: Expression parsing stopped at position {pos}/{n}. Remainder: '{expr[pos:]}'")
+
+    return tree if len(tree) else None
@@ -1,7 +1,70 @@
 import os
 import hashlib
+from concurrent.futures import ThreadPoolExecutor
 
-def calculate_directory_hash(directory_path, exclude_dirs=None, verbose=True):
+import hash_ignore
+
+# Signed manifest of a script folder (see folder_manifest); never part of the hash
+MANIFEST_FILE = ".hashmanifest"
+# Temporary files of a manifest being written (.hashmanifest.<random>.tmp); never hashed either
+MANIFEST_TEMP_PREFIX = MANIFEST_FILE + "."
+MANIFEST_TEMP_SUFFIX = ".tmp"
+
+def _is_manifest_file(filename):
+    return filename == MANIFEST_FILE or (
+        filename.startswith(MANIFEST_TEMP_PREFIX) and filename.endswith(MANIFEST_TEMP_SUFFIX))
+
+def walk_directory(directory_path, exclude_dirs=None, ignore_rules=None):
+    """
+    Walk the part of a directory that is hashed, in a deterministic order.
+    
+    Exclusions use gitignore syntax (see hash_ignore): exclude_dirs names (or
+    globs) match directories at any depth, ignore_rules apply from the root,
+    and every .hashignore file applies to its own directory and below.
+    Excluded directories are pruned before being descended into.
+    
+    Args:
+        directory_path (str): Path to the directory to walk
+        exclude_dirs (list): List of directory names to exclude
+        ignore_rules (list): Additional gitignore-style rule lines
+        
+    Yields:
+        tuple: (root, rel_dir_path, filenames) for every included directory,
+               with the included file names sorted
+    """
+    if exclude_dirs is None:
+        exclude_dirs = ['__pycache__', '.git', '.vscode']
+    
+    matcher = hash_ignore.IgnoreMatcher()
+    matcher = matcher.child("", hash_ignore.IgnoreRules.from_dir_names(exclude_dirs))
+    matcher = matcher.child("", hash_ignore.IgnoreRules(ignore_rules or ()))
+    matchers = {'.': matcher}
+    
+    for root, dirs, files in os.walk(directory_path):
+        rel_dir_path = os.path.relpath(root, directory_path)
+        rel_prefix = '' if rel_dir_path == '.' else rel_dir_path.replace(os.sep, '/') + '/'
+        matcher = matchers.pop(rel_dir_path)
+        if hash_ignore.IGNORE_FILE in files:
+            rules = hash_ignore.IgnoreRules.from_file(os.path.join(root, hash_ignore.IGNORE_FILE))
+            matcher = matcher.child(rel_prefix.rstrip('/'), rules)
+        
+        # Prune excluded directories before os.walk descends into them
+        dirs[:] = sorted(d for d in dirs if not matcher.is_ignored(rel_prefix + d, True))
+        for d in dirs:
+            matchers[os.path.join(rel_dir_path, d) if rel_prefix else d] = matcher
+        
+        if not rel_prefix:
+            files = [f for f in files if not _is_manifest_file(f)]
+        yield root, rel_dir_path, sorted(f for f in files if not matcher.is_ignored(rel_prefix + f, False))
+
+def rules_entry(ignore_rules):
+    """Digest entry making explicitly passed ignore rules part of the hash (None if there are none)."""
+    if not ignore_rules:
+        return None
+    rules_hash = hashlib.md5("\n".join(ignore_rules).encode('utf-8')).hexdigest()
+    return f"RULES:{rules_hash}"
+
+def calculate_directory_hash(directory_path, exclude_dirs=None, verbose=True, on_file=None, ignore_rules=None):
     """
     Calculate a deterministic hash of an entire directory structure.
     
@@ -9,38 +72,35 @@ def calculate_directory_hash(directory_path, exclude_dirs=None, verbose=True):
         directory_path (str): Path to the directory to hash
         exclude_dirs (list): List of directory names to exclude (e.g., ['__pycache__', '.git'])
         verbose (bool): Whether to print detailed hashing information
+        on_file (callable): Optional on_file(rel_path, content, content_hash) called for
+                            every hashed file, so callers can keep the exact bytes that
+                            were hashed without reading the file again
+        ignore_rules (list): Additional gitignore-style exclusion rules (see walk_directory);
+                             they are part of the hash, like the .hashignore files
         
     Returns:
         str: MD5 hash of the directory as a hexadecimal string, or None if directory doesn't exist
     Features:
         - Sensitive to directory structure (folder hierarchy)
         - Sensitive to file contents
+        - Sensitive to the exclusion rules (.hashignore files are hashed like any file)
         - Insensitive to file access times, order of these files and other metadata    
     """
     if not os.path.exists(directory_path):
         return None
     
-    if exclude_dirs is None:
-        exclude_dirs = ['__pycache__', '.git', '.vscode']
-    
     if verbose:
         print(f"Calculating hash for directory: {directory_path}")
     
     # Store both file hashes and structure information
     directory_entries = []
+    entry = rules_entry(ignore_rules)
+    if entry is not None:
+        directory_entries.append(entry)
     
-    # Walk through the directory structure
-    for root, dirs, files in os.walk(directory_path):
-        # Exclude directories we want to skip
-        for exclude_dir in exclude_dirs:
-            if exclude_dir in dirs:
-                dirs.remove(exclude_dir)
-        
-        # Sort directories for consistent traversal
-        dirs.sort()
-        
+    # Walk through the included part of the directory structure
+    for root, rel_dir_path, files in walk_directory(directory_path, exclude_dirs, ignore_rules):
         # Include directory structure in the hash
-        rel_dir_path = os.path.relpath(root, directory_path)
         if rel_dir_path != '.':  # Skip the root directory itself
             # Add entry for this directory to capture the tree structure
             dir_entry = f"DIR:{rel_dir_path}"
@@ -49,7 +109,7 @@ def calculate_directory_hash(directory_path, exclude_dirs=None, verbose=True):
                 print(f"  - Including directory structure: {rel_dir_path}")
         
         # Process each file
-        for filename in sorted(files):  # Sort for consistency
+        for filename in files:
             file_path = os.path.join(root, filename)
             # Skip files we can't read
             if not os.access(file_path, os.R_OK):
@@ -73,8 +133,30 @@ def calculate_directory_hash(directory_path, exclude_dirs=None, verbose=True):
             except Exception as e:
                 if verbose:
                     print(f"  - Error hashing file {rel_path}: {e}")
+                continue
+            
+            if on_file is not None:
+                on_file(rel_path, file_content, content_hash)
     
     # Create a combined hash from all entries
+    final_hash = combine_entries(directory_entries)
+    if final_hash is None:
+        return None
+    
+    if verbose:
+        print(f"Final directory hash: {final_hash}\n")
+    return final_hash
+
+def combine_entries(directory_entries):
+    """
+    Combine "DIR:<relpath>" and "FILE:<relpath>:<md5>" entries into the directory hash.
+    
+    Args:
+        directory_entries (list): Entries in any order (sorted in place)
+        
+    Returns:
+        str: MD5 hash of the sorted entries, or None if there are no entries
+    """
     if not directory_entries:
         return None
         
@@ -86,12 +168,10 @@ def calculate_directory_hash(directory_path, exclude_dirs=None, verbose=True):
     for entry in directory_entries:
         combined_hash.update(entry.encode('utf-8'))
     
-    final_hash = combined_hash.hexdigest()
-    if verbose:
-        print(f"Final directory hash: {final_hash}\n")
-    return final_hash
+    return combined_hash.hexdigest()
 
-def verify_directory_hash(directory_path, expected_hash, exclude_dirs=None, verbose=False):
+def verify_directory_hash(directory_path, expected_hash, exclude_dirs=None, verbose=False, policy=None,
+                          use_manifest=False):
     """
     Verify that a directory's current hash matches the expected hash.
     
@@ -100,6 +180,10 @@ def verify_directory_hash(directory_path, expected_hash, exclude_dirs=None, verb
         expected_hash (str): Expected hash value
         exclude_dirs (list): List of directory names to exclude
         verbose (bool): Whether to print detailed hashing information
+        policy (VerificationPolicy): Optional tiered policy (see verify_policy) deciding
+                                     whether a stat manifest check is enough
+        use_manifest (bool): Check the folder against its signed .hashmanifest when it has
+                             a usable one, stopping at the first differing file
         
     Returns:
         bool: True if the hashes match, False otherwise
@@ -108,9 +192,28 @@ def verify_directory_hash(directory_path, expected_hash, exclude_dirs=None, verb
         print(f"No expected hash provided for {directory_path}, skipping verification")
         return True
         
-    current_hash = calculate_directory_hash(directory_path, exclude_dirs, verbose=verbose)
+    if use_manifest:
+        import folder_manifest
+        ok, differences, error = folder_manifest.verify_with_manifest(
+            directory_path, expected_hash, exclude_dirs)
+        if error is None:
+            if ok:
+                print(f"Hash verification PASSED for {directory_path} (manifest)")
+                return True
+            print(f"Hash verification FAILED for {directory_path}")
+            folder_manifest.print_differences(differences)
+            return False
+        if verbose:
+            print(f"Manifest not used for {directory_path}: {error}")
+    
+    tier_note = ""
+    if policy is not None:
+        current_hash, tier, _ = policy.folder_hash(directory_path, exclude_dirs)
+        tier_note = f" ({tier})"
+    else:
+        current_hash = calculate_directory_hash(directory_path, exclude_dirs, verbose=verbose)
     if current_hash == expected_hash:
-        print(f"Hash verification PASSED for {directory_path}")
+        print(f"Hash verification PASSED for {directory_path}{tier_note}")
         return True
     else:
         print(f"Hash verification FAILED for {directory_path}")
@@ -146,40 +249,82 @@ def generate_hash_for_script(script_name):
     if hash_value:
         print(f"\nScript: {script_name}")
         print(f"Hash: {hash_value}")
-        print(f"\nAdd this to your script_hashes dictionary:")
-        print(f'    "{script_name}": "{hash_value}",')
+        print(f"\nRegister it in the hash store with:")
+        print(f"    python register_hashes.py --names {script_name}")
     
     return hash_value
 
-def generate_hashes_for_directories(directories, exclude_dirs=None):
+def generate_hashes_for_directories(directories, exclude_dirs=None, max_workers=1, verbose=True):
     """
     Generate hashes for a list of directories.
     
     Args:
         directories (list): List of directory paths to hash
         exclude_dirs (list): List of directory names to exclude
+        max_workers (int): Number of directories to hash in parallel (1 = sequential)
+        verbose (bool): Whether to print detailed hashing information
         
     Returns:
         dict: Dictionary mapping directory names to their hash values
     """
-    hashes = {}
+    directories = [d for d in directories if os.path.isdir(d)]
+    
+    if max_workers is None or max_workers > 1:
+        # File reads and MD5 updates release the GIL, so threads overlap the I/O
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            hash_values = list(executor.map(
+                lambda d: calculate_directory_hash(d, exclude_dirs, verbose=verbose), directories))
+    else:
+        hash_values = [calculate_directory_hash(d, exclude_dirs, verbose=verbose) for d in directories]
     
-    for directory in directories:
-        if os.path.isdir(directory):
-            dir_name = os.path.basename(directory)
-            hash_value = calculate_directory_hash(directory, exclude_dirs, verbose=True)
-            hashes[dir_name] = hash_value
+    hashes = {}
+    for directory, hash_value in zip(directories, hash_values):
+        hashes[os.path.basename(os.path.normpath(directory))] = hash_value
     
     return hashes
 
+def is_script_name(name):
+    """
+    Check that name can be a script folder name: the script function shares
+    it, so it must be a Python identifier. This also rules out path
+    separators, '..' and absolute paths, keeping the folder under its root.
+    """
+    return isinstance(name, str) and name.isidentifier()
+
+def find_script_folders(root_dir, names=None):
+    """
+    Find the script folders under root_dir.
+    A script folder is a directory <name> that contains <name>/<name>.py.
+
+    Args:
+        root_dir (str): Directory holding the script folders
+        names (list): Optional list of folder names to restrict to
+
+    Returns:
+        list: Sorted list of script folder paths
+    """
+    folders = []
+    for entry in sorted(os.listdir(root_dir)):
+        if names is not None and entry not in names:
+            continue
+        folder = os.path.join(root_dir, entry)
+        if os.path.isdir(folder) and os.path.isfile(os.path.join(folder, f"{entry}.py")):
+            folders.append(folder)
+    return folders
+
 # Added main function to run the script directly
 if __name__ == "__main__":
     import sys
     
     if len(sys.argv) < 2:
         print("Usage: python directory_hash.py <script_name>")
+        print("       python directory_hash.py --watch [root] [--state-file PATH] [--poll]")
         print("This will generate a hash for the specified script directory")
         sys.exit(1)
     
+    if sys.argv[1] == "--watch":
+        import hash_watch
+        sys.exit(hash_watch.main(sys.argv[2:]))
+    
     script_name = sys.argv[1]
     generate_hash_for_script(script_name)
\ No newline at end of file
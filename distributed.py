@@ -0,0 +1,394 @@
+"""
+Coordinator / worker execution of expression trees over TCP.
+
+Workers are long-running processes that each serve a directory of script
+folders:
+
+    python foo.py --worker 127.0.0.1:7001 --slots 4 --root /srv/scripts [--profile A,C]
+
+The coordinator is a normal foo.py run given the worker addresses; it
+parses, verifies and evaluates the expression (with the async engine) and
+sends every script execution to a worker:
+
+    python foo.py <log_id> "<expression>" --workers 127.0.0.1:7001,127.0.0.1:7002
+
+Messages are JSON objects preceded by their length (4 bytes, big endian):
+
+    worker -> coordinator  {"type": "hello", "worker_id", "slots"}
+    coordinator -> worker  {"type": "run", "job_id", "script", "args", "expected_hash"}
+    coordinator -> worker  {"type": "cancel", "job_id"}
+    worker -> coordinator  {"type": "result", "job_id", "result", "cancelled", "record"}
+    worker -> coordinator  {"type": "heartbeat", "running": [job_id, ...]}
+
+A worker only runs plain script folder names under its root, and verifies
+the folder hash itself (directory_hash) against the hash registered in its
+own hash store before running anything; a coordinator sending a different
+hash is refused. Each worker therefore needs access to the hash store
+(HASH_STORE_* settings). A worker whose heartbeats stop is considered lost
+and its running jobs fail. Cancelling the coroutine awaiting a job (e.g.
+once a result is decided) cancels the job on the worker.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import socket
+import struct
+
+import directory_hash
+import hash_store
+import run_events
+import script_output
+import script_profile
+
+HEADER = struct.Struct(">I")
+MAX_MESSAGE_SIZE = 16 * 2**20
+HEARTBEAT_INTERVAL = 1.0  # seconds between worker heartbeats
+HEARTBEAT_TIMEOUT = 5.0   # a worker silent for this long is considered lost
+
+
+async def send_message(writer, message):
+    data = json.dumps(message).encode('utf-8')
+    writer.write(HEADER.pack(len(data)) + data)
+    await writer.drain()
+
+
+async def read_message(reader):
+    """Read one message; returns None when the connection is closed."""
+    try:
+        header = await reader.readexactly(HEADER.size)
+    except asyncio.IncompleteReadError:
+        return None
+    (length,) = HEADER.unpack(header)
+    if length > MAX_MESSAGE_SIZE:
+        raise ValueError(f"Message of {length} bytes exceeds the {MAX_MESSAGE_SIZE} byte limit")
+    return json.loads(await reader.readexactly(length))
+
+
+def parse_address(address):
+    """'host:port' -> (host, port)"""
+    host, sep, port = address.rpartition(':')
+    if not sep or not port.isdigit():
+        raise ValueError(f"Invalid address '{address}', expected host:port")
+    return host or "127.0.0.1", int(port)
+
+
+# ---------------------------------------------------------------- worker
+
+class Worker:
+    """
+    Serves script executions to coordinators.
+
+    Args:
+        executor_func: Coroutine function with the signature of
+                       foo.dynamic_import_and_run_async; called with
+                       verify_hash=True and the hash registered in the
+                       worker's own hash store
+        slots (int): Executions run at the same time (announced to coordinators);
+                     further jobs, e.g. from a second coordinator, wait for a slot
+    """
+    def __init__(self, executor_func, slots=4):
+        self.executor_func = executor_func
+        self.slots = slots
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._slots = None  # asyncio.Semaphore shared by every connection, created on the serving loop
+
+    async def registered_hash(self, script_name, sent_hash):
+        """
+        Look up the hash a job's script is verified against in this worker's
+        own hash store; the coordinator's hash is compared, never trusted.
+
+        Returns:
+            str: The registered hash, or None if the job must not run (the reason is printed)
+        """
+        if not directory_hash.is_script_name(script_name):
+            print(f"Error: Invalid script name {script_name!r}, refusing to run it")
+            return None
+        try:
+            registered = await asyncio.to_thread(hash_store.get_hash_store().fetch_hash, script_name)
+        except Exception as e:
+            print(f"Error fetching the registered hash of '{script_name}': {e}")
+            return None
+        if registered is None:
+            print(f"Error: No registered hash for '{script_name}', refusing to run it")
+        elif sent_hash != registered:
+            print(f"Error: The coordinator's hash for '{script_name}' is not the registered one, refusing to run it")
+            return None
+        return registered
+
+    async def handle_connection(self, reader, writer):
+        jobs = {}  # job_id -> task
+        send_lock = asyncio.Lock()
+
+        async def send(message):
+            async with send_lock:
+                await send_message(writer, message)
+
+        async def heartbeat():
+            while True:
+                await asyncio.sleep(HEARTBEAT_INTERVAL)
+                try:
+                    await send({"type": "heartbeat", "running": list(jobs)})
+                except (OSError, RuntimeError):
+                    return  # Coordinator gone; the read loop ends the connection
+
+        async def run_job(message):
+            job_id = message["job_id"]
+            cancelled = False
+            result = 1
+            record = {}
+            try:
+                script_name = message.get("script")
+                expected_hash = await self.registered_hash(script_name, message.get("expected_hash"))
+                if expected_hash is not None:
+                    async with self._slots:
+                        with run_events.node_record() as record:
+                            result = await self.executor_func(
+                                script_name, message.get("args", []), True, expected_hash)
+            except asyncio.CancelledError:
+                cancelled = True
+                print(f"=== CANCELLED {message['script']} (job {job_id}) ===")
+            finally:
+                jobs.pop(job_id, None)
+            try:
+                await send({"type": "result", "job_id": job_id, "result": result, "cancelled": cancelled,
+                            "record": record})
+            except (OSError, RuntimeError):
+                pass  # Coordinator gone
+
+        await send({"type": "hello", "worker_id": self.worker_id, "slots": self.slots})
+        heartbeat_task = asyncio.create_task(heartbeat())
+        try:
+            while True:
+                message = await read_message(reader)
+                if message is None:
+                    break
+                if message["type"] == "run":
+                    jobs[message["job_id"]] = asyncio.create_task(run_job(message))
+                elif message["type"] == "cancel":
+                    task = jobs.get(message["job_id"])
+                    if task is not None:
+                        task.cancel()
+        except (ConnectionError, ValueError) as e:
+            print(f"Coordinator connection lost: {e}")
+        finally:
+            heartbeat_task.cancel()
+            # A coordinator that went away no longer wants its results
+            for task in list(jobs.values()):
+                task.cancel()
+            writer.close()
+
+    async def serve(self, host, port, ready=None):
+        self._slots = asyncio.Semaphore(self.slots)
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        address = server.sockets[0].getsockname()
+        print(f"Worker {self.worker_id} listening on {address[0]}:{address[1]} with {self.slots} slot(s)")
+        if ready is not None:
+            ready(address)
+        async with server:
+            await server.serve_forever()
+
+
+def worker_main(argv, executor_func):
+    parser = argparse.ArgumentParser(prog="foo.py --worker", description="Run scripts for a remote coordinator.")
+    parser.add_argument("address", help="host:port to listen on")
+    parser.add_argument("--slots", type=int, default=4, help="Scripts run at the same time")
+    parser.add_argument("--root", help="Directory holding the script folders (default: current directory)")
+    parser.add_argument("--profile", metavar="SCRIPTS", help="Profile the named scripts (A,C) or 'all'")
+    parser.add_argument("--profile-mode", choices=script_profile.MODES, default=script_profile.MODE_CPROFILE)
+    parser.add_argument("--capture-output", metavar="BYTES", nargs="?", type=int,
+                        const=script_output.ENABLED_CAP_BYTES,
+                        help="Capture script output (sent back with each result), keeping BYTES per stream")
+    args = parser.parse_args(argv)
+
+    if args.root:
+        os.chdir(args.root)
+    if args.profile:
+        script_profile.set_profiler(script_profile.ScriptProfiler(
+            script_profile.parse_selection(args.profile), args.profile_mode))
+    if args.capture_output is not None:
+        script_output.set_cap_bytes(args.capture_output)
+    host, port = parse_address(args.address)
+    try:
+        asyncio.run(Worker(executor_func, args.slots).serve(host, port))
+    except KeyboardInterrupt:
+        print("Worker stopped")
+    return 0
+
+
+# ----------------------------------------------------------- coordinator
+
+class _WorkerConnection:
+    def __init__(self, address, reader, writer, worker_id, slots):
+        self.address = address
+        self.reader = reader
+        self.writer = writer
+        self.worker_id = worker_id
+        self.slots = slots
+        self.running = {}  # job_id -> future
+        self.last_seen = asyncio.get_running_loop().time()
+        self.alive = True
+        self.send_lock = asyncio.Lock()
+
+
+class RemoteExecutor:
+    """
+    Async executor function sending script executions to workers.
+
+    Use as the executor_func of Node.evaluate_async:
+
+        async with RemoteExecutor(addresses, script_hashes) as remote:
+            await tree.evaluate_async(remote.run)
+
+    Jobs go to the connected worker with the most free slots and wait when
+    every slot is busy.
+    """
+    def __init__(self, addresses, script_hashes):
+        self.addresses = addresses
+        self.script_hashes = script_hashes or {}
+        self.workers = []
+        self._job_ids = itertools.count(1)
+        self._slot_freed = None
+        self._tasks = []
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def connect(self):
+        self._slot_freed = asyncio.Condition()
+        for address in self.addresses:
+            host, port = parse_address(address)
+            try:
+                reader, writer = await asyncio.open_connection(host, port)
+                hello = await asyncio.wait_for(read_message(reader), HEARTBEAT_TIMEOUT)
+            except (OSError, asyncio.TimeoutError, ValueError) as e:
+                print(f"Warning: Worker {address} unavailable: {e}")
+                continue
+            if not hello or hello.get("type") != "hello":
+                print(f"Warning: Worker {address} did not introduce itself, skipped")
+                writer.close()
+                continue
+            worker = _WorkerConnection(address, reader, writer, hello["worker_id"], hello["slots"])
+            self.workers.append(worker)
+            self._tasks.append(asyncio.create_task(self._read_loop(worker)))
+            print(f"Connected to worker {worker.worker_id} at {address} ({worker.slots} slot(s))")
+        if not self.workers:
+            raise ConnectionError("No worker available")
+        self._tasks.append(asyncio.create_task(self._watch_heartbeats()))
+
+    async def _read_loop(self, worker):
+        try:
+            while True:
+                message = await read_message(worker.reader)
+                if message is None:
+                    break
+                worker.last_seen = asyncio.get_running_loop().time()
+                if message["type"] == "result":
+                    future = worker.running.get(message["job_id"])
+                    if future is not None and not future.done():
+                        future.set_result(message)
+        except (ConnectionError, ValueError) as e:
+            print(f"Worker {worker.address} connection error: {e}")
+        await self._lose(worker, "connection closed")
+
+    async def _watch_heartbeats(self):
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            now = asyncio.get_running_loop().time()
+            for worker in self.workers:
+                if worker.alive and now - worker.last_seen > HEARTBEAT_TIMEOUT:
+                    await self._lose(worker, f"no heartbeat for {now - worker.last_seen:.1f}s")
+
+    async def _lose(self, worker, reason):
+        if not worker.alive:
+            return
+        worker.alive = False
+        print(f"Warning: Lost worker {worker.address} ({reason})")
+        worker.writer.close()
+        # Whether lost jobs ran (and had side effects) is unknown: report them as failed
+        for future in worker.running.values():
+            if not future.done():
+                future.set_result({"result": 1, "lost": True})
+        async with self._slot_freed:
+            self._slot_freed.notify_all()
+
+    def _pick_worker(self):
+        candidates = [w for w in self.workers if w.alive and len(w.running) < w.slots]
+        if not candidates:
+            return None
+        return max(candidates, key=lambda w: w.slots - len(w.running))
+
+    async def run(self, script_name, args, verify_hash=False, expected_hash=None):
+        """
+        Run a script on a worker. The registered hash is always sent, since
+        the worker verifies the folder on its own disk.
+
+        Returns:
+            0 for success, 1 for failure
+        """
+        async with self._slot_freed:
+            while True:
+                if not any(w.alive for w in self.workers):
+                    print(f"Error: No worker left to run {script_name}")
+                    return 1
+                worker = self._pick_worker()
+                if worker is not None:
+                    break
+                await self._slot_freed.wait()
+            job_id = next(self._job_ids)
+            future = asyncio.get_running_loop().create_future()
+            worker.running[job_id] = future
+
+        print(f"=== DISPATCHED {script_name} to {worker.worker_id} (job {job_id}) ===")
+        try:
+            async with worker.send_lock:
+                await send_message(worker.writer, {
+                    "type": "run",
+                    "job_id": job_id,
+                    "script": script_name,
+                    "args": list(args),
+                    "expected_hash": expected_hash or self.script_hashes.get(script_name),
+                })
+            reply = await future
+        except asyncio.CancelledError:
+            # The outcome was decided without this job: stop it on the worker
+            if worker.alive:
+                try:
+                    async with worker.send_lock:
+                        await send_message(worker.writer, {"type": "cancel", "job_id": job_id})
+                except OSError:
+                    pass
+            raise
+        except OSError as e:
+            await self._lose(worker, str(e))
+            reply = {"result": 1, "lost": True}
+        finally:
+            worker.running.pop(job_id, None)
+            async with self._slot_freed:
+                self._slot_freed.notify_all()
+
+        if reply.get("lost"):
+            print(f"=== FAILED {script_name} (worker {worker.address} lost) ===")
+        # Captured output and metrics of the execution, as recorded by the worker
+        run_events.annotate(worker=worker.worker_id, **reply.get("record", {}))
+        return reply["result"]
+
+    async def close(self):
+        """Cancel outstanding jobs and disconnect from every worker."""
+        for worker in self.workers:
+            for job_id, future in list(worker.running.items()):
+                if worker.alive and not future.done():
+                    try:
+                        async with worker.send_lock:
+                            await send_message(worker.writer, {"type": "cancel", "job_id": job_id})
+                    except OSError:
+                        pass
+            worker.alive = False
+            worker.writer.close()
+        for task in self._tasks:
+            task.cancel()
@@ -0,0 +1,92 @@
+"""
+Machine-readable stream of run events, one JSON object per line.
+
+    python foo.py <log_id> "<expression>" --events fd:3 3>events.jsonl
+    python foo.py <log_id> "<expression>" --events /var/log/foo/events.jsonl
+
+Every line has "event", "log_id" and "time" (epoch seconds) plus the
+event's fields, and is flushed as soon as it is written so monitoring can
+follow a run live:
+
+    parse_done      expression, valid, scripts
+    verification    script, status (passed|failed|no_hash|missing_folder),
+                    tier, expected, actual
+    node_start      node_path, script, args, start_time
+    node_end        node_path, script, args, result, start_time, end_time,
+                    details (captured output, metrics...)
+    short_circuit   node_path, operator, decided_by, skipped (node paths)
+    run_end         result (final exit code)
+
+A path is appended to, so several runs can share one file.
+"""
+import json
+import os
+import threading
+import time
+
+import run_events
+
+
+def open_target(target):
+    """
+    Open an event stream target: "fd:<n>" for an inherited file descriptor,
+    anything else is a file path.
+
+    Raises:
+        ValueError: For an invalid descriptor number
+        OSError: If the descriptor or file cannot be opened
+    """
+    if target.startswith("fd:"):
+        fd = target[3:]
+        if not fd.isdigit():
+            raise ValueError(f"Invalid event stream '{target}', expected fd:<number> or a path")
+        return os.fdopen(int(fd), 'w', encoding='utf-8', buffering=1)
+    return open(target, 'a', encoding='utf-8', buffering=1)
+
+
+class EventStream:
+    """
+    Run event listener writing each event as a JSON line.
+
+    Args:
+        stream: Text file the lines are written to
+        log_id (str): Run identifier added to every line
+    """
+    def __init__(self, stream, log_id):
+        self.stream = stream
+        self.log_id = log_id
+        self._lock = threading.Lock()
+        self._broken = False
+
+    def on_event(self, event_type, payload):
+        line = json.dumps({"event": event_type, "log_id": self.log_id, "time": time.time(), **payload},
+                          default=str)
+        with self._lock:
+            if self._broken:
+                return
+            try:
+                self.stream.write(line + "\n")
+                self.stream.flush()
+            except (OSError, ValueError) as e:
+                # The consumer went away; the run itself goes on
+                self._broken = True
+                print(f"Warning: Event stream closed ({e}), no further events are written")
+
+    def close(self):
+        with self._lock:
+            try:
+                self.stream.close()
+            except OSError:
+                pass
+
+
+def start_event_stream(target, log_id):
+    """
+    Write every run event of this process to target ("fd:<n>" or a path).
+
+    Returns:
+        EventStream: The registered listener
+    """
+    event_stream = EventStream(open_target(target), log_id)
+    run_events.add_listener(event_stream.on_event)
+    return event_stream
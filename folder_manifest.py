@@ -0,0 +1,300 @@
+"""
+Signed per-folder manifests.
+
+A manifest lists every directory and hashed file of a script folder (path,
+size and MD5) plus the root digest, which is the folder's directory hash,
+so the value registered in the hash store is unchanged. The manifest is
+signed with HMAC-SHA256 using the key from HASH_MANIFEST_KEY (or the file
+named by HASH_MANIFEST_KEY_FILE); a correctly signed manifest can be
+trusted without the database.
+
+The manifest is written to <folder>/.hashmanifest, which is never part of
+the folder hash. Checking a folder against it walks the folder in hashing
+order and stops at the first difference, comparing names and sizes before
+reading any content.
+"""
+import hashlib
+import hmac
+import json
+import os
+import sys
+import tempfile
+
+import directory_hash
+
+MANIFEST_FILE = directory_hash.MANIFEST_FILE
+MANIFEST_VERSION = 1
+READ_CHUNK_SIZE = 1 << 20
+
+ENV_KEY = "HASH_MANIFEST_KEY"
+ENV_KEY_FILE = "HASH_MANIFEST_KEY_FILE"
+
+
+def load_key():
+    """Return the manifest signing key as bytes, or None if none is configured."""
+    key_file = os.environ.get(ENV_KEY_FILE)
+    if key_file:
+        with open(key_file, 'rb') as f:
+            return f.read().strip()
+    key = os.environ.get(ENV_KEY)
+    return key.encode('utf-8') if key else None
+
+
+def _canonical(manifest):
+    body = {k: v for k, v in manifest.items() if k != "signature"}
+    return json.dumps(body, sort_keys=True, separators=(",", ":")).encode('utf-8')
+
+
+def sign(manifest, key):
+    """HMAC-SHA256 of the manifest body (everything but the signature)."""
+    return hmac.new(key, _canonical(manifest), hashlib.sha256).hexdigest()
+
+
+def root_digest(entries):
+    """The directory hash described by manifest entries (see directory_hash.combine_entries)."""
+    directory_entries = []
+    for entry in entries:
+        rel_path = entry["path"].replace('/', os.sep)
+        if "md5" in entry:
+            directory_entries.append(f"FILE:{rel_path}:{entry['md5']}")
+        else:
+            directory_entries.append(f"DIR:{rel_path}")
+    return directory_hash.combine_entries(directory_entries)
+
+
+def _file_md5(file_path):
+    digest = hashlib.md5()
+    with open(file_path, 'rb') as f:
+        while True:
+            chunk = f.read(READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def build_manifest(directory_path, exclude_dirs=None, key=None):
+    """
+    Describe a folder as a manifest dictionary.
+
+    Returns:
+        dict: 'version', 'script', 'root_digest', 'entries' and, when a key is
+              given, 'signature'; entries are {'path'} for directories and
+              {'path', 'size', 'md5'} for files, '/'-separated, in walk order
+    """
+    entries = []
+    for root, rel_dir_path, files in directory_hash.walk_directory(directory_path, exclude_dirs):
+        rel_prefix = '' if rel_dir_path == '.' else rel_dir_path.replace(os.sep, '/') + '/'
+        if rel_prefix:
+            entries.append({"path": rel_prefix.rstrip('/')})
+        for filename in files:
+            file_path = os.path.join(root, filename)
+            # Same rule as calculate_directory_hash: unreadable files are not hashed
+            if not os.access(file_path, os.R_OK):
+                continue
+            try:
+                size = os.path.getsize(file_path)
+                md5 = _file_md5(file_path)
+            except OSError:
+                continue
+            entries.append({"path": rel_prefix + filename, "size": size, "md5": md5})
+
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "script": os.path.basename(os.path.normpath(directory_path)),
+        "root_digest": root_digest(entries),
+        "entries": entries,
+    }
+    if key is not None:
+        manifest["signature"] = sign(manifest, key)
+    return manifest
+
+
+def write_manifest(directory_path, exclude_dirs=None, key=None):
+    """
+    Build the manifest of a folder and write it atomically to <folder>/.hashmanifest.
+
+    Returns:
+        dict: The manifest written
+    """
+    if key is None:
+        key = load_key()
+    manifest = build_manifest(directory_path, exclude_dirs, key)
+    # Named so walk_directory skips it: neither a concurrent hash nor a leftover sees it
+    fd, temp_path = tempfile.mkstemp(dir=directory_path, prefix=directory_hash.MANIFEST_TEMP_PREFIX,
+                                     suffix=directory_hash.MANIFEST_TEMP_SUFFIX)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(temp_path, os.path.join(directory_path, MANIFEST_FILE))
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return manifest
+
+
+def read_manifest(directory_path, expected_hash=None, key=None):
+    """
+    Load and authenticate the manifest of a folder.
+
+    A signed manifest is accepted when its signature is valid; an unsigned
+    one only when its root digest equals expected_hash. In both cases the
+    root digest must match the listed entries.
+
+    Returns:
+        tuple: (manifest, error); manifest is None and error explains why
+               when there is no usable manifest
+    """
+    path = os.path.join(directory_path, MANIFEST_FILE)
+    try:
+        with open(path, 'r') as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None, "no manifest"
+    except (OSError, ValueError) as e:
+        return None, f"unreadable manifest: {e}"
+
+    if key is None:
+        key = load_key()
+    signature = manifest.get("signature")
+    if signature is not None:
+        if key is None:
+            if expected_hash is None:
+                return None, "manifest is signed but no key is configured"
+        elif not hmac.compare_digest(signature, sign(manifest, key)):
+            return None, "manifest signature is invalid"
+    elif expected_hash is None:
+        return None, "manifest is not signed"
+
+    if root_digest(manifest.get("entries", [])) != manifest.get("root_digest"):
+        return None, "manifest entries do not match its root digest"
+    if expected_hash is not None and manifest["root_digest"] != expected_hash:
+        return None, (f"manifest root digest {manifest['root_digest']} "
+                      f"is not the expected hash {expected_hash}")
+    return manifest, None
+
+
+def diff_against_manifest(directory_path, manifest, exclude_dirs=None, stop_at_first=True):
+    """
+    Compare a folder with its manifest.
+
+    Every directory is checked for added and missing names, then for file
+    sizes, before any file content is read; file contents are then hashed in
+    order. With stop_at_first, the walk ends at the first difference.
+
+    Returns:
+        list: Differences as (kind, path, detail) with kind one of 'added',
+              'missing' or 'changed'; empty if the folder matches
+    """
+    expected_dirs = {}  # rel dir -> {file name: entry}
+    expected_subdirs = set()
+    for entry in manifest["entries"]:
+        parent, _, name = entry["path"].rpartition('/')
+        if "md5" in entry:
+            expected_dirs.setdefault(parent, {})[name] = entry
+        else:
+            expected_subdirs.add(entry["path"])
+            expected_dirs.setdefault(entry["path"], {})
+    expected_dirs.setdefault('', {})
+
+    differences = []
+    seen_dirs = set()
+    for root, rel_dir_path, files in directory_hash.walk_directory(directory_path, exclude_dirs):
+        rel_dir = '' if rel_dir_path == '.' else rel_dir_path.replace(os.sep, '/')
+        prefix = rel_dir + '/' if rel_dir else ''
+        seen_dirs.add(rel_dir)
+        if rel_dir not in expected_dirs:
+            differences.append(("added", rel_dir, "directory"))
+            if stop_at_first:
+                return differences
+            continue
+        expected = expected_dirs[rel_dir]
+        files = [f for f in files if os.access(os.path.join(root, f), os.R_OK)]
+
+        # Cheap checks first: names, then sizes
+        for name in sorted(set(files) - set(expected)):
+            differences.append(("added", prefix + name, "file"))
+        for name in sorted(set(expected) - set(files)):
+            differences.append(("missing", prefix + name, "file"))
+        if differences and stop_at_first:
+            return differences[:1]
+        to_hash = []
+        for name in files:
+            if name not in expected:
+                continue
+            size = os.path.getsize(os.path.join(root, name))
+            if size != expected[name]["size"]:
+                differences.append(("changed", prefix + name, f"size {expected[name]['size']} -> {size}"))
+                if stop_at_first:
+                    return differences
+            else:
+                to_hash.append(name)
+
+        for name in to_hash:
+            md5 = _file_md5(os.path.join(root, name))
+            if md5 != expected[name]["md5"]:
+                differences.append(("changed", prefix + name, f"md5 {expected[name]['md5']} -> {md5}"))
+                if stop_at_first:
+                    return differences
+
+    for rel_dir in sorted(expected_subdirs - seen_dirs):
+        differences.append(("missing", rel_dir, "directory"))
+        if stop_at_first:
+            break
+    return differences
+
+
+def verify_with_manifest(directory_path, expected_hash=None, exclude_dirs=None, stop_at_first=True):
+    """
+    Verify a folder against its manifest.
+
+    Returns:
+        tuple: (ok, differences, error); error is set (and ok None) when the
+               manifest cannot be used, so the caller can fall back to hashing
+    """
+    manifest, error = read_manifest(directory_path, expected_hash)
+    if manifest is None:
+        return None, [], error
+    differences = diff_against_manifest(directory_path, manifest, exclude_dirs, stop_at_first)
+    return not differences, differences, None
+
+
+def print_differences(differences):
+    for kind, path, detail in differences:
+        print(f"  {kind:<8} {path} ({detail})")
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Write or check signed script folder manifests.")
+    parser.add_argument("command", choices=["write", "verify", "diff"])
+    parser.add_argument("folders", nargs="+", help="Script folders")
+    parser.add_argument("--expected", help="Expected root digest (e.g. from the hash store)")
+    args = parser.parse_args(argv)
+
+    exclude_dirs = ['__pycache__', '.git', '.vscode']
+    status = 0
+    for folder in args.folders:
+        if args.command == "write":
+            manifest = write_manifest(folder, exclude_dirs)
+            signed = "signed" if "signature" in manifest else "UNSIGNED (no key configured)"
+            print(f"{folder}: {len(manifest['entries'])} entries, root digest "
+                  f"{manifest['root_digest']}, {signed}")
+            continue
+        ok, differences, error = verify_with_manifest(
+            folder, args.expected, exclude_dirs, stop_at_first=args.command == "verify")
+        if error is not None:
+            print(f"{folder}: cannot verify, {error}")
+            status = 1
+        elif ok:
+            print(f"{folder}: matches its manifest")
+        else:
+            print(f"{folder}: differs from its manifest")
+            print_differences(differences)
+            status = 1
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,464 +1,150 @@
+import argparse
+import asyncio
+import contextvars
+import functools
 import importlib.util
+import inspect
 import os
 import sys
 import re
-import pyodbc
+import time
+from concurrent.futures import ThreadPoolExecutor
+import compact_tree
 import directory_hash  # Import the directory hash module
+import distributed
+import event_stream
+import folder_manifest
+import hash_store
+import hash_watch
+import planner
+import run_analytics
+import run_events
+import run_history
+import scheduler
+import script_bundle
+import script_config
+import script_loader
+import script_metrics
+import script_output
+import script_profile
+import speculation
+import verify_policy
+# The expression tree: node classes and parser, shared with compact_tree
+from logical_expression import (
+    Node, ScriptNode, LogicalOperatorNode, NotNode, AndNode, OrNode,
+    validate_expression_format, parse_logical_expression, assign_node_paths,
+    normalize_expression, parse_expression, parse_script_node, parse_operator_children,
+)
 
-# Node classes for expression tree
-class Node:
-    """Base class for all syntax tree nodes"""
-    def __init__(self):
-        self.result = None
-    
-    def evaluate(self, executor_func, verify_hash=False, script_hashes=None):
-        """To be implemented by subclasses"""
-        raise NotImplementedError
-
-class ScriptNode(Node):
-    """Node representing a script execution"""
-    def __init__(self, name, args=None):
-        super().__init__()
-        self.name = name
-        self.args = args or []
-    
-    def evaluate(self, executor_func, verify_hash=False, script_hashes=None):
-        """Execute the script and return result"""
-        expected_hash = script_hashes.get(self.name) if verify_hash and script_hashes else None
-        self.result = executor_func(self.name, self.args, verify_hash, expected_hash)
-        
-        # In logical context, 0 (success) = True, 1 (failure) = False
-        logical_result = (self.result == 0)
-        
-        # Write the result code to stderr for individual script
-        sys.stderr.write(f"{self.result}\n")
-        
-        return logical_result
-    
-    def __str__(self):
-        if self.args:
-            return f"({self.name}:{','.join(self.args)})"
-        return f"({self.name})"
-
-class LogicalOperatorNode(Node):
-    """Node representing a logical operator with children"""
-    def __init__(self, operator, children=None):
-        super().__init__()
-        self.operator = operator
-        self.children = children or []
-    
-    def add_child(self, child):
-        self.children.append(child)
-    
-    def __str__(self):
-        children_str = ", ".join(str(child) for child in self.children)
-        return f"{self.operator} [ {children_str} ]"
-
-class NotNode(Node):
-    """Node representing a NOT operator"""
-    def __init__(self, child=None):
-        super().__init__()
-        self.child = child
-    
-    def evaluate(self, executor_func, verify_hash=False, script_hashes=None):
-        """Evaluate NOT node by inverting the result of its child"""
-        if self.child is None:
-            print("Warning: NOT operator with no child")
-            return False
-            
-        child_result = self.child.evaluate(executor_func, verify_hash, script_hashes)
-        result = not child_result
-        
-        print(f"NOT operator: inverting {child_result} to {result}")
-        self.result = result
-        return result
-    
-    def __str__(self):
-        return f"!{self.child}"
+# Expressions with at least this many scripts are parsed into a compact_tree.CompactTree
+COMPACT_TREE_LEAVES = int(os.environ.get("FOO_COMPACT_TREE_LEAVES", 10000))
 
-class AndNode(LogicalOperatorNode):
-    """Node representing an AND operator"""
-    def __init__(self, circuit_breaking=True, children=None):
-        super().__init__("&&" if circuit_breaking else "&", children)
-        self.circuit_breaking = circuit_breaking
-    
-    def evaluate(self, executor_func, verify_hash=False, script_hashes=None):
-        """Evaluate AND node with or without circuit breaking"""
-        result = True
-        
-        for child in self.children:
-            child_result = child.evaluate(executor_func, verify_hash, script_hashes)
-            
-            if not child_result:
-                result = False
-                # Circuit breaking: if any child is false, stop evaluation
-                if self.circuit_breaking:
-                    print(f"Circuit breaking AND: stopping at first FALSE result")
-                    break
-        
-        self.result = result
-        return result
-
-class OrNode(LogicalOperatorNode):
-    """Node representing an OR operator"""
-    def __init__(self, circuit_breaking=True, children=None):
-        super().__init__("||" if circuit_breaking else "|", children)
-        self.circuit_breaking = circuit_breaking
-    
-    def evaluate(self, executor_func, verify_hash=False, script_hashes=None):
-        """Evaluate OR node with or without circuit breaking"""
-        result = False
-        
-        for child in self.children:
-            child_result = child.evaluate(executor_func, verify_hash, script_hashes)
-            
-            if child_result:
-                result = True
-                # Circuit breaking: if any child is true, stop evaluation
-                if self.circuit_breaking:
-                    print(f"Circuit breaking OR: stopping at first TRUE result")
-                    break
-        
-        self.result = result
-        return result
-    
-def validate_expression_format(expression):
-    """Basic validation of expression format. Returns (True, None) if valid, 
-    or (False, error_message) if invalid."""
+def parse_expression_tree(expression, compact=None):
+    """
+    Parse an expression into Node objects, or into a compact_tree.CompactTree
+    (one set of arrays instead of an object per node, same node API through
+    views) when compact is True or, by default, when the expression has at
+    least COMPACT_TREE_LEAVES scripts.
     
-    # Check balanced brackets
-    if expression.count('[') != expression.count(']'):
-        open_count = expression.count('[')
-        close_count = expression.count(']')
-        if open_count > close_count:
-            return False, f"Unbalanced brackets: {open_count} opening '[' but only {close_count} closing ']'"
-        else:
-            return False, f"Unbalanced brackets: {close_count} closing ']' but only {open_count} opening '['"
-    
-    # Check balanced parentheses
-    if expression.count('(') != expression.count(')'):
-        open_count = expression.count('(')
-        close_count = expression.count(')')
-        if open_count > close_count:
-            return False, f"Unbalanced parentheses: {open_count} opening '(' but only {close_count} closing ')'"
-        else:
-            return False, f"Unbalanced parentheses: {close_count} closing ')' but only {open_count} opening '('"
-    
-    # Check for valid operators
-    valid_operators = ["&&", "||", "&", "|", "!"]
-    i = 0
-    while i < len(expression):
-        # Skip whitespace, brackets, parentheses, commas, colons, and alphanumeric characters
-        # '.', '-', '_', '/', '\' to the list of allowed characters for filenames
-        if (expression[i].isspace() or expression[i] in "[](),.:_-/\\" or 
-            expression[i].isalnum() or expression[i] == '_'):
-            i += 1
-            continue
-            
-        # Check for quotes (for arguments)
-        if expression[i] == '"':
-            i += 1
-            # Skip until matching quote, handling escaped quotes
-            while i < len(expression):
-                if i >= len(expression):
-                    return False, f"Unclosed quote starting at position {i-1}"
-                if expression[i] == '\\' and i+1 < len(expression):
-                    i += 2  # Skip escape and next char
-                elif expression[i] == '"':
-                    i += 1
-                    break
-                else:
-                    i += 1
-            continue
-            
-        # Check for valid operators
-        found_valid = False
-        for op in valid_operators:
-            if i+len(op) <= len(expression) and expression[i:i+len(op)] == op:
-                i += len(op)
-                found_valid = True
-                break
-                
-        if not found_valid:
-            return False, f"Invalid operator or character at position {i}: '{expression[i]}'"
-    
-    # Check for operators without brackets
-    for op in ["&&", "||", "&", "|"]:
-        i = 0
-        while i < len(expression):
-            i = expression.find(op, i)
-            if i == -1:
-                break
-                
-            # Skip if part of another operator
-            if op in ["&", "|"] and i+1 < len(expression) and expression[i+1] == expression[i]:
-                i += 1
-                continue
-            
-            # Find next non-whitespace character
-            j = i + len(op)
-            while j < len(expression) and expression[j].isspace():
-                j += 1
-                
-            if j >= len(expression) or expression[j] != '[':
-                return False, f"Operator '{op}' at position {i} must be followed by '['"
-                
-            i += len(op)
+    Returns:
+        The root node or view, or None if the expression is invalid
+    """
+    if compact is None:
+        compact = expression.count('(') >= COMPACT_TREE_LEAVES
+    if not compact:
+        return parse_logical_expression(expression)
     
-    return True, None
-
-# Parser functions
-def parse_logical_expression(expression):
-    """Parse a logical expression string into a syntax tree."""
-    # Validate basic expression format first
-    is_valid, error_msg = validate_expression_format(expression)
-    if not is_valid:
-        print(f"Error in expression format: {error_msg}")
-        
-        print("\nPlease use one of these formats and Valid operators:")
-        print("   &&                           - Circuit Breaking AND operator")
-        print("   ||                           - Circuit Breaking OR operator")
-        print("   |                            - OR operator")
-        print("   &                            - AND operator")
-        print("   !                            - NOT operator")
-        print("  (A)                           - Simple script")
-        print("  (A:arg1,arg2)                 - Script with arguments")
-        print("  && [ (A), (B) ]               - AND operator with children")
-        print("  || [ (A), (B) ]               - OR operator with children") 
-        print("  !(A)                          - NOT operator with script")
-        print("  || [ && [ (A), (E), (B) ], !(C) ]  - Complex expression")
-        print("  (A:\\\"x,y\\\")                   - Quoted argument (keeps x,y together as one argument)")
-        print("  (A:\\\"x,y\\\", arg2)             - x,y as arg1 and regular arg2")
-        print("  (A:\\\"\\\\\\\"x\\\\\\\"\")              - To include quotes as part of the argument 'x' ")
+    tree = compact_tree.parse_compact(expression)
+    if tree is None:
         return None
-    
-    # First normalize the spacing but preserve spaces between commas
-    expression = re.sub(r'\s*\[\s*', ' [ ', expression)
-    expression = re.sub(r'\s*\]\s*', ' ] ', expression)
-    expression = re.sub(r'\s*\(\s*', ' ( ', expression)
-    expression = re.sub(r'\s*\)\s*', ' ) ', expression)
-    expression = re.sub(r'\s*,\s*', ', ', expression)
-    expression = re.sub(r'\s+', ' ', expression).strip()
-    
-    # Print the normalized expression to help debug
-    # print(f"Normalized expression: {expression}")
-    
-    # Parse the expression
-    node, pos = parse_expression(expression, 0)
-    
-    # Make sure we consumed the entire expression
-    if pos < len(expression):
-        print(f"Warning: Expression parsing stopped at position {pos}/{len(expression)}. Remainder: '{expression[pos:]}'")
-    
-    return node
-
-def parse_expression(expr, pos):
-    """Recursive function to parse a logical expression."""
-    # Skip whitespace
-    while pos < len(expr) and expr[pos].isspace():
-        pos += 1
-    
-    if pos >= len(expr):
-        return None, pos
-    
-    # Check for NOT operator
-    if expr[pos] == "!":
-        node = NotNode()
-        pos += 1  # Skip the ! character
-        
-        # Skip whitespace after !
-        while pos < len(expr) and expr[pos].isspace():
-            pos += 1
-            
-        # Parse the child expression
-        if pos < len(expr):
-            child, pos = parse_expression(expr, pos)
-            if child:
-                node.child = child
-            else:
-                print("Warning: Missing expression after NOT operator")
-        else:
-            print("Warning: Missing expression after NOT operator")
-            
-        return node, pos
-    # Check for operator type
-    elif expr[pos:pos+2] == "&&":
-        # Circuit-breaking AND
-        node = AndNode(circuit_breaking=True)
-        pos = parse_operator_children(expr, pos+2, node)
-        return node, pos
-    elif expr[pos:pos+2] == "||":
-        # Circuit-breaking OR
-        node = OrNode(circuit_breaking=True)
-        pos = parse_operator_children(expr, pos+2, node)
-        return node, pos
-    elif expr[pos] == "&" and (pos+1 >= len(expr) or expr[pos+1] != "&"):
-        # Normal AND
-        node = AndNode(circuit_breaking=False)
-        pos = parse_operator_children(expr, pos+1, node)
-        return node, pos
-    elif expr[pos] == "|" and (pos+1 >= len(expr) or expr[pos+1] != "|"):
-        # Normal OR
-        node = OrNode(circuit_breaking=False)
-        pos = parse_operator_children(expr, pos+1, node)
-        return node, pos
-    elif expr[pos] == "(":
-        # Script node with parentheses
-        return parse_script_node(expr, pos)
-    else:
-        print(f"Warning: Unexpected character at position {pos}: '{expr[pos]}'")
-        # Try to recover by looking for the next recognizable token
-        while pos < len(expr) and expr[pos] not in "()[],&|":
-            pos += 1
-        return None, pos
-
-def parse_script_node(expr, pos):
-    """Parse a script node with exact format (Name) or (Name:arg1,arg2)."""
-    # Skip the opening parenthesis
-    pos += 1
-    
-    # Find the end of the script part (either at : or ))
-    colon_pos = expr.find(':', pos)
-    close_pos = expr.find(')', pos)
-    
-    if colon_pos != -1 and colon_pos < close_pos:
-        # Has arguments
-        script_name = expr[pos:colon_pos].strip()
-        args_str = expr[colon_pos+1:close_pos].strip()
-        
-        # Parse arguments with proper handling of quotes
-        args = []
-        if args_str:
-            i = 0
-            current_arg = []
-            in_quotes = False
-            
-            while i < len(args_str):
-                char = args_str[i]
-                
-                # Handle escaped characters
-                if char == '\\' and i + 1 < len(args_str):
-                    current_arg.append(args_str[i+1])
-                    i += 2
-                    continue
-                
-                # Handle quotes
-                elif char == '"':
-                    in_quotes = not in_quotes
-                    current_arg.append(char)  # Keep quotes in the argument for now
-                    i += 1
-                    continue
-                
-                # Handle commas outside quotes
-                elif char == ',' and not in_quotes:
-                    arg_str = ''.join(current_arg).strip()
-                    # Strip surrounding quotes if present
-                    if arg_str.startswith('"') and arg_str.endswith('"') and len(arg_str) >= 2:
-                        arg_str = arg_str[1:-1]  # Remove surrounding quotes
-                    args.append(arg_str)
-                    current_arg = []
-                    i += 1
-                    continue
-                
-                # Regular character
-                else:
-                    current_arg.append(char)
-                    i += 1
-            
-            # Add the last argument
-            if current_arg:
-                arg_str = ''.join(current_arg).strip()
-                # Strip surrounding quotes if present
-                if arg_str.startswith('"') and arg_str.endswith('"') and len(arg_str) >= 2:
-                    arg_str = arg_str[1:-1]  # Remove surrounding quotes
-                args.append(arg_str)
-        
-        pos = close_pos + 1
-    else:
-        # No arguments
-        script_name = expr[pos:close_pos].strip()
-        args = []
-        pos = close_pos + 1
-        
-    return ScriptNode(script_name, args), pos
-
-def parse_operator_children(expr, pos, node):
-    """Parse children of a logical operator."""
-    # Skip whitespace
-    while pos < len(expr) and expr[pos].isspace():
-        pos += 1
-    
-    # Check for opening bracket
-    if pos < len(expr) and expr[pos] == "[":
-        pos += 1  # Skip opening bracket
-        
-        # Parse children until closing bracket
-        while pos < len(expr) and expr[pos] != "]":
-            # Skip whitespace and commas
-            while pos < len(expr) and (expr[pos].isspace() or expr[pos] == ","):
-                pos += 1
-            
-            # Check if we're at the end of children
-            if pos < len(expr) and expr[pos] != "]":
-                child, pos = parse_expression(expr, pos)
-                if child:
-                    node.add_child(child)
-            else:
-                break
-        
-        # Skip closing bracket
-        if pos < len(expr) and expr[pos] == "]":
-            pos += 1
-        else:
-            print(f"Warning: Missing closing bracket for operator '{node.operator}'")
-    else:
-        print(f"Warning: Missing opening bracket for operator '{node.operator}'")
-    
-    return pos
+    print(f"Using the compact expression tree ({tree.leaf_count()} scripts, {len(tree)} nodes)")
+    return tree.root
 
 def collect_script_names_from_tree(node):
-    """Recursively collect all script names from an expression tree."""
-    if isinstance(node, ScriptNode):
+    """Recursively collect all script names from an expression tree (nodes or compact_tree views)."""
+    if getattr(node, 'tree', None) is not None and node.index == 0:
+        # Root of a compact_tree.CompactTree: the names are interned there
+        return node.tree.script_names()
+    if hasattr(node, 'name'):
         return [node.name]
-    elif isinstance(node, NotNode):
+    elif hasattr(node, 'child'):
         return collect_script_names_from_tree(node.child) if node.child else []
-    elif isinstance(node, LogicalOperatorNode):
+    elif hasattr(node, 'children'):
         names = []
         for child in node.children:
             names.extend(collect_script_names_from_tree(child))
         return names
     return []
 
-def get_script_hashes_from_db():
-    """Fetch script hashes from the database."""
-    script_hashes = {}
+def apply_resume(expression_tree, previous_rows, previous_hashes, verified_hashes):
+    """
+    Mark the script nodes whose success in a previous run is still valid.
+
+    A node is skipped on resume only if the previous run recorded it at the same
+    path with the same script and arguments, it succeeded, and its folder hash
+    then is the folder hash verified now. Everything else is re-executed, so
+    evaluation effectively restarts at the first failed or unexecuted node and
+    the final result matches a full rerun.
+
+    Args:
+        expression_tree: Root node of the parsed expression
+        previous_rows (list): Node rows of the previous run (see run_history.fetch_run)
+        previous_hashes (dict): Folder hashes verified by the previous run
+        verified_hashes (dict): Folder hashes verified by this run
+
+    Returns:
+        int: Number of script nodes that will be skipped
+    """
+    previous_by_path = {row["node_path"]: row for row in previous_rows}
+    skipped = 0
+    
+    stack = [expression_tree]
+    while stack:
+        node = stack.pop()
+        # Duck-typed, so compact_tree views are handled like nodes
+        if hasattr(node, 'name'):
+            row = previous_by_path.get(node.path)
+            if (row is not None and row["result"] == 0 and row["script_name"] == node.name
+                    and row["args"] == list(node.args)
+                    and previous_hashes.get(node.name) is not None
+                    and previous_hashes.get(node.name) == verified_hashes.get(node.name)):
+                node.cached_result = 0
+                skipped += 1
+        elif hasattr(node, 'child'):
+            if node.child is not None:
+                stack.append(node.child)
+        elif hasattr(node, 'children'):
+            stack.extend(node.children)
+    
+    return skipped
+
+def fetch_script_hashes():
+    """Fetch script hashes from the shared hash store, raising on errors."""
+    # The shared store reuses pooled connections; the backend (SQL Server
+    # or local SQLite) is chosen by HASH_STORE_* config or environment
+    return hash_store.get_hash_store().fetch_hashes()
+
+def get_script_hashes_from_db(fetch_future=None):
+    """
+    Fetch script hashes from the database.
     
+    Args:
+        fetch_future: Optional Future already running fetch_script_hashes() in
+                      the background; its result is awaited instead of querying again
+    """
+    script_hashes = {}
+
     try:
-        # Connection string for Windows Authentication
-        connection_string = (
-            "DRIVER={SQL Server};"
-            "SERVER=MTLSQLCS051;"
-            "DATABASE=CSIPED_PRD;"
-            "TRUSTED_CONNECTION=yes;"
-        )
+        if fetch_future is not None:
+            script_hashes = fetch_future.result()
+        else:
+            script_hashes = fetch_script_hashes()
+        store = hash_store.get_hash_store()
 
-        cnxn = pyodbc.connect(connection_string)
-        cursor = cnxn.cursor()
-        
-        # Query the database for all script hashes
-        query = "SELECT script_name, hash_value FROM INTERN.Aman_hashing"
-        cursor.execute(query)
-        
-        # Store each script hash in the dictionary
-        for row in cursor.fetchall():
-            script_name = row[0]
-            hash_value = row[1]
-            script_hashes[script_name] = hash_value
-            
-        cursor.close()
-        cnxn.close()
-        
         print(f"Successfully loaded {len(script_hashes)} script hashes from database")
+        stats = store.stats()
+        print(f"Hash store ({stats['backend']}): {stats['connections_created']} connection(s) created, "
+              f"{stats['connections_reused']} reused")
         
     except Exception as e:
         print(f"Error fetching script hashes from database: {e}")
@@ -466,19 +152,173 @@ def get_script_hashes_from_db():
     
     return script_hashes
 
-def dynamic_import_and_run(script_name, args, verify_hash=False, expected_hash=None):
+# Verified bundles of this run: script name -> (bundle path, archive bytes)
+verified_bundles = {}
+
+def verify_bundles(script_names, script_hashes, bundle_dir):
     """
-    Import and run a script module.
+    Verify the bundle of each script and keep the verified bytes for loading.
+    
+    Each bundle is <bundle_dir>/<registered hash>.zip; it is read once and its
+    directory hash recomputed from the archive members in memory.
+    
+    Returns:
+        dict: Script name -> bundle hash (None if missing, unregistered or corrupt)
+    """
+    bundle_hashes = {}
+    for script_name in script_names:
+        expected_hash = script_hashes.get(script_name)
+        bundle_data = None
+        if expected_hash is not None:
+            bundle_data = script_bundle.read_verified_bundle(bundle_dir, script_name, expected_hash)
+        if bundle_data is None:
+            bundle_hashes[script_name] = None
+        else:
+            bundle_hashes[script_name] = expected_hash
+            verification_tiers[script_name] = "bundle"
+            verified_bundles[script_name] = (script_bundle.bundle_path(bundle_dir, expected_hash), bundle_data)
+    return bundle_hashes
+
+# Script sources kept from the hashing pass, so each file is read only once
+verified_sources = script_loader.VerifiedSourceCache()
+
+# Folder digests published by a running hash watcher (see hash_watch.py), if any
+watch_map = {}
+
+# How each script's folder hash was obtained in this run (see verify_policy)
+verification_tiers = {}
+
+def hash_script_folder(script_name):
+    """
+    Hash the folder of a script, or return None if it does not exist.
+    The bytes of <script_name>.py that were hashed are kept in verified_sources.
+    
+    When a live watch map has the folder, its digest is used without reading
+    the folder; only the MD5 of <script_name>.py is kept, and the file is
+    checked against it when loaded.
+    """
+    script_folder = os.path.join(os.getcwd(), script_name)
+    if not os.path.isdir(script_folder):
+        return None
+    
+    watched = watch_map.get(script_name)
+    if watched is not None and watched.get("script_md5"):
+        verified_sources.add_hash(script_name, watched["script_md5"])
+        verification_tiers[script_name] = "watch"
+        return watched["hash"]
+    
+    script_file = f"{script_name}.py"
+    def keep_script_source(rel_path, content, content_hash):
+        if rel_path == script_file:
+            verified_sources.add(script_name, content, content_hash)
+    
+    # Exclude __pycache__ directories by default
+    exclude_dirs = ['__pycache__', '.git', '.vscode']
+    hash_value, tier, file_hashes = verify_policy.get_verification_policy().folder_hash(
+        script_folder, exclude_dirs, on_file=keep_script_source)
+    verification_tiers[script_name] = tier
+    if tier == verify_policy.TIER_FAST and file_hashes.get(script_file):
+        # Nothing was read: the loader checks the script file against its recorded MD5
+        verified_sources.add_hash(script_name, file_hashes[script_file])
+    return hash_value
+
+def remote_hashes(script_names, script_hashes):
+    """Registered hashes of scripts run by remote workers, which verify their folders themselves."""
+    for script_name in script_names:
+        verification_tiers[script_name] = "worker"
+    return {name: script_hashes.get(name) for name in script_names}
+
+def fetch_hashes_and_parse(expression_string, pipelined=True, bundle_dir=None, remote=False, compact=None):
+    """
+    Fetch the registered hashes, parse the expression and hash the folders of its scripts.
+    
+    The DB round trip and the local disk hashing are independent. When pipelined,
+    the fetch runs in the background while the expression is parsed and the
+    folders are hashed concurrently; both are joined before returning.
+    
+    Args:
+        expression_string (str): Logical expression to parse
+        pipelined (bool): Overlap the DB fetch with parsing and hashing
+        bundle_dir (str): Verify scripts from bundles in this directory instead
+                          of loose folders (needs the DB hashes, so not overlapped)
+        remote (bool): Scripts run on workers that verify their own folders; the
+                       registered hashes are taken as the local ones
+        compact (bool): Parse into a compact tree (see parse_expression_tree)
+        
+    Returns:
+        tuple: (expression_tree, script_hashes, local_hashes); expression_tree is
+               None if the expression is invalid, local_hashes maps each script
+               name in the tree to its current folder hash
+    """
+    if not pipelined:
+        script_hashes = get_script_hashes_from_db()
+        expression_tree = parse_expression_tree(expression_string, compact)
+        if expression_tree is None:
+            return None, script_hashes, {}
+        script_names = dict.fromkeys(collect_script_names_from_tree(expression_tree))
+        if remote:
+            return expression_tree, script_hashes, remote_hashes(script_names, script_hashes)
+        if bundle_dir is not None:
+            return expression_tree, script_hashes, verify_bundles(script_names, script_hashes, bundle_dir)
+        local_hashes = {name: hash_script_folder(name) for name in script_names}
+        return expression_tree, script_hashes, local_hashes
+    
+    with ThreadPoolExecutor() as executor:
+        fetch_future = executor.submit(fetch_script_hashes)
+        
+        expression_tree = parse_expression_tree(expression_string, compact)
+        script_names = []
+        hash_futures = {}
+        if expression_tree is not None:
+            script_names = list(dict.fromkeys(collect_script_names_from_tree(expression_tree)))
+            if bundle_dir is None and not remote:
+                for name in script_names:
+                    hash_futures[name] = executor.submit(hash_script_folder, name)
+        
+        # Join point: both the DB hashes and the local digests are needed to compare
+        script_hashes = get_script_hashes_from_db(fetch_future)
+        if remote:
+            local_hashes = remote_hashes(script_names, script_hashes)
+        elif bundle_dir is not None:
+            local_hashes = verify_bundles(script_names, script_hashes, bundle_dir)
+        else:
+            local_hashes = {name: future.result() for name, future in hash_futures.items()}
+    
+    return expression_tree, script_hashes, local_hashes
+
+def load_script(script_name, verify_hash=False, expected_hash=None):
+    """
+    Locate, optionally verify, and load a script module.
+    
+    Scripts verified from a bundle (see verify_bundles) are loaded from the
+    verified archive bytes; otherwise <cwd>/<script_name>/<script_name>.py is used.
     
     Args:
         script_name: Name of the script (also the folder name)
-        args: List of arguments to pass to the script function
         verify_hash: Whether to verify the directory hash
         expected_hash: Expected hash value (if verifying)
         
     Returns:
-        0 for success, 1 for failure
+        The loaded module, or None on failure (the failure has been printed)
     """
+    # The name becomes a path below the cwd: refuse anything but a plain folder name
+    if not directory_hash.is_script_name(script_name):
+        result = 1  # Failure
+        print(f"Error: Invalid script name {script_name!r}")
+        print(f"=== FAILED {script_name} ({result}) ===\n")
+        return None
+
+    # Bundle mode: run the script straight from its verified in-memory archive
+    if script_name in verified_bundles:
+        bundle_file, bundle_data = verified_bundles[script_name]
+        try:
+            return script_bundle.load_script_module(script_name, bundle_data, bundle_file)
+        except Exception as e:
+            result = 1  # Failure
+            print(f"Error loading {script_name} from bundle {bundle_file}: {e}")
+            print(f"=== FAILED {script_name} ({result}) ===\n")
+            return None
+    
     # Get the absolute path to the script folder
     script_folder = os.path.join(os.getcwd(), script_name)
     script_path = os.path.join(script_folder, f"{script_name}.py")
@@ -488,32 +328,44 @@ def dynamic_import_and_run(script_name, args, verify_hash=False, expected_hash=N
         result = 1  # Failure
         print(f"Error: Script folder '{script_folder}' not found")
         print(f"=== FAILED {script_name} ({result}) ===\n")
-        return result
+        return None
     
     # If verification is enabled but no hash is provided, fail immediately
     if verify_hash and expected_hash is None:
         result = 1  # Failure
         print(f"Error: No hash available for verification of script '{script_name}'")
         print(f"=== FAILED {script_name} ({result}) ===\n")
-        return result
+        return None
     
     # Verify hash if requested and hash is available
     if verify_hash and expected_hash is not None:
         # Exclude __pycache__ directories by default
         exclude_dirs = ['__pycache__', '.git', '.vscode']
-        if not directory_hash.verify_directory_hash(script_folder, expected_hash, exclude_dirs, verbose=False):
+        if not directory_hash.verify_directory_hash(script_folder, expected_hash, exclude_dirs, verbose=False,
+                                                    policy=verify_policy.get_verification_policy(),
+                                                    use_manifest=True):
             result = 1  # Failure
             print(f"=== FAILED {script_name} ({result}) ===\n")
-            return result
+            return None
     
-    # Rest of the function remains unchanged
     # Check if the actual script file exists
     if not os.path.exists(script_path):
         result = 1  # Failure
         print(f"Error: Script {script_path} not found")
         print(f"=== FAILED {script_name} ({result}) ===\n")
-        return result
+        return None
         
+    # Run the exact bytes kept from hash verification when available
+    try:
+        module = verified_sources.load_module(script_name, script_path)
+    except Exception as e:
+        result = 1  # Failure
+        print(f"Error loading {script_name}: {e}")
+        print(f"=== FAILED {script_name} ({result}) ===\n")
+        return None
+    if module is not None:
+        return module
+    
     # Load the module
     spec = importlib.util.spec_from_file_location(script_name, script_path)
     module = importlib.util.module_from_spec(spec)
@@ -524,7 +376,26 @@ def dynamic_import_and_run(script_name, args, verify_hash=False, expected_hash=N
         result = 1  # Failure
         print(f"Error loading {script_name}: {e}")
         print(f"=== FAILED {script_name} ({result}) ===\n")
-        return result
+        return None
+    
+    return module
+
+def dynamic_import_and_run(script_name, args, verify_hash=False, expected_hash=None):
+    """
+    Import and run a script module.
+    
+    Args:
+        script_name: Name of the script (also the folder name)
+        args: List of arguments to pass to the script function
+        verify_hash: Whether to verify the directory hash
+        expected_hash: Expected hash value (if verifying)
+        
+    Returns:
+        0 for success, 1 for failure
+    """
+    module = load_script(script_name, verify_hash, expected_hash)
+    if module is None:
+        return 1  # Failure
 
     print(f"\n=== STARTING {script_name} ===")
     try:
@@ -534,13 +405,26 @@ def dynamic_import_and_run(script_name, args, verify_hash=False, expected_hash=N
             print(f"=== FAILED {script_name} (1) ===\n")
             return 1  # Return failure
         
-        func = getattr(module, script_name)
+        func = script_metrics.wrap(getattr(module, script_name))
+        profile_reports = []
+        profiler = script_profile.get_profiler()
+        if profiler is not None and profiler.wants(script_name):
+            func = profiler.wrap(script_name, func, profile_reports)
             
         # Print script arguments for debugging
         if args:
             print(f"Running with arguments: {args}")
             
-        func_return = func(*args)
+        try:
+            with script_output.capture(script_name):
+                func_return = func(*args)
+                if inspect.isawaitable(func_return):
+                    # Coroutine entry point called from synchronous code
+                    func_return = asyncio.run(_await(func_return))
+        finally:
+            # After the capture, so they stay out of the script's own output
+            for line in profile_reports:
+                print(line)
         # If we get here, the function completed without errors
         result = 0  # Success
         print(f"Function returned: {func_return}")
@@ -552,39 +436,319 @@ def dynamic_import_and_run(script_name, args, verify_hash=False, expected_hash=N
         print(f"=== FAILED {script_name} ({result}) ===\n")
         return result
 
-def main():
-    if len(sys.argv) < 3:
+async def _await(awaitable):
+    return await awaitable
+
+async def dynamic_import_and_run_async(script_name, args, verify_hash=False, expected_hash=None):
+    """
+    Import and run a script module without blocking the event loop.
+    
+    Coroutine <script_name> functions are awaited on the running loop; loading
+    and synchronous functions run in the loop's default executor.
+    
+    Args:
+        script_name: Name of the script (also the folder name)
+        args: List of arguments to pass to the script function
+        verify_hash: Whether to verify the directory hash
+        expected_hash: Expected hash value (if verifying)
+        
+    Returns:
+        0 for success, 1 for failure
+    """
+    loop = asyncio.get_running_loop()
+    module = await loop.run_in_executor(None, load_script, script_name, verify_hash, expected_hash)
+    if module is None:
+        return 1  # Failure
+
+    print(f"\n=== STARTING {script_name} ===")
+    try:
+        # Check if the function with the expected name exists
+        if not hasattr(module, script_name):
+            print(f"Error: Function '{script_name}()' not found in module")
+            print(f"=== FAILED {script_name} (1) ===\n")
+            return 1  # Return failure
+        
+        func = script_metrics.wrap(getattr(module, script_name))
+        profile_reports = []
+        profiler = script_profile.get_profiler()
+        if profiler is not None and profiler.wants(script_name):
+            func = profiler.wrap(script_name, func, profile_reports)
+            
+        # Print script arguments for debugging
+        if args:
+            print(f"Running with arguments: {args}")
+        
+        try:
+            with script_output.capture(script_name):
+                if inspect.iscoroutinefunction(func):
+                    func_return = await func(*args)
+                else:
+                    # The thread runs in a copy of this context, so its output reaches this capture
+                    context = contextvars.copy_context()
+                    func_return = await loop.run_in_executor(None, functools.partial(context.run, func, *args))
+                    if inspect.isawaitable(func_return):
+                        func_return = await func_return
+        finally:
+            # After the capture, so they stay out of the script's own output
+            for line in profile_reports:
+                print(line)
+        # If we get here, the function completed without errors
+        result = 0  # Success
+        print(f"Function returned: {func_return}")
+        print(f"=== FINISHED {script_name} ({result}) ===\n")
+        return result
+    except Exception as e:
+        result = 1  # Failure
+        print(f"Error running {script_name}: {e}")
+        print(f"=== FAILED {script_name} ({result}) ===\n")
+        return result
+
+def get_script_config(script_name):
+    """Sidecar config of a script (script.json), read from its verified bundle in bundle mode."""
+    if script_name in verified_bundles:
+        return script_config.load_script_config(script_name, bundle_data=verified_bundles[script_name][1])
+    return script_config.load_script_config(script_name)
+
+async def evaluate_trees_async(trees, executor_func=dynamic_import_and_run_async, verify_hash=False, script_hashes=None):
+    """
+    Evaluate independent expression trees concurrently on the running event loop
+    (batch or daemon use: many expressions share one loop and one executor).
+    
+    Returns:
+        list: The logical result of each tree, in order
+    """
+    return await asyncio.gather(
+        *(tree.evaluate_async(executor_func, verify_hash, script_hashes) for tree in trees))
+
+async def evaluate_remotely(expression_tree, addresses, script_hashes, resource_scheduler=None):
+    """
+    Evaluate a tree on this host while its scripts run on remote workers
+    (see distributed.py); outstanding jobs are cancelled when evaluation ends.
+    
+    Raises:
+        ConnectionError: If no worker can be reached
+    """
+    async with distributed.RemoteExecutor(addresses, script_hashes) as remote:
+        executor_func = remote.run
+        if resource_scheduler is not None:
+            executor_func = resource_scheduler.wrap(executor_func, get_script_config)
+        return await expression_tree.evaluate_async(executor_func, False, script_hashes)
+
+class _ArgumentParser(argparse.ArgumentParser):
+    """ArgumentParser that reports errors to the caller instead of exiting"""
+    def error(self, message):
+        raise ValueError(message)
+
+def parse_command_line(argv):
+    """
+    Parse the foo.py command line.
+
+    Returns:
+        argparse.Namespace: log_id, expression and options, or None if the
+                            command line is invalid (usage has been printed)
+    """
+    parser = _ArgumentParser(prog="foo.py", add_help=False)
+    parser.add_argument("log_id")
+    parser.add_argument("expression")
+    parser.add_argument("--resume", metavar="LOG_ID",
+                        help="Skip nodes that already succeeded in run LOG_ID of the same expression")
+    parser.add_argument("--bundles", metavar="DIR",
+                        help="Run scripts from verified <hash>.zip bundles in DIR instead of loose folders")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="Evaluate on an asyncio event loop; '&' and '|' children run concurrently")
+    parser.add_argument("--resources", metavar="POOLS",
+                        help="Resource pools for concurrent runs, e.g. slots=8,cpu=8,db=2 (implies --async)")
+    parser.add_argument("--workers", metavar="ADDRESSES",
+                        help="Run scripts on remote workers host:port[,host:port...] (implies --async)")
+    parser.add_argument("--watch-map", metavar="PATH",
+                        help="Use the folder digests kept up to date by 'directory_hash.py --watch'")
+    parser.add_argument("--compact-tree", action="store_const", const=True, default=None,
+                        help=f"Parse into the compact tree (default: from {COMPACT_TREE_LEAVES} scripts)")
+    parser.add_argument("--speculate", action="store_true",
+                        help="Start side-effect-free '&&'/'||' children early (implies --async)")
+    parser.add_argument("--events", metavar="TARGET",
+                        help="Stream run events as JSON lines to fd:<n> or a file path")
+    parser.add_argument("--profile", metavar="SCRIPTS",
+                        help="Profile the named scripts (A,C) or 'all' into aggregated pstats/flamegraph files")
+    parser.add_argument("--profile-mode", choices=script_profile.MODES, default=script_profile.MODE_CPROFILE,
+                        help="cprofile (deterministic) or sample (low overhead stack sampling)")
+    parser.add_argument("--capture-output", metavar="BYTES", nargs="?", type=int,
+                        const=script_output.ENABLED_CAP_BYTES,
+                        help="Print each script's output as one block, keeping BYTES per stream (see script_output.py)")
+    parser.add_argument("--resource-summary", action="store_true",
+                        help="Print the CPU, wall time, peak RSS and I/O of each execution after the run")
+    
+    try:
+        return parser.parse_args(argv)
+    except ValueError as e:
+        if len(argv) >= 2:
+            print(f"Error: {e}")
         print("Usage: python foo.py <log_id> \"|| [ && [ (A:hello,world), (B) ], && [ (C:test), (D), (E:2,4) ] ]\"")
         print("  NEW: The NOT operator is supported with ! symbol: \"! (A)\" or \"! && [ (A), (B) ]\"")
+        print("  Options:")
+        print("    --resume <log_id>             - Re-execute only the failed or unreached parts of a previous run")
+        print("    --bundles <dir>               - Run scripts from verified <hash>.zip bundles in <dir>")
+        print("    --async                       - Run '&' / '|' children concurrently on an asyncio event loop")
+        print("    --resources <pools>           - Limit concurrent scripts with pools, e.g. slots=8,cpu=8,db=2")
+        print("    --workers <host:port,...>     - Send script executions to 'foo.py --worker' processes")
+        print("    --watch-map <path>            - Use folder digests from a running 'directory_hash.py --watch'")
+        print(f"    --compact-tree                - Array-based expression tree (default from {COMPACT_TREE_LEAVES} scripts)")
+        print("    --speculate                   - Run side-effect-free '&&' / '||' children ahead (see speculation.py)")
+        print("    --events <fd:3|path>          - Stream JSON-lines run events (see event_stream.py)")
+        print("    --profile <A,C|all>           - Profile scripts into profiles/<script>.pstats and .collapsed")
+        print("    --profile-mode <cprofile|sample> - Deterministic (default) or sampling profiler")
+        print("    --capture-output [bytes]      - Capture script output into one block per script (default 64 KiB)")
+        print("    --resource-summary            - Print per-script CPU, wall time, peak RSS and I/O after the run")
+        print("  Worker mode: python foo.py --worker <host:port> [--slots N] [--root DIR]")
+        print("  Plan mode:   python foo.py --plan \"<expression>\" [--bundles DIR] [--watch-map PATH]")
+        return None
+
+def plan_main(argv):
+    """
+    foo.py --plan: parse the expression and resolve the hash status of every
+    script folder, then print cost and outcome estimates (see planner.py)
+    without executing anything.
+    
+    Returns:
+        int: 0 if the expression would pass pre-verification, 1 otherwise
+    """
+    parser = argparse.ArgumentParser(prog="foo.py --plan",
+                                     description="Estimate the cost and outcome of an expression without running it.")
+    parser.add_argument("expression")
+    parser.add_argument("--bundles", metavar="DIR", help="Plan a run from the bundles in DIR")
+    parser.add_argument("--watch-map", metavar="PATH", help="Use the folder digests of 'directory_hash.py --watch'")
+    parser.add_argument("--compact-tree", action="store_const", const=True, default=None,
+                        help="Parse into the compact tree (default: for large expressions)")
+    options = parser.parse_args(argv)
+    
+    if options.watch_map:
+        watch_map.update(hash_watch.load_watch_map(options.watch_map))
+    expression_tree, script_hashes, local_hashes = fetch_hashes_and_parse(
+        options.expression, bundle_dir=options.bundles, compact=options.compact_tree)
+    if expression_tree is None:
+        print("Invalid expression format. Please fix and try again.")
+        return 1
+    
+    statuses = {}
+    for script_name, actual_hash in local_hashes.items():
+        expected_hash = script_hashes.get(script_name)
+        if actual_hash is None and options.bundles is None:
+            statuses[script_name] = "missing folder"
+        elif expected_hash is None:
+            statuses[script_name] = "no hash"
+        elif actual_hash != expected_hash:
+            statuses[script_name] = "HASH MISMATCH"
+        else:
+            statuses[script_name] = f"verified, {verification_tiers.get(script_name, verify_policy.TIER_CONTENT)}"
+    
+    estimator = None
+    if run_analytics.available():
+        # Statistics of the columnar store: milliseconds even for millions of executions
+        column_store = run_analytics.ColumnStore()
+        if column_store.rows:
+            estimator = planner.HistoryEstimator(*column_store.estimates(local_hashes))
+            synced = time.strftime("%Y-%m-%d %H:%M", time.localtime(column_store.meta["synced_until"]))
+            print(f"Estimates from run analytics ({column_store.rows} executions, synced {synced})")
+    if estimator is None:
+        try:
+            history_store = run_history.RunHistoryStore(hash_store.get_hash_store())
+            executions = history_store.fetch_script_executions(local_hashes)
+        except Exception as e:
+            print(f"Warning: Run history unavailable, estimates use defaults: {e}")
+            executions = []
+        estimator = planner.HistoryEstimator.from_executions(executions)
+    plans = planner.plan_tree(expression_tree, estimator.estimate)
+    
+    print(f"\n=== PLAN: {expression_tree} ===")
+    planner.print_plan(expression_tree, plans, estimator.estimate, statuses)
+    planner.print_summary(expression_tree, plans)
+    
+    blocked = [name for name, status in statuses.items() if not status.startswith("verified")]
+    if blocked:
+        print(f"\nExecution would abort at pre-verification: {', '.join(blocked)}")
+        return 1
+    print("\nAll script hashes would verify; nothing was executed.")
+    return 0
+
+def main():
+    if sys.argv[1:2] == ["--worker"]:
+        sys.exit(distributed.worker_main(sys.argv[2:], dynamic_import_and_run_async))
+    if sys.argv[1:2] == ["--plan"]:
+        sys.exit(plan_main(sys.argv[2:]))
+    
+    options = parse_command_line(sys.argv[1:])
+    if options is None:
         sys.stderr.write("1\n")
         sys.exit(1)
         return
 
-    log_id = sys.argv[1]
-    expression_string = sys.argv[2]
-    
-    # Fetch script hashes from database
-    script_hashes = get_script_hashes_from_db()
+    log_id = options.log_id
+    expression_string = options.expression
 
     print(f"Log ID: {log_id}")
     
-    # Parse the expression string into a logical tree
-    expression_tree = parse_logical_expression(expression_string)
+    if options.events:
+        try:
+            event_stream.start_event_stream(options.events, log_id)
+        except (OSError, ValueError) as e:
+            print(f"Error: Cannot open event stream: {e}")
+            sys.stderr.write("1\n")
+            sys.exit(1)
+    
+    try:
+        pools = scheduler.parse_pools(options.resources) if options.resources else scheduler.pools_from_env()
+        if options.speculate:
+            speculation.set_policy(speculation.SpeculationPolicy(get_script_config))
+        if options.profile:
+            script_profile.set_profiler(script_profile.ScriptProfiler(
+                script_profile.parse_selection(options.profile), options.profile_mode))
+        if options.capture_output is not None:
+            if options.capture_output < 0:
+                raise ValueError(f"Invalid --capture-output {options.capture_output}, expected a byte count")
+            script_output.set_cap_bytes(options.capture_output)
+    except ValueError as e:
+        print(f"Error: {e}")
+        run_events.emit("run_end", {"result": 1})
+        sys.stderr.write("1\n")
+        sys.exit(1)
+    
+    if options.watch_map:
+        watch_map.update(hash_watch.load_watch_map(options.watch_map))
+        if not watch_map:
+            print(f"Warning: Watch map '{options.watch_map}' is missing or stale, hashing folders")
+    
+    # Fetch script hashes from database while parsing and hashing the script folders
+    expression_tree, script_hashes, local_hashes = fetch_hashes_and_parse(
+        expression_string, bundle_dir=options.bundles, remote=bool(options.workers), compact=options.compact_tree)
+    
+    # Persist each node outcome under log_id; flushed at exit, including sys.exit paths
+    history_writer = run_history.start_run_history(log_id)
+    metrics_summary = None
+    if options.resource_summary:
+        metrics_summary = script_metrics.MetricsSummary()
+        run_events.add_listener(metrics_summary.on_event)
+    
+    run_events.emit("parse_done", {
+        "expression": str(expression_tree) if expression_tree is not None else expression_string,
+        "valid": expression_tree is not None,
+        "scripts": list(local_hashes),
+    })
     
     # Check if parsing was successful
     if expression_tree is None:
         print("Invalid expression format. Please fix and try again.")
+        run_events.emit("run_end", {"result": 1})
         sys.stderr.write("1\n")
         sys.exit(1)
     
     # STEP 1: Collect all script names in the expression tree
-    script_names = collect_script_names_from_tree(expression_tree)
-    script_names = list(set(script_names))  # Remove duplicates
+    script_names = list(local_hashes)  # Unique names, in order of appearance
     print(f"\n=== PRE-VERIFICATION OF SCRIPT HASHES ===")
     print(f"Scripts to verify: {', '.join(script_names)}")
     
     # STEP 2: Verify all script hashes before executing any script
     verify_hash = True  # Always verify hash if available
+    verified_hashes = {}
     if verify_hash:
         all_hashes_valid = True
         
@@ -592,9 +756,10 @@ def main():
             # Get the absolute path to the script folder
             script_folder = os.path.join(os.getcwd(), script_name)
             
-            # Check if the script folder exists
-            if not os.path.isdir(script_folder):
+            # Check if the script folder exists (bundles replace the folder)
+            if options.bundles is None and not options.workers and not os.path.isdir(script_folder):
                 print(f"Error: Script folder '{script_folder}' not found")
+                run_events.emit("verification", {"script": script_name, "status": "missing_folder"})
                 all_hashes_valid = False
                 break  # Stop at first failure
             
@@ -605,24 +770,45 @@ def main():
             if expected_hash is not None:
                 print(f"Verifying hash for {script_name}...", end=" ")
                 
-                # Exclude __pycache__ directories by default
-                exclude_dirs = ['__pycache__', '.git', '.vscode']
-                actual_hash = directory_hash.calculate_directory_hash(script_folder, exclude_dirs, verbose=False)
+                # Hashed concurrently with the DB fetch (see fetch_hashes_and_parse)
+                actual_hash = local_hashes[script_name]
                 
                 if actual_hash != expected_hash:
                     print("FAILED")
                     print(f"Hash verification FAILED for {script_folder}")
                     print(f"  Expected: {expected_hash}")
                     print(f"  Actual:   {actual_hash}")
+                    run_events.emit("verification", {
+                        "script": script_name,
+                        "status": "failed",
+                        "expected": expected_hash,
+                        "actual": actual_hash,
+                    })
+                    if options.bundles is None and not options.workers:
+                        # A signed manifest tells exactly what changed
+                        _, differences, error = folder_manifest.verify_with_manifest(
+                            script_folder, expected_hash, stop_at_first=False)
+                        if error is None:
+                            folder_manifest.print_differences(differences)
                     all_hashes_valid = False
                     break  # Stop at first failure
                 else:
-                    print("PASSED")
+                    tier = verification_tiers.get(script_name, verify_policy.TIER_CONTENT)
+                    print(f"PASSED ({tier})")
+                    run_events.emit("verification", {
+                        "script": script_name,
+                        "status": "passed",
+                        "tier": tier,
+                        "expected": expected_hash,
+                        "actual": actual_hash,
+                    })
+                    verified_hashes[script_name] = actual_hash
             else:
                 # No hash available is now considered a failure
                 print(f"Verifying hash for {script_name}... FAILED")
                 print(f"No hash available for script '{script_name}'")
                 print(f"All scripts must have a hash defined for verification.")
+                run_events.emit("verification", {"script": script_name, "status": "no_hash"})
                 all_hashes_valid = False
                 break  # Stop at first failure
         
@@ -630,18 +816,82 @@ def main():
         if not all_hashes_valid:
             print("\n=== HASH VERIFICATION FAILED ===")
             print("Execution aborted: Fix the script directories and try again.")
+            run_events.emit("run_end", {"result": 1})
             sys.stderr.write("1\n")
             sys.exit(1)
         
         print("All script hashes verified successfully.")
         print("=== PRE-VERIFICATION COMPLETE ===\n")
     
+    # Resume: reuse the successes of a previous run of the same expression
+    if options.resume:
+        previous_run = None
+        previous_rows = []
+        try:
+            history_store = run_history.RunHistoryStore(hash_store.get_hash_store())
+            previous_run = history_store.fetch_run_info(options.resume)
+            if previous_run is not None:
+                previous_rows = history_store.fetch_run(options.resume)
+        except Exception as e:
+            print(f"Error reading run history: {e}")
+        
+        if previous_run is None:
+            print(f"Error: No recorded run with log ID '{options.resume}' to resume")
+            run_events.emit("run_end", {"result": 1})
+            sys.stderr.write("1\n")
+            sys.exit(1)
+        if previous_run["expression"] != str(expression_tree):
+            print(f"Error: Run '{options.resume}' was recorded for a different expression:")
+            print(f"  Recorded: {previous_run['expression']}")
+            print(f"  Current:  {expression_tree}")
+            run_events.emit("run_end", {"result": 1})
+            sys.stderr.write("1\n")
+            sys.exit(1)
+        
+        skipped = apply_resume(expression_tree, previous_rows, previous_run["folder_hashes"], verified_hashes)
+        print(f"Resuming run '{options.resume}': {skipped} recorded success(es) will be skipped\n")
+    
+    if history_writer is not None:
+        history_writer.record_run(run_history.run_row(
+            log_id, str(expression_tree), verified_hashes,
+            {name: verification_tiers.get(name) for name in verified_hashes}))
+    
     # Execute the logical expression
-    logical_result = expression_tree.evaluate(
-        dynamic_import_and_run, 
-        False,  # No need to verify hash during execution since we already did before execution
-        script_hashes
-    )
+    resource_scheduler = None
+    if pools:
+        # Admission control only matters when scripts can run concurrently
+        resource_scheduler = scheduler.ResourceScheduler(pools)
+    if options.workers:
+        try:
+            logical_result = asyncio.run(evaluate_remotely(
+                expression_tree, options.workers.split(','), script_hashes, resource_scheduler))
+        except (ConnectionError, ValueError) as e:
+            print(f"Error: {e}")
+            run_events.emit("run_end", {"result": 1})
+            sys.stderr.write("1\n")
+            sys.exit(1)
+        if resource_scheduler is not None:
+            resource_scheduler.print_summary()
+    elif options.use_async or options.speculate or resource_scheduler is not None:
+        executor_func = dynamic_import_and_run_async
+        if resource_scheduler is not None:
+            executor_func = resource_scheduler.wrap(executor_func, get_script_config)
+        logical_result = asyncio.run(expression_tree.evaluate_async(
+            executor_func,
+            False,  # Hashes were verified before execution
+            script_hashes
+        ))
+        if resource_scheduler is not None:
+            resource_scheduler.print_summary()
+    else:
+        logical_result = expression_tree.evaluate(
+            dynamic_import_and_run, 
+            False,  # No need to verify hash during execution since we already did before execution
+            script_hashes
+        )
+    
+    if metrics_summary is not None:
+        metrics_summary.print_summary()
     
     # Convert boolean result to exit code (True=0, False=1)
     final_code = 0 if logical_result else 1
@@ -650,6 +900,8 @@ def main():
     print("\nLogical Expression Result:", "Success (True)" if logical_result else "Failure (False)")
     print(f"Final result code to return: {final_code}")
     
+    run_events.emit("run_end", {"result": final_code})
+    
     # Write final result code to stderr
     sys.stderr.write(f"{final_code}\n")
     
@@ -0,0 +1,167 @@
+import re
+
+IGNORE_FILE = ".hashignore"
+
+
+def _translate(pattern):
+    """Translate a gitignore glob (without '!' or trailing '/') into a regex body."""
+    anchored = "/" in pattern.rstrip("/")
+    if pattern.startswith("/"):
+        pattern = pattern[1:]
+
+    parts = []
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        if c == "*":
+            if pattern.startswith("**", i):
+                at_start = i == 0 or pattern[i - 1] == "/"
+                if at_start and pattern.startswith("**/", i):
+                    parts.append("(?:.*/)?")  # Zero or more leading directories
+                    i += 3
+                    continue
+                if at_start and i + 2 == n:
+                    parts.append(".*")  # Everything inside
+                    i += 2
+                    continue
+                parts.append(".*")
+                i += 2
+                continue
+            parts.append("[^/]*")
+        elif c == "?":
+            parts.append("[^/]")
+        elif c == "[":
+            end = pattern.find("]", i + 2 if pattern.startswith("[!", i) or pattern.startswith("[^", i) else i + 1)
+            if end < 0:
+                parts.append(re.escape(c))
+            else:
+                body = pattern[i + 1:end]
+                if body[:1] in ("!", "^"):
+                    body = "^" + body[1:]
+                parts.append(f"[{body.replace(chr(92), chr(92) * 2)}]")
+                i = end
+        elif c == "\\" and i + 1 < n:
+            i += 1
+            parts.append(re.escape(pattern[i]))
+        else:
+            parts.append(re.escape(c))
+        i += 1
+
+    body = "".join(parts)
+    return body if anchored else f"(?:.*/)?{body}"
+
+
+class IgnoreRules:
+    """
+    A compiled list of gitignore-style rules, relative to one directory.
+    As in .gitignore, the last matching rule wins.
+
+    Args:
+        lines (iterable): Rule lines, e.g. the lines of a .hashignore file
+    """
+    def __init__(self, lines):
+        self.rules = []  # (pattern text, compiled regex, negated, directory only)
+        for line in lines:
+            line = line.rstrip("\n\r")
+            # Trailing spaces are ignored unless escaped
+            stripped = line.rstrip(" ")
+            if stripped.endswith("\\") and len(stripped) < len(line):
+                stripped += " "
+            line = stripped
+            if not line or line.startswith("#"):
+                continue
+            negated = line.startswith("!")
+            if negated:
+                line = line[1:]
+            elif line.startswith("\\!") or line.startswith("\\#"):
+                line = line[1:]
+            dir_only = line.endswith("/")
+            pattern = line.rstrip("/")
+            if not pattern:
+                continue
+            regex = re.compile(_translate(pattern) + r"\Z")
+            self.rules.append((line, regex, negated, dir_only))
+
+        self._has_negation = any(negated for _, _, negated, _ in self.rules)
+        if not self._has_negation:
+            # Without negation only "does any rule match" matters: merge the rules
+            self._dir_regex = self._merge(r for r in self.rules)
+            self._file_regex = self._merge(r for r in self.rules if not r[3])
+
+    @staticmethod
+    def _merge(rules):
+        bodies = [regex.pattern for _, regex, _, _ in rules]
+        if not bodies:
+            return None
+        return re.compile("|".join(f"(?:{body})" for body in bodies))
+
+    def __bool__(self):
+        return bool(self.rules)
+
+    def match(self, rel_path, is_dir):
+        """
+        Decide whether a path is excluded by these rules.
+
+        Args:
+            rel_path (str): '/'-separated path relative to the rules' directory
+            is_dir (bool): Whether the path is a directory
+
+        Returns:
+            bool or None: True if excluded, False if re-included, None if no rule matches
+        """
+        if not self._has_negation:
+            regex = self._dir_regex if is_dir else self._file_regex
+            return True if regex is not None and regex.match(rel_path) else None
+        for _, regex, negated, dir_only in reversed(self.rules):
+            if dir_only and not is_dir:
+                continue
+            if regex.match(rel_path):
+                return not negated
+        return None
+
+    @classmethod
+    def from_file(cls, path):
+        """Load the rules of an ignore file, or return None if it does not exist."""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return cls(f.readlines())
+        except FileNotFoundError:
+            return None
+
+    @classmethod
+    def from_dir_names(cls, dir_names):
+        """Rules excluding directories with the given names (or globs) at any depth."""
+        return cls(f"{name.rstrip('/')}/" for name in dir_names)
+
+
+class IgnoreMatcher:
+    """
+    Exclusion state for a walk: the rules in effect for one directory.
+
+    Rules of nested .hashignore files apply below their own directory and
+    take precedence over the rules of the directories above them.
+    """
+    def __init__(self, layers=()):
+        self.layers = tuple(layers)  # (base relative dir, IgnoreRules), outermost first
+
+    def child(self, rel_dir, rules):
+        """Matcher for a subdirectory that has its own rules."""
+        if not rules:
+            return self
+        return IgnoreMatcher(self.layers + ((rel_dir, rules),))
+
+    def is_ignored(self, rel_path, is_dir):
+        """Whether a '/'-separated path relative to the walked root is excluded."""
+        if rel_path.rsplit("/", 1)[-1] == IGNORE_FILE and not is_dir:
+            return False  # The rules themselves are always hashed
+        for base, rules in reversed(self.layers):
+            if base:
+                if not rel_path.startswith(base + "/"):
+                    continue
+                path = rel_path[len(base) + 1:]
+            else:
+                path = rel_path
+            result = rules.match(path, is_dir)
+            if result is not None:
+                return result
+        return False
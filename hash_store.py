@@ -0,0 +1,436 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# Connection string for Windows Authentication (the production hash table)
+DEFAULT_CONNECTION_STRING = (
+    "DRIVER={SQL Server};"
+    "SERVER=MTLSQLCS051;"
+    "DATABASE=CSIPED_PRD;"
+    "TRUSTED_CONNECTION=yes;"
+)
+
+DEFAULT_SQLITE_PATH = "hash_store.sqlite3"
+DEFAULT_POOL_SIZE = 4
+DEFAULT_CHECKOUT_TIMEOUT = 60.0  # seconds a caller waits for a connection of an exhausted pool
+
+# Environment variables that select and configure the backend
+ENV_CONFIG_FILE = "HASH_STORE_CONFIG"
+ENV_BACKEND = "HASH_STORE_BACKEND"
+ENV_CONNECTION_STRING = "HASH_STORE_CONNECTION_STRING"
+ENV_SQLITE_PATH = "HASH_STORE_SQLITE_PATH"
+ENV_POOL_SIZE = "HASH_STORE_POOL_SIZE"
+
+
+class ConnectionPool:
+    """
+    Small thread-safe pool that reuses open DB-API connections.
+
+    Connections are created lazily up to pool_size. When all of them are
+    checked out, callers wait (up to checkout_timeout seconds) until one is
+    returned or a slot is freed. A connection that raised an error while
+    checked out is closed instead of being reused.
+    """
+    def __init__(self, connect_func, pool_size=DEFAULT_POOL_SIZE, checkout_timeout=DEFAULT_CHECKOUT_TIMEOUT):
+        if pool_size < 1:
+            raise ValueError("pool_size must be at least 1")
+        self.connect_func = connect_func
+        self.pool_size = pool_size
+        self.checkout_timeout = checkout_timeout
+        self._idle = []  # Most recently returned last
+        self._available = threading.Condition(threading.Lock())
+        self._open = 0
+        self.connections_created = 0
+        self.connections_reused = 0
+        self.checkouts = 0
+
+    def _acquire(self):
+        deadline = time.monotonic() + self.checkout_timeout
+        with self._available:
+            while True:
+                if self._idle:
+                    self.connections_reused += 1
+                    self.checkouts += 1
+                    return self._idle.pop()
+                if self._open < self.pool_size:
+                    self._open += 1  # Reserve the slot, connect outside the lock
+                    break
+                # Pool exhausted: wait for a returned connection or a freed slot
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"No database connection free after {self.checkout_timeout}s "
+                                       f"(pool size {self.pool_size})")
+                self._available.wait(remaining)
+
+        try:
+            cnxn = self.connect_func()
+        except BaseException:
+            with self._available:
+                self._open -= 1
+                self._available.notify()
+            raise
+        with self._available:
+            self.connections_created += 1
+            self.checkouts += 1
+        return cnxn
+
+    def _release(self, cnxn):
+        with self._available:
+            self._idle.append(cnxn)
+            self._available.notify()
+
+    def _discard(self, cnxn):
+        try:
+            cnxn.close()
+        except Exception:
+            pass
+        with self._available:
+            self._open -= 1
+            self._available.notify()
+
+    @contextmanager
+    def connection(self):
+        """Check a connection out of the pool for the duration of a with-block."""
+        cnxn = self._acquire()
+        try:
+            yield cnxn
+        except BaseException:
+            # Also on KeyboardInterrupt / cancellation: the connection state is unknown
+            self._discard(cnxn)
+            raise
+        else:
+            self._release(cnxn)
+
+    def close(self):
+        """Close every idle connection held by the pool."""
+        while True:
+            with self._available:
+                if not self._idle:
+                    break
+                cnxn = self._idle.pop()
+            self._discard(cnxn)
+
+    def stats(self):
+        """Return the pool metrics as a dictionary."""
+        with self._available:
+            return {
+                "pool_size": self.pool_size,
+                "open_connections": self._open,
+                "idle_connections": len(self._idle),
+                "connections_created": self.connections_created,
+                "connections_reused": self.connections_reused,
+                "checkouts": self.checkouts,
+            }
+
+
+class HashStore:
+    """Base class for the script hash table backends"""
+    backend_name = None
+    table_name = None
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def create_table_query(self):
+        """To be implemented by subclasses"""
+        raise NotImplementedError
+
+    def ensure_schema(self):
+        """Create the hash table if it does not exist yet."""
+        with self.pool.connection() as cnxn:
+            cursor = cnxn.cursor()
+            cursor.execute(self.create_table_query())
+            cnxn.commit()
+            cursor.close()
+
+    def fetch_hashes(self):
+        """
+        Fetch every registered script hash.
+
+        Returns:
+            dict: Dictionary mapping script names to their hash values
+        """
+        script_hashes = {}
+        with self.pool.connection() as cnxn:
+            cursor = cnxn.cursor()
+            cursor.execute(f"SELECT script_name, hash_value FROM {self.table_name}")
+            for row in cursor.fetchall():
+                script_hashes[row[0]] = row[1]
+            cursor.close()
+        return script_hashes
+
+    def fetch_hash(self, script_name):
+        """
+        Fetch the registered hash of one script.
+
+        Returns:
+            str: The hash value, or None if the script is not registered
+        """
+        with self.pool.connection() as cnxn:
+            cursor = cnxn.cursor()
+            cursor.execute(f"SELECT hash_value FROM {self.table_name} WHERE script_name = ?", (script_name,))
+            row = cursor.fetchone()
+            cursor.close()
+        return row[0] if row is not None else None
+
+    def insert_missing_hashes(self, hashes):
+        """
+        Insert hashes for scripts that are not registered yet.
+        Existing rows are left untouched.
+
+        Args:
+            hashes (dict): Dictionary mapping script names to hash values
+        """
+        with self.pool.connection() as cnxn:
+            cursor = cnxn.cursor()
+            for script_name, hash_value in hashes.items():
+                cursor.execute(
+                    f"SELECT 1 FROM {self.table_name} WHERE script_name = ?", (script_name,))
+                if cursor.fetchone() is None:
+                    cursor.execute(
+                        f"INSERT INTO {self.table_name} (script_name, hash_value) VALUES (?, ?)",
+                        (script_name, hash_value))
+            cnxn.commit()
+            cursor.close()
+
+    def upsert_hashes(self, hashes):
+        """
+        Insert or update many script hashes in one set-based operation.
+
+        Args:
+            hashes (dict): Dictionary mapping script names to hash values
+
+        Returns:
+            dict: 'added', 'changed' and 'unchanged' entries (see diff_hashes)
+        """
+        raise NotImplementedError
+
+    def stats(self):
+        """Return backend name and pool metrics."""
+        stats = self.pool.stats()
+        stats["backend"] = self.backend_name
+        return stats
+
+    def close(self):
+        self.pool.close()
+
+
+class PyodbcHashStore(HashStore):
+    """Hash store on SQL Server, reached through a pooled pyodbc connection"""
+    backend_name = "pyodbc"
+    table_name = "INTERN.Aman_hashing"
+
+    def __init__(self, connection_string=DEFAULT_CONNECTION_STRING, pool_size=DEFAULT_POOL_SIZE):
+        # Imported here so the SQLite backend works on hosts without an ODBC driver
+        import pyodbc
+        self.connection_string = connection_string
+        super().__init__(ConnectionPool(lambda: pyodbc.connect(connection_string), pool_size))
+
+    def create_table_query(self):
+        return """
+        IF NOT EXISTS (SELECT * FROM sys.tables t JOIN sys.schemas s ON t.schema_id = s.schema_id
+                      WHERE s.name = 'INTERN' AND t.name = 'Aman_hashing')
+        BEGIN
+            CREATE TABLE INTERN.Aman_hashing (
+                script_name VARCHAR(50) PRIMARY KEY,
+                hash_value VARCHAR(32) NOT NULL
+            )
+        END
+        """
+
+    def upsert_hashes(self, hashes):
+        if not hashes:
+            return diff_hashes({}, {})
+
+        with self.pool.connection() as cnxn:
+            cursor = cnxn.cursor()
+            cursor.execute("""
+            CREATE TABLE #Aman_hashing_staging (
+                script_name VARCHAR(50) PRIMARY KEY,
+                hash_value VARCHAR(32) NOT NULL
+            )
+            """)
+
+            # Send every staging row in a single batched round trip
+            cursor.fast_executemany = True
+            cursor.executemany(
+                "INSERT INTO #Aman_hashing_staging (script_name, hash_value) VALUES (?, ?)",
+                sorted(hashes.items()))
+
+            # Set-based upsert; OUTPUT reports what it touched so we can build the diff
+            cursor.execute("""
+            MERGE INTO INTERN.Aman_hashing AS target
+            USING #Aman_hashing_staging AS source
+                ON target.script_name = source.script_name
+            WHEN MATCHED AND target.hash_value <> source.hash_value THEN
+                UPDATE SET hash_value = source.hash_value
+            WHEN NOT MATCHED BY TARGET THEN
+                INSERT (script_name, hash_value) VALUES (source.script_name, source.hash_value)
+            OUTPUT $action, inserted.script_name, deleted.hash_value;
+            """)
+            merge_rows = cursor.fetchall()
+
+            cursor.execute("DROP TABLE #Aman_hashing_staging")
+            cnxn.commit()
+            cursor.close()
+
+        # Rows MERGE did not touch were already identical; inserted rows had no previous value
+        previous = dict(hashes)
+        for action, script_name, old_hash in merge_rows:
+            if action == 'UPDATE':
+                previous[script_name] = old_hash
+            else:
+                del previous[script_name]
+        return diff_hashes(previous, hashes)
+
+
+class SQLiteHashStore(HashStore):
+    """Hash store in a local SQLite file, used for tests and local runs"""
+    backend_name = "sqlite"
+    table_name = "Aman_hashing"
+
+    def __init__(self, path=DEFAULT_SQLITE_PATH, pool_size=DEFAULT_POOL_SIZE):
+        self.path = path
+        # check_same_thread is off because pooled connections move between threads
+        super().__init__(ConnectionPool(
+            lambda: sqlite3.connect(path, check_same_thread=False), pool_size))
+        self.ensure_schema()
+
+    def create_table_query(self):
+        return """
+        CREATE TABLE IF NOT EXISTS Aman_hashing (
+            script_name VARCHAR(50) PRIMARY KEY,
+            hash_value VARCHAR(32) NOT NULL
+        )
+        """
+
+    def upsert_hashes(self, hashes):
+        with self.pool.connection() as cnxn:
+            cursor = cnxn.cursor()
+            # Read the current values inside the same transaction as the write
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute(f"SELECT script_name, hash_value FROM {self.table_name}")
+            previous = {row[0]: row[1] for row in cursor.fetchall() if row[0] in hashes}
+
+            cursor.executemany(f"""
+            INSERT INTO {self.table_name} (script_name, hash_value) VALUES (?, ?)
+            ON CONFLICT(script_name) DO UPDATE SET hash_value = excluded.hash_value
+            WHERE hash_value <> excluded.hash_value
+            """, sorted(hashes.items()))
+            cnxn.commit()
+            cursor.close()
+
+        return diff_hashes(previous, hashes)
+
+
+def diff_hashes(previous, hashes):
+    """
+    Compare newly computed hashes against the currently registered ones.
+
+    Args:
+        previous (dict): Registered hash values (script name -> hash)
+        hashes (dict): New hash values (script name -> hash)
+
+    Returns:
+        dict: 'added' and 'unchanged' are lists of (name, hash), 'changed' is a
+              list of (name, old_hash, new_hash); each list is sorted by name
+    """
+    diff = {"added": [], "changed": [], "unchanged": []}
+    for script_name in sorted(hashes):
+        hash_value = hashes[script_name]
+        old_hash = previous.get(script_name)
+        if old_hash is None:
+            diff["added"].append((script_name, hash_value))
+        elif old_hash != hash_value:
+            diff["changed"].append((script_name, old_hash, hash_value))
+        else:
+            diff["unchanged"].append((script_name, hash_value))
+    return diff
+
+
+def load_config(config=None):
+    """
+    Resolve the hash store configuration.
+
+    Values come from, in increasing priority: built-in defaults, the JSON file
+    named by HASH_STORE_CONFIG, the HASH_STORE_* environment variables and
+    finally the config dictionary passed in.
+
+    Returns:
+        dict: Keys 'backend', 'connection_string', 'sqlite_path' and 'pool_size'
+    """
+    resolved = {
+        "backend": "pyodbc",
+        "connection_string": DEFAULT_CONNECTION_STRING,
+        "sqlite_path": DEFAULT_SQLITE_PATH,
+        "pool_size": DEFAULT_POOL_SIZE,
+    }
+
+    config_file = os.environ.get(ENV_CONFIG_FILE)
+    if config_file:
+        with open(config_file, 'r') as f:
+            resolved.update(json.load(f))
+
+    env_keys = {
+        ENV_BACKEND: "backend",
+        ENV_CONNECTION_STRING: "connection_string",
+        ENV_SQLITE_PATH: "sqlite_path",
+        ENV_POOL_SIZE: "pool_size",
+    }
+    for env_name, key in env_keys.items():
+        if os.environ.get(env_name):
+            resolved[key] = os.environ[env_name]
+
+    if config:
+        resolved.update(config)
+
+    resolved["pool_size"] = int(resolved["pool_size"])
+    return resolved
+
+
+def create_hash_store(config=None):
+    """Create a new hash store for the resolved configuration."""
+    config = load_config(config)
+    backend = config["backend"]
+    if backend == "pyodbc":
+        return PyodbcHashStore(config["connection_string"], config["pool_size"])
+    elif backend == "sqlite":
+        return SQLiteHashStore(config["sqlite_path"], config["pool_size"])
+    raise ValueError(f"Unknown hash store backend '{backend}' (expected 'pyodbc' or 'sqlite')")
+
+
+_shared_store = None
+_shared_store_lock = threading.Lock()
+
+def get_hash_store():
+    """
+    Return the process-wide hash store, creating it on first use.
+    Every caller in the process shares the same connection pool.
+    """
+    global _shared_store
+    with _shared_store_lock:
+        if _shared_store is None:
+            _shared_store = create_hash_store()
+        return _shared_store
+
+def set_hash_store(store):
+    """
+    Replace the process-wide hash store, e.g. with an SQLite store in tests.
+    The previous store, if any, is closed.
+    """
+    global _shared_store
+    with _shared_store_lock:
+        if _shared_store is not None and _shared_store is not store:
+            _shared_store.close()
+        _shared_store = store
+
+def close_hash_store():
+    """Close the process-wide hash store and its pooled connections."""
+    global _shared_store
+    with _shared_store_lock:
+        if _shared_store is not None:
+            _shared_store.close()
+            _shared_store = None
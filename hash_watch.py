@@ -0,0 +1,347 @@
+import argparse
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import struct
+import sys
+import tempfile
+import time
+
+import directory_hash
+
+DEFAULT_EXCLUDES = ['__pycache__', '.git', '.vscode']
+DEFAULT_STATE_FILE = ".hash_watch.json"
+HEARTBEAT_INTERVAL = 2.0   # seconds between state file refreshes
+DEFAULT_MAX_AGE = 10.0     # readers ignore a map whose heartbeat is older than this
+DEBOUNCE = 0.2             # wait for a folder to be quiet before rehashing it
+POLL_INTERVAL = 1.0
+
+# inotify constants from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_FOLDER_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+                IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+_ROOT_MASK = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_ONLYDIR
+_EVENT_HEADER = struct.Struct("iIII")
+
+# Returned by event sources when changes may have been lost
+ALL_FOLDERS = object()
+
+
+class InotifySource:
+    """
+    Change notifications for the script folders through Linux inotify (via ctypes).
+
+    Every non-excluded directory of every script folder is watched, plus the
+    root for folders being added or removed. A queue overflow reports
+    ALL_FOLDERS, since the lost events could have touched any folder.
+    """
+    name = "inotify"
+
+    def __init__(self, root_dir, exclude_dirs):
+        libc_name = ctypes.util.find_library("c") or "libc.so.6"
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self._libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.root_dir = root_dir
+        self.exclude_dirs = exclude_dirs
+        self._watches = {}  # wd -> script name (None for the root)
+        self._add_watch(root_dir, None, _ROOT_MASK)
+
+    def _add_watch(self, path, script_name, mask=_FOLDER_MASK):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            return False  # Directory vanished in the meantime; its parent's event covers it
+        self._watches[wd] = script_name
+        return True
+
+    def watch_folder(self, script_name, folder):
+        # Watch exactly the hashed directories, .hashignore rules included; the
+        # folder is rewatched after each rehash, which picks up new directories
+        for root, _, _ in directory_hash.walk_directory(folder, self.exclude_dirs):
+            self._add_watch(root, script_name)
+
+    def forget_folder(self, script_name):
+        pass  # The kernel drops watches of deleted directories (IN_IGNORED)
+
+    def _read_events(self, timeout):
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 256 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0").decode(errors="surrogateescape")
+            offset += length
+            events.append((wd, mask, name))
+        return events
+
+    def wait(self, timeout):
+        """
+        Wait up to timeout seconds for changes.
+
+        Returns:
+            set: Names of changed script folders (may contain ALL_FOLDERS and,
+                 for folders added under the root, new names)
+        """
+        changed = set()
+        for wd, mask, name in self._read_events(timeout):
+            if mask & IN_Q_OVERFLOW:
+                changed.add(ALL_FOLDERS)
+                continue
+            if mask & IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+            if wd not in self._watches:
+                continue
+            script_name = self._watches[wd]
+            if script_name is None:
+                # Something appeared or disappeared directly under the root
+                if mask & IN_ISDIR:
+                    changed.add(name)
+                continue
+            if mask & IN_ISDIR and name in self.exclude_dirs:
+                continue  # Excluded directories never affect the hash
+            changed.add(script_name)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingSource:
+    """
+    Portable fallback: compares a stat signature of every folder at each interval.
+    """
+    name = "polling"
+
+    def __init__(self, root_dir, exclude_dirs, interval=POLL_INTERVAL):
+        self.root_dir = root_dir
+        self.exclude_dirs = exclude_dirs
+        self.interval = interval
+        self._signatures = {}
+        self._folders = {}
+
+    def _signature(self, folder):
+        entries = []
+        for root, rel_dir_path, files in directory_hash.walk_directory(folder, self.exclude_dirs):
+            entries.append(("D", rel_dir_path))
+            for filename in files:
+                try:
+                    st = os.stat(os.path.join(root, filename))
+                except OSError:
+                    continue
+                entries.append((filename, st.st_size, st.st_mtime_ns, st.st_ino, st.st_mode))
+        return hash(tuple(entries))
+
+    def watch_folder(self, script_name, folder):
+        self._folders[script_name] = folder
+        self._signatures[script_name] = self._signature(folder)
+
+    def forget_folder(self, script_name):
+        self._folders.pop(script_name, None)
+        self._signatures.pop(script_name, None)
+
+    def wait(self, timeout):
+        time.sleep(min(timeout, self.interval))
+        changed = set()
+        current = {os.path.basename(f): f for f in directory_hash.find_script_folders(self.root_dir)}
+        for script_name in current.keys() - self._folders.keys():
+            # New folders are reported once, then compared like the others
+            self.watch_folder(script_name, current[script_name])
+            changed.add(script_name)
+        for script_name, folder in list(self._folders.items()):
+            if script_name not in current:
+                self.forget_folder(script_name)
+                changed.add(script_name)
+                continue
+            signature = self._signature(folder)
+            if signature != self._signatures.get(script_name):
+                self._signatures[script_name] = signature
+                changed.add(script_name)
+        return changed
+
+    def close(self):
+        pass
+
+
+class HashWatcher:
+    """
+    Keeps a live map of script folder -> directory hash for every script
+    folder under root_dir and publishes it to a shared JSON state file.
+
+    A folder's entry is removed from the published map as soon as a change
+    is seen, and only republished once it has been rehashed with no further
+    change arriving meanwhile, so readers never get a digest older than the
+    last event processed. Event overflow triggers a full rehash.
+    """
+    def __init__(self, root_dir, state_file=None, exclude_dirs=None, force_polling=False):
+        self.root_dir = os.path.abspath(root_dir)
+        self.state_file = state_file or os.path.join(self.root_dir, DEFAULT_STATE_FILE)
+        self.exclude_dirs = exclude_dirs if exclude_dirs is not None else DEFAULT_EXCLUDES
+        self.source = None
+        if not force_polling and sys.platform.startswith("linux"):
+            try:
+                self.source = InotifySource(self.root_dir, self.exclude_dirs)
+            except OSError as e:
+                print(f"inotify unavailable ({e}), falling back to polling")
+        if self.source is None:
+            self.source = PollingSource(self.root_dir, self.exclude_dirs)
+        self.digests = {}
+        self.full_rehashes = 0
+        self._dirty = set()
+        self._last_change = 0.0
+        self._last_publish = 0.0
+
+    def _hash_folder(self, script_name):
+        folder = os.path.join(self.root_dir, script_name)
+        script_file = f"{script_name}.py"
+        script_md5 = []
+
+        def keep_script_md5(rel_path, content, content_hash):
+            if rel_path == script_file:
+                script_md5.append(content_hash)
+
+        hash_value = directory_hash.calculate_directory_hash(
+            folder, self.exclude_dirs, verbose=False, on_file=keep_script_md5)
+        return {"hash": hash_value, "script_md5": script_md5[0] if script_md5 else None,
+                "updated": time.time()}
+
+    def _mark_dirty(self, changed):
+        if ALL_FOLDERS in changed:
+            print("Event queue overflowed: rehashing every folder")
+            self.full_rehashes += 1
+            changed = set(self.digests) | {os.path.basename(f) for f in
+                                           directory_hash.find_script_folders(self.root_dir)}
+        for script_name in changed:
+            self._dirty.add(script_name)
+            self.digests.pop(script_name, None)
+        self._last_change = time.monotonic()
+        # Invalidate right away; readers fall back to hashing these folders
+        self.publish()
+
+    def _rehash_dirty(self):
+        pending, self._dirty = self._dirty, set()
+        results = {}
+        for script_name in pending:
+            folder = os.path.join(self.root_dir, script_name)
+            if not os.path.isfile(os.path.join(folder, f"{script_name}.py")):
+                self.source.forget_folder(script_name)  # No longer a script folder
+                continue
+            self.source.watch_folder(script_name, folder)
+            results[script_name] = self._hash_folder(script_name)
+
+        # Changes made while hashing make the new digest unreliable: hash again later
+        changed_meanwhile = self.source.wait(0)
+        if changed_meanwhile:
+            self._mark_dirty(changed_meanwhile)
+        for script_name, entry in results.items():
+            if script_name not in self._dirty:
+                self.digests[script_name] = entry
+        self.publish()
+
+    def publish(self):
+        """Atomically write the current map to the state file."""
+        state = {
+            "pid": os.getpid(),
+            "root": self.root_dir,
+            "backend": self.source.name,
+            "heartbeat": time.time(),
+            "full_rehashes": self.full_rehashes,
+            "digests": self.digests,
+        }
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(self.state_file), suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(state, f)
+            os.replace(temp_path, self.state_file)
+        except BaseException:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+            raise
+        self._last_publish = time.monotonic()
+
+    def run(self, stop_after=None):
+        """Watch until interrupted (or for stop_after seconds)."""
+        self._dirty = {os.path.basename(f) for f in directory_hash.find_script_folders(self.root_dir)}
+        self._rehash_dirty()
+        print(f"Watching {len(self.digests)} script folder(s) under {self.root_dir} "
+              f"with {self.source.name}; state file {self.state_file}")
+
+        deadline = None if stop_after is None else time.monotonic() + stop_after
+        try:
+            while deadline is None or time.monotonic() < deadline:
+                timeout = DEBOUNCE if self._dirty else HEARTBEAT_INTERVAL
+                changed = self.source.wait(timeout)
+                if changed:
+                    self._mark_dirty(changed)
+                elif self._dirty and time.monotonic() - self._last_change >= DEBOUNCE:
+                    self._rehash_dirty()
+                if time.monotonic() - self._last_publish >= HEARTBEAT_INTERVAL:
+                    self.publish()
+        finally:
+            self.source.close()
+
+
+def load_watch_map(state_file, max_age=DEFAULT_MAX_AGE):
+    """
+    Read the digests published by a running watcher.
+
+    Returns:
+        dict: Script name -> {'hash', 'script_md5', 'updated'}, or an empty dict
+              if there is no state file or its heartbeat is older than max_age
+    """
+    try:
+        with open(state_file, 'r') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if time.time() - state.get("heartbeat", 0) > max_age:
+        return {}
+    return state.get("digests", {})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="directory_hash.py --watch",
+        description="Keep the hashes of every script folder under ROOT continuously up to date.")
+    parser.add_argument("root", nargs="?", default=os.getcwd(), help="Directory holding the script folders")
+    parser.add_argument("--state-file", help=f"Shared map file (default: ROOT/{DEFAULT_STATE_FILE})")
+    parser.add_argument("--poll", action="store_true", help="Use stat polling instead of inotify")
+    args = parser.parse_args(argv)
+
+    watcher = HashWatcher(args.root, args.state_file, force_polling=args.poll)
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        print("Watcher stopped")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,633 @@
+import asyncio
+import re
+import sys
+import time
+
+import run_events
+import speculation
+
+# Node classes for expression tree
+class Node:
+    """Base class for all syntax tree nodes"""
+    __slots__ = ('result', 'path')
+    
+    def __init__(self):
+        self.result = None
+        self.path = None  # Position in the tree, e.g. "0.1.0" (set by assign_node_paths)
+    
+    def evaluate(self, executor_func, verify_hash=False, script_hashes=None):
+        """To be implemented by subclasses"""
+        raise NotImplementedError
+    
+    async def evaluate_async(self, executor_func, verify_hash=False, script_hashes=None):
+        """
+        Evaluate on an asyncio event loop; executor_func is a coroutine function
+        with the signature of dynamic_import_and_run (see dynamic_import_and_run_async).
+        To be implemented by subclasses.
+        """
+        raise NotImplementedError
+
+class ScriptNode(Node):
+    """Node representing a script execution"""
+    __slots__ = ('name', 'args', 'cached_result')
+    
+    def __init__(self, name, args=None):
+        super().__init__()
+        self.name = name
+        self.args = args or []
+        self.cached_result = None  # Recorded success reused by --resume (see apply_resume)
+    
+    def evaluate(self, executor_func, verify_hash=False, script_hashes=None):
+        """Execute the script and return result"""
+        expected_hash = script_hashes.get(self.name) if verify_hash and script_hashes else None
+        start_time = time.time()
+        speculation.report(run_events.emit, "node_start", {
+            "node_path": self.path,
+            "script": self.name,
+            "args": list(self.args),
+            "start_time": start_time,
+        })
+        if self.cached_result is not None:
+            self.result = self.cached_result
+            record = {"resumed": True}  # Not an execution: left out of runtime statistics
+            print(f"\n=== SKIPPED {self.name} ({self.result}, recorded by resumed run) ===\n")
+        else:
+            with run_events.node_record() as record:
+                self.result = executor_func(self.name, self.args, verify_hash, expected_hash)
+        end_time = time.time()
+        
+        return self._finish(start_time, end_time, record)
+    
+    async def evaluate_async(self, executor_func, verify_hash=False, script_hashes=None):
+        """Execute the script without blocking the event loop and return result"""
+        expected_hash = script_hashes.get(self.name) if verify_hash and script_hashes else None
+        start_time = time.time()
+        speculation.report(run_events.emit, "node_start", {
+            "node_path": self.path,
+            "script": self.name,
+            "args": list(self.args),
+            "start_time": start_time,
+        })
+        if self.cached_result is not None:
+            self.result = self.cached_result
+            record = {"resumed": True}  # Not an execution: left out of runtime statistics
+            print(f"\n=== SKIPPED {self.name} ({self.result}, recorded by resumed run) ===\n")
+        else:
+            with run_events.node_record() as record:
+                self.result = await executor_func(self.name, self.args, verify_hash, expected_hash)
+        end_time = time.time()
+        
+        return self._finish(start_time, end_time, record)
+    
+    def _finish(self, start_time, end_time, record):
+        """
+        Report self.result (stderr and node_end event, with the execution
+        record of run_events.node_record) and return it as a logical value
+        """
+        # In logical context, 0 (success) = True, 1 (failure) = False
+        logical_result = (self.result == 0)
+        
+        def report(result, payload):
+            # Write the result code to stderr for individual script
+            sys.stderr.write(f"{result}\n")
+            run_events.emit("node_end", payload)
+        
+        # Held back while the node runs speculatively (see speculation.py)
+        speculation.report(report, self.result, {
+            "node_path": self.path,
+            "script": self.name,
+            "args": list(self.args),
+            "result": self.result,
+            "start_time": start_time,
+            "end_time": end_time,
+            "details": record,
+        })
+        
+        return logical_result
+    
+    def __str__(self):
+        if self.args:
+            return f"({self.name}:{','.join(self.args)})"
+        return f"({self.name})"
+
+class LogicalOperatorNode(Node):
+    """Node representing a logical operator with children"""
+    __slots__ = ('operator', 'children')
+    
+    def __init__(self, operator, children=None):
+        super().__init__()
+        self.operator = operator
+        self.children = children or []
+    
+    def add_child(self, child):
+        self.children.append(child)
+    
+    def __str__(self):
+        children_str = ", ".join(str(child) for child in self.children)
+        return f"{self.operator} [ {children_str} ]"
+
+class NotNode(Node):
+    """Node representing a NOT operator"""
+    __slots__ = ('child',)
+    
+    def __init__(self, child=None):
+        super().__init__()
+        self.child = child
+    
+    def evaluate(self, executor_func, verify_hash=False, script_hashes=None):
+        """Evaluate NOT node by inverting the result of its child"""
+        if self.child is None:
+            print("Warning: NOT operator with no child")
+            return False
+            
+        child_result = self.child.evaluate(executor_func, verify_hash, script_hashes)
+        result = not child_result
+        
+        print(f"NOT operator: inverting {child_result} to {result}")
+        self.result = result
+        return result
+    
+    async def evaluate_async(self, executor_func, verify_hash=False, script_hashes=None):
+        """Evaluate NOT node by inverting the result of its child"""
+        if self.child is None:
+            print("Warning: NOT operator with no child")
+            return False
+            
+        child_result = await self.child.evaluate_async(executor_func, verify_hash, script_hashes)
+        result = not child_result
+        
+        print(f"NOT operator: inverting {child_result} to {result}")
+        self.result = result
+        return result
+    
+    def __str__(self):
+        return f"!{self.child}"
+
+def _emit_short_circuit(node, deciding_child, skipped_children):
+    speculation.report(run_events.emit, "short_circuit", {
+        "node_path": node.path,
+        "operator": node.operator,
+        "decided_by": deciding_child.path,
+        "skipped": [child.path for child in skipped_children],
+    })
+
+async def _evaluate_speculatively(node, decisive_result, executor_func, verify_hash, script_hashes):
+    """
+    Evaluate a '&&' (decisive_result False) or '||' (decisive_result True)
+    node, starting the side-effect-free children that follow the current
+    one before it finishes (see speculation.py). Results are committed in
+    order and the outcome is the same as a serial evaluation.
+    """
+    policy = speculation.get_policy()
+    children = node.children
+    running = {}  # position -> (task, deferral)
+    
+    def start(position):
+        deferral = speculation.Deferral()
+        coroutine = children[position].evaluate_async(executor_func, verify_hash, script_hashes)
+        running[position] = (asyncio.create_task(speculation.run_deferred(deferral, coroutine)), deferral)
+    
+    result = not decisive_result
+    try:
+        for position, child in enumerate(children):
+            if position not in running:
+                start(position)
+            # Run ahead only over side-effect-free children, and only from one
+            ahead = position
+            while policy.speculable(children[ahead]) and ahead + 1 < len(children) \
+                    and policy.speculable(children[ahead + 1]):
+                ahead += 1
+                if ahead not in running:
+                    print(f"Speculatively starting {children[ahead]}")
+                    start(ahead)
+            
+            task, deferral = running.pop(position)
+            deferral.commit()
+            if await task == decisive_result:
+                result = decisive_result
+                print(f"Circuit breaking {'OR' if decisive_result else 'AND'}: stopping at first "
+                      f"{'TRUE' if decisive_result else 'FALSE'} result")
+                _emit_short_circuit(node, child, children[position + 1:])
+                break
+    finally:
+        # Outcome decided (or evaluation cancelled): drop the speculative work
+        for task, _ in running.values():
+            task.cancel()
+        if running:
+            await asyncio.gather(*(task for task, _ in running.values()), return_exceptions=True)
+            print(f"Cancelled {len(running)} speculative node(s) of {node.path}")
+    
+    node.result = result
+    return result
+
+class AndNode(LogicalOperatorNode):
+    """Node representing an AND operator"""
+    __slots__ = ('circuit_breaking',)
+    
+    def __init__(self, circuit_breaking=True, children=None):
+        super().__init__("&&" if circuit_breaking else "&", children)
+        self.circuit_breaking = circuit_breaking
+    
+    def evaluate(self, executor_func, verify_hash=False, script_hashes=None):
+        """Evaluate AND node with or without circuit breaking"""
+        result = True
+        children = self.children
+        
+        for position, child in enumerate(children):
+            child_result = child.evaluate(executor_func, verify_hash, script_hashes)
+            
+            if not child_result:
+                result = False
+                # Circuit breaking: if any child is false, stop evaluation
+                if self.circuit_breaking:
+                    print(f"Circuit breaking AND: stopping at first FALSE result")
+                    _emit_short_circuit(self, child, children[position + 1:])
+                    break
+        
+        self.result = result
+        return result
+    
+    async def evaluate_async(self, executor_func, verify_hash=False, script_hashes=None):
+        """Evaluate AND node: '&&' children one after another, '&' children concurrently"""
+        if self.circuit_breaking and speculation.get_policy() is not None:
+            return await _evaluate_speculatively(self, False, executor_func, verify_hash, script_hashes)
+        if not self.circuit_breaking:
+            child_results = await asyncio.gather(
+                *(child.evaluate_async(executor_func, verify_hash, script_hashes) for child in self.children))
+            self.result = all(child_results)
+            return self.result
+        
+        result = True
+        children = self.children
+        for position, child in enumerate(children):
+            if not await child.evaluate_async(executor_func, verify_hash, script_hashes):
+                result = False
+                print(f"Circuit breaking AND: stopping at first FALSE result")
+                _emit_short_circuit(self, child, children[position + 1:])
+                break
+        
+        self.result = result
+        return result
+
+class OrNode(LogicalOperatorNode):
+    """Node representing an OR operator"""
+    __slots__ = ('circuit_breaking',)
+    
+    def __init__(self, circuit_breaking=True, children=None):
+        super().__init__("||" if circuit_breaking else "|", children)
+        self.circuit_breaking = circuit_breaking
+    
+    def evaluate(self, executor_func, verify_hash=False, script_hashes=None):
+        """Evaluate OR node with or without circuit breaking"""
+        result = False
+        children = self.children
+        
+        for position, child in enumerate(children):
+            child_result = child.evaluate(executor_func, verify_hash, script_hashes)
+            
+            if child_result:
+                result = True
+                # Circuit breaking: if any child is true, stop evaluation
+                if self.circuit_breaking:
+                    print(f"Circuit breaking OR: stopping at first TRUE result")
+                    _emit_short_circuit(self, child, children[position + 1:])
+                    break
+        
+        self.result = result
+        return result
+    
+    async def evaluate_async(self, executor_func, verify_hash=False, script_hashes=None):
+        """Evaluate OR node: '||' children one after another, '|' children concurrently"""
+        if self.circuit_breaking and speculation.get_policy() is not None:
+            return await _evaluate_speculatively(self, True, executor_func, verify_hash, script_hashes)
+        if not self.circuit_breaking:
+            child_results = await asyncio.gather(
+                *(child.evaluate_async(executor_func, verify_hash, script_hashes) for child in self.children))
+            self.result = any(child_results)
+            return self.result
+        
+        result = False
+        children = self.children
+        for position, child in enumerate(children):
+            if await child.evaluate_async(executor_func, verify_hash, script_hashes):
+                result = True
+                print(f"Circuit breaking OR: stopping at first TRUE result")
+                _emit_short_circuit(self, child, children[position + 1:])
+                break
+        
+        self.result = result
+        return result
+    
+def validate_expression_format(expression):
+    """Basic validation of expression format. Returns (True, None) if valid, 
+    or (False, error_message) if invalid."""
+    
+    # Check balanced brackets
+    if expression.count('[') != expression.count(']'):
+        open_count = expression.count('[')
+        close_count = expression.count(']')
+        if open_count > close_count:
+            return False, f"Unbalanced brackets: {open_count} opening '[' but only {close_count} closing ']'"
+        else:
+            return False, f"Unbalanced brackets: {close_count} closing ']' but only {open_count} opening '['"
+    
+    # Check balanced parentheses
+    if expression.count('(') != expression.count(')'):
+        open_count = expression.count('(')
+        close_count = expression.count(')')
+        if open_count > close_count:
+            return False, f"Unbalanced parentheses: {open_count} opening '(' but only {close_count} closing ')'"
+        else:
+            return False, f"Unbalanced parentheses: {close_count} closing ')' but only {open_count} opening '('"
+    
+    # Check for valid operators
+    valid_operators = ["&&", "||", "&", "|", "!"]
+    i = 0
+    while i < len(expression):
+        # Skip whitespace, brackets, parentheses, commas, colons, and alphanumeric characters
+        # '.', '-', '_', '/', '\' to the list of allowed characters for filenames
+        if (expression[i].isspace() or expression[i] in "[](),.:_-/\\" or 
+            expression[i].isalnum() or expression[i] == '_'):
+            i += 1
+            continue
+            
+        # Check for quotes (for arguments)
+        if expression[i] == '"':
+            i += 1
+            # Skip until matching quote, handling escaped quotes
+            while i < len(expression):
+                if i >= len(expression):
+                    return False, f"Unclosed quote starting at position {i-1}"
+                if expression[i] == '\\' and i+1 < len(expression):
+                    i += 2  # Skip escape and next char
+                elif expression[i] == '"':
+                    i += 1
+                    break
+                else:
+                    i += 1
+            continue
+            
+        # Check for valid operators
+        found_valid = False
+        for op in valid_operators:
+            if i+len(op) <= len(expression) and expression[i:i+len(op)] == op:
+                i += len(op)
+                found_valid = True
+                break
+                
+        if not found_valid:
+            return False, f"Invalid operator or character at position {i}: '{expression[i]}'"
+    
+    # Check for operators without brackets
+    for op in ["&&", "||", "&", "|"]:
+        i = 0
+        while i < len(expression):
+            i = expression.find(op, i)
+            if i == -1:
+                break
+                
+            # Skip if part of another operator
+            if op in ["&", "|"] and i+1 < len(expression) and expression[i+1] == expression[i]:
+                i += 1
+                continue
+            
+            # Find next non-whitespace character
+            j = i + len(op)
+            while j < len(expression) and expression[j].isspace():
+                j += 1
+                
+            if j >= len(expression) or expression[j] != '[':
+                return False, f"Operator '{op}' at position {i} must be followed by '['"
+                
+            i += len(op)
+    
+    return True, None
+
+def print_expression_help():
+    """Print the expression syntax, after an invalid expression."""
+    print("\nPlease use one of these formats and Valid operators:")
+    print("   &&                           - Circuit Breaking AND operator")
+    print("   ||                           - Circuit Breaking OR operator")
+    print("   |                            - OR operator")
+    print("   &                            - AND operator")
+    print("   !                            - NOT operator")
+    print("  (A)                           - Simple script")
+    print("  (A:arg1,arg2)                 - Script with arguments")
+    print("  && [ (A), (B) ]               - AND operator with children")
+    print("  || [ (A), (B) ]               - OR operator with children") 
+    print("  !(A)                          - NOT operator with script")
+    print("  || [ && [ (A), (E), (B) ], !(C) ]  - Complex expression")
+    print("  (A:\\\"x,y\\\")                   - Quoted argument (keeps x,y together as one argument)")
+    print("  (A:\\\"x,y\\\", arg2)             - x,y as arg1 and regular arg2")
+    print("  (A:\\\"\\\\\\\"x\\\\\\\"\")              - To include quotes as part of the argument 'x' ")
+
+# Parser functions
+def parse_logical_expression(expression):
+    """Parse a logical expression string into a syntax tree."""
+    # Validate basic expression format first
+    is_valid, error_msg = validate_expression_format(expression)
+    if not is_valid:
+        print(f"Error in expression format: {error_msg}")
+        print_expression_help()
+        return None
+    
+    # First normalize the spacing but preserve spaces between commas
+    expression = normalize_expression(expression)
+    
+    # Print the normalized expression to help debug
+    # print(f"Normalized expression: {expression}")
+    
+    # Parse the expression
+    node, pos = parse_expression(expression, 0)
+    
+    # Make sure we consumed the entire expression
+    if pos < len(expression):
+        print(f"Warning: Expression parsing stopped at position {pos}/{len(expression)}. Remainder: '{expression[pos:]}'")
+    
+    if node is not None:
+        assign_node_paths(node)
+    
+    return node
+
+def assign_node_paths(node, path="0"):
+    """Give every node a stable path: the root is "0", its children "0.0", "0.1", ..."""
+    node.path = path
+    if isinstance(node, NotNode):
+        if node.child is not None:
+            assign_node_paths(node.child, f"{path}.0")
+    elif isinstance(node, LogicalOperatorNode):
+        for index, child in enumerate(node.children):
+            assign_node_paths(child, f"{path}.{index}")
+
+def normalize_expression(expression):
+    """Normalize the spacing around brackets, parentheses and commas."""
+    expression = re.sub(r'\s*\[\s*', ' [ ', expression)
+    expression = re.sub(r'\s*\]\s*', ' ] ', expression)
+    expression = re.sub(r'\s*\(\s*', ' ( ', expression)
+    expression = re.sub(r'\s*\)\s*', ' ) ', expression)
+    expression = re.sub(r'\s*,\s*', ', ', expression)
+    return re.sub(r'\s+', ' ', expression).strip()
+
+def parse_expression(expr, pos):
+    """Recursive function to parse a logical expression."""
+    # Skip whitespace
+    while pos < len(expr) and expr[pos].isspace():
+        pos += 1
+    
+    if pos >= len(expr):
+        return None, pos
+    
+    # Check for NOT operator
+    if expr[pos] == "!":
+        node = NotNode()
+        pos += 1  # Skip the ! character
+        
+        # Skip whitespace after !
+        while pos < len(expr) and expr[pos].isspace():
+            pos += 1
+            
+        # Parse the child expression
+        if pos < len(expr):
+            child, pos = parse_expression(expr, pos)
+            if child:
+                node.child = child
+            else:
+                print("Warning: Missing expression after NOT operator")
+        else:
+            print("Warning: Missing expression after NOT operator")
+            
+        return node, pos
+    # Check for operator type
+    elif expr[pos:pos+2] == "&&":
+        # Circuit-breaking AND
+        node = AndNode(circuit_breaking=True)
+        pos = parse_operator_children(expr, pos+2, node)
+        return node, pos
+    elif expr[pos:pos+2] == "||":
+        # Circuit-breaking OR
+        node = OrNode(circuit_breaking=True)
+        pos = parse_operator_children(expr, pos+2, node)
+        return node, pos
+    elif expr[pos] == "&" and (pos+1 >= len(expr) or expr[pos+1] != "&"):
+        # Normal AND
+        node = AndNode(circuit_breaking=False)
+        pos = parse_operator_children(expr, pos+1, node)
+        return node, pos
+    elif expr[pos] == "|" and (pos+1 >= len(expr) or expr[pos+1] != "|"):
+        # Normal OR
+        node = OrNode(circuit_breaking=False)
+        pos = parse_operator_children(expr, pos+1, node)
+        return node, pos
+    elif expr[pos] == "(":
+        # Script node with parentheses
+        return parse_script_node(expr, pos)
+    else:
+        print(f"Warning: Unexpected character at position {pos}: '{expr[pos]}'")
+        # Try to recover by looking for the next recognizable token
+        while pos < len(expr) and expr[pos] not in "()[],&|":
+            pos += 1
+        return None, pos
+
+def parse_script_node(expr, pos):
+    """Parse a script node with exact format (Name) or (Name:arg1,arg2)."""
+    # Skip the opening parenthesis
+    pos += 1
+    
+    # Find the end of the script part (either at : or ))
+    colon_pos = expr.find(':', pos)
+    close_pos = expr.find(')', pos)
+    
+    if colon_pos != -1 and colon_pos < close_pos:
+        # Has arguments
+        script_name = expr[pos:colon_pos].strip()
+        args_str = expr[colon_pos+1:close_pos].strip()
+        
+        # Parse arguments with proper handling of quotes
+        args = []
+        if args_str:
+            i = 0
+            current_arg = []
+            in_quotes = False
+            
+            while i < len(args_str):
+                char = args_str[i]
+                
+                # Handle escaped characters
+                if char == '\\' and i + 1 < len(args_str):
+                    current_arg.append(args_str[i+1])
+                    i += 2
+                    continue
+                
+                # Handle quotes
+                elif char == '"':
+                    in_quotes = not in_quotes
+                    current_arg.append(char)  # Keep quotes in the argument for now
+                    i += 1
+                    continue
+                
+                # Handle commas outside quotes
+                elif char == ',' and not in_quotes:
+                    arg_str = ''.join(current_arg).strip()
+                    # Strip surrounding quotes if present
+                    if arg_str.startswith('"') and arg_str.endswith('"') and len(arg_str) >= 2:
+                        arg_str = arg_str[1:-1]  # Remove surrounding quotes
+                    args.append(arg_str)
+                    current_arg = []
+                    i += 1
+                    continue
+                
+                # Regular character
+                else:
+                    current_arg.append(char)
+                    i += 1
+            
+            # Add the last argument
+            if current_arg:
+                arg_str = ''.join(current_arg).strip()
+                # Strip surrounding quotes if present
+                if arg_str.startswith('"') and arg_str.endswith('"') and len(arg_str) >= 2:
+                    arg_str = arg_str[1:-1]  # Remove surrounding quotes
+                args.append(arg_str)
+        
+        pos = close_pos + 1
+    else:
+        # No arguments
+        script_name = expr[pos:close_pos].strip()
+        args = []
+        pos = close_pos + 1
+        
+    return ScriptNode(script_name, args), pos
+
+def parse_operator_children(expr, pos, node):
+    """Parse children of a logical operator."""
+    # Skip whitespace
+    while pos < len(expr) and expr[pos].isspace():
+        pos += 1
+    
+    # Check for opening bracket
+    if pos < len(expr) and expr[pos] == "[":
+        pos += 1  # Skip opening bracket
+        
+        # Parse children until closing bracket
+        while pos < len(expr) and expr[pos] != "]":
+            # Skip whitespace and commas
+            while pos < len(expr) and (expr[pos].isspace() or expr[pos] == ","):
+                pos += 1
+            
+            # Check if we're at the end of children
+            if pos < len(expr) and expr[pos] != "]":
+                child, pos = parse_expression(expr, pos)
+                if child:
+                    node.add_child(child)
+            else:
+                break
+        
+        # Skip closing bracket
+        if pos < len(expr) and expr[pos] == "]":
+            pos += 1
+        else:
+            print(f"Warning: Missing closing bracket for operator '{node.operator}'")
+    else:
+        print(f"Warning: Missing opening bracket for operator '{node.operator}'")
+    
+    return pos
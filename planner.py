@@ -0,0 +1,208 @@
+"""
+Cost and outcome estimates of an expression tree, without executing it.
+
+Every script node gets an estimated runtime and success probability from
+its recorded executions (run_analytics, or run_history). Operator nodes combine their
+children, assuming independent outcomes:
+
+    &&  children run in order until one fails
+        P = p1 * p2 * ...        E[cost] = c1 + p1 * (c2 + p2 * (c3 + ...))
+    ||  children run in order until one succeeds
+        P = 1 - (1-p1)(1-p2)...  E[cost] = c1 + (1-p1) * (c2 + (1-p2) * (...))
+    & / |  every child runs (concurrently with --async)
+    !   inverts the probability, same cost
+
+Costs are script-seconds (the work done); the worst case runs every
+script. The critical path is the longest chain of scripts that must run
+one after another when '&' and '|' children run concurrently, i.e. the
+worst-case wall time of an --async run.
+"""
+import collections
+import hashlib
+import json
+import statistics
+
+# Executions needed before the statistics of one argument list are used
+# instead of those of the script over all its argument lists
+MIN_ARGS_SAMPLES = 3
+
+# Runtime assumed for scripts that were never recorded, if no other script was either
+DEFAULT_RUNTIME = 1.0
+
+Estimate = collections.namedtuple("Estimate", "runtime success_probability samples")
+
+NodePlan = collections.namedtuple(
+    "NodePlan", "success_probability expected_cost worst_cost critical_time critical_path")
+
+
+def args_key(args):
+    """64-bit key of an argument list, stable across processes."""
+    digest = hashlib.md5(json.dumps(list(args)).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'little')
+
+
+class HistoryEstimator:
+    """
+    Runtime and success estimates from recorded executions.
+
+    Args:
+        by_script (dict): script_name -> Estimate over all its argument lists
+        by_args (dict): (script_name, args_key) -> Estimate
+
+    The runtime is the median duration; the success probability is
+    smoothed ((successes + 1) / (runs + 2)), so a script with few runs is
+    not planned as certain to pass or fail. Use from_executions for raw
+    run-history rows, or run_analytics.ColumnStore.estimates.
+    """
+    def __init__(self, by_script, by_args):
+        self._by_script = by_script
+        self._by_args = {key: estimate for key, estimate in by_args.items()
+                         if estimate.samples >= MIN_ARGS_SAMPLES}
+        known = [estimate.runtime for estimate in by_script.values()]
+        self.default_runtime = statistics.median(known) if known else DEFAULT_RUNTIME
+
+    @classmethod
+    def from_executions(cls, executions):
+        """
+        Args:
+            executions: (script_name, args, result, duration) tuples, as returned
+                        by RunHistoryStore.fetch_script_executions
+        """
+        by_script = collections.defaultdict(list)
+        by_args = collections.defaultdict(list)
+        for script_name, args, result, duration in executions:
+            by_script[script_name].append((result, duration))
+            by_args[(script_name, args_key(args))].append((result, duration))
+        return cls({name: cls._summarize(runs) for name, runs in by_script.items()},
+                   {key: cls._summarize(runs) for key, runs in by_args.items()})
+
+    @staticmethod
+    def _summarize(runs):
+        successes = sum(1 for result, _ in runs if result == 0)
+        return Estimate(statistics.median(duration for _, duration in runs),
+                        (successes + 1) / (len(runs) + 2), len(runs))
+
+    def estimate(self, script_name, args):
+        """Estimate for one script node; samples is 0 when nothing was recorded."""
+        estimate = self._by_args.get((script_name, args_key(args)))
+        if estimate is None:
+            estimate = self._by_script.get(script_name)
+        if estimate is None:
+            return Estimate(self.default_runtime, 0.5, 0)
+        return estimate
+
+
+def plan_tree(node, estimate_func, plans=None):
+    """
+    Compute the NodePlan of node and of every node below it.
+
+    Args:
+        node: Root of an expression tree (foo nodes or compact_tree views)
+        estimate_func: estimate_func(script_name, args) -> Estimate
+
+    Returns:
+        dict: node path -> NodePlan
+    """
+    if plans is None:
+        plans = {}
+
+    if hasattr(node, 'name'):  # Script
+        estimate = estimate_func(node.name, node.args)
+        plan = NodePlan(estimate.success_probability, estimate.runtime, estimate.runtime,
+                        estimate.runtime, [node.path])
+    elif hasattr(node, 'child'):  # NOT
+        if node.child is None:
+            plan = NodePlan(0.0, 0.0, 0.0, 0.0, [])
+        else:
+            child = plan_tree(node.child, estimate_func, plans)[node.child.path]
+            plan = child._replace(success_probability=1.0 - child.success_probability)
+    else:
+        children = [plan_tree(child, estimate_func, plans)[child.path] for child in node.children]
+        plan = _combine(node.operator, children)
+
+    plans[node.path] = plan
+    return plans
+
+
+def _combine(operator, children):
+    worst_cost = sum(child.worst_cost for child in children)
+    if operator in ("&", "|"):
+        # Every child runs, side by side
+        slowest = max(children, key=lambda child: child.critical_time, default=None)
+        critical_time = slowest.critical_time if slowest else 0.0
+        critical_path = list(slowest.critical_path) if slowest else []
+        expected_cost = worst_cost
+    else:
+        # Children run one after another; later ones only while the outcome is open
+        critical_time = sum(child.critical_time for child in children)
+        critical_path = [path for child in children for path in child.critical_path]
+        expected_cost = 0.0
+        for child in reversed(children):
+            go_on = child.success_probability if operator == "&&" else 1.0 - child.success_probability
+            expected_cost = child.expected_cost + go_on * expected_cost
+
+    if operator in ("&&", "&"):
+        success_probability = 1.0
+        for child in children:
+            success_probability *= child.success_probability
+    else:
+        failure_probability = 1.0
+        for child in children:
+            failure_probability *= 1.0 - child.success_probability
+        success_probability = 1.0 - failure_probability
+    return NodePlan(success_probability, expected_cost, worst_cost, critical_time, critical_path)
+
+
+def _label(node):
+    if hasattr(node, 'name'):
+        return f"({node.name}:{','.join(node.args)})" if node.args else f"({node.name})"
+    if hasattr(node, 'child'):
+        return "!"
+    return f"{node.operator} [...]"
+
+
+def print_plan(node, plans, estimate_func, statuses, depth=0):
+    """
+    Print the annotated tree.
+
+    Args:
+        statuses (dict): script name -> verification status shown next to it
+    """
+    plan = plans[node.path]
+    label = "  " * depth + _label(node)
+    line = (f"{label:<40} P(success)={plan.success_probability:5.1%}  "
+            f"E[cost]={plan.expected_cost:8.2f}s  worst={plan.worst_cost:8.2f}s")
+    if hasattr(node, 'name'):
+        estimate = estimate_func(node.name, node.args)
+        history = f"{estimate.samples} run(s)" if estimate.samples else "no history"
+        line += f"  [{statuses.get(node.name, '?')}, {history}]"
+    print(line)
+
+    if hasattr(node, 'child'):
+        if node.child is not None:
+            print_plan(node.child, plans, estimate_func, statuses, depth + 1)
+    elif not hasattr(node, 'name'):
+        for child in node.children:
+            print_plan(child, plans, estimate_func, statuses, depth + 1)
+
+
+def script_nodes(node):
+    """node path -> script node, for every script below node."""
+    if hasattr(node, 'name'):
+        return {node.path: node}
+    if hasattr(node, 'child'):
+        return script_nodes(node.child) if node.child is not None else {}
+    nodes = {}
+    for child in node.children:
+        nodes.update(script_nodes(child))
+    return nodes
+
+
+def print_summary(tree, plans):
+    plan = plans[tree.path]
+    nodes = script_nodes(tree)
+    print(f"\nP(success):            {plan.success_probability:.1%}")
+    print(f"Expected cost:         {plan.expected_cost:.2f}s of script time (with short-circuiting)")
+    print(f"Worst-case cost:       {plan.worst_cost:.2f}s (every script runs)")
+    print(f"Critical path (async): {plan.critical_time:.2f}s  "
+          + " -> ".join(_label(nodes[path]) for path in plan.critical_path))
@@ -0,0 +1,77 @@
+import argparse
+import os
+import sys
+
+import directory_hash
+import folder_manifest
+import hash_store
+
+def print_diff(diff):
+    """Print the added / changed / unchanged entries of a registration diff."""
+    for script_name, hash_value in diff["added"]:
+        print(f"  + {script_name}: {hash_value}")
+    for script_name, old_hash, new_hash in diff["changed"]:
+        print(f"  ~ {script_name}: {old_hash} -> {new_hash}")
+    for script_name, hash_value in diff["unchanged"]:
+        print(f"  = {script_name}: {hash_value}")
+    print(f"\n{len(diff['added'])} added, {len(diff['changed'])} changed, "
+          f"{len(diff['unchanged'])} unchanged")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Hash every script folder under a directory and register the hashes in the hash store.")
+    parser.add_argument("root", nargs="?", default=os.getcwd(),
+                        help="Directory containing the script folders (default: current directory)")
+    parser.add_argument("--names", help="Comma-separated list of script folders to register (default: all)")
+    parser.add_argument("--workers", type=int, default=8, help="Number of folders hashed in parallel")
+    parser.add_argument("--dry-run", action="store_true", help="Show the diff without writing to the store")
+    parser.add_argument("--write-manifests", action="store_true",
+                        help="Also write a signed .hashmanifest into each folder (key from HASH_MANIFEST_KEY)")
+    args = parser.parse_args(argv)
+
+    names = args.names.split(',') if args.names else None
+    folders = directory_hash.find_script_folders(args.root, names)
+    if not folders:
+        print(f"Error: No script folders found under '{args.root}'")
+        return 1
+
+    print(f"Hashing {len(folders)} script folder(s) with {args.workers} worker(s)...")
+    exclude_dirs = ['__pycache__', '.git', '.vscode']
+    hashes = directory_hash.generate_hashes_for_directories(
+        folders, exclude_dirs, max_workers=args.workers, verbose=False)
+
+    # Empty folders have no hash and cannot be registered
+    empty = sorted(name for name, hash_value in hashes.items() if hash_value is None)
+    for script_name in empty:
+        print(f"Warning: Skipping '{script_name}' (nothing to hash)")
+        del hashes[script_name]
+
+    if args.write_manifests and not args.dry_run:
+        key = folder_manifest.load_key()
+        if key is None:
+            print("Warning: No manifest key configured, manifests are written unsigned")
+        for folder in folders:
+            script_name = os.path.basename(os.path.normpath(folder))
+            if script_name not in hashes:
+                continue
+            manifest = folder_manifest.write_manifest(folder, exclude_dirs, key)
+            # The root digest is the directory hash, so it is what gets registered
+            if manifest["root_digest"] != hashes[script_name]:
+                print(f"Warning: '{script_name}' changed while hashing; registering its manifest digest")
+                hashes[script_name] = manifest["root_digest"]
+    
+    store = hash_store.get_hash_store()
+    try:
+        if args.dry_run:
+            diff = hash_store.diff_hashes(store.fetch_hashes(), hashes)
+            print("\nDry run, nothing written:")
+        else:
+            diff = store.upsert_hashes(hashes)
+            print(f"\nRegistered {len(hashes)} hash(es) in the {store.backend_name} hash store:")
+        print_diff(diff)
+    finally:
+        hash_store.close_hash_store()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
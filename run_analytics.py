@@ -0,0 +1,392 @@
+"""
+Columnar copy of the run history for fast analytics.
+
+    python run_analytics.py sync                         # copy new executions from the run history
+    python run_analytics.py report                       # p50/p95/p99 and failure rate per script
+    python run_analytics.py report --by script,args      # ... per argument list
+    python run_analytics.py report --by script,day --scripts A,B --since-days 30
+
+Every execution is one row of fixed-width columns, each kept in its own
+raw binary file and read back as a memory-mapped NumPy array:
+
+    script.bin      int32    index into meta.json "scripts"
+    args.bin        uint64   planner.args_key of the argument list (meta.json "args")
+    log.bin         int32    index into meta.json "logs"
+    result.bin      int8     0 success, 1 failure
+    start_time.bin  float64  epoch seconds
+    duration.bin    float64  seconds
+
+Grouped statistics sort the selected rows once (numpy.lexsort) and reduce
+every group with array operations. sync also stores the per-script and
+per-argument-list statistics in summary.json, from which the planner
+(foo.py --plan) reads its estimates in milliseconds.
+
+sync appends the history rows recorded after the last row it copied
+(run_history row ids). On SQL Server a row id is taken at insert time, so
+a row can commit after higher ids were copied: ids missing below the last
+copied row are kept as gaps and read again by every sync, until they are
+SYNC_WINDOW ids behind. Rows are copied once, by row id.
+NumPy is optional for the rest of the package; this module needs it.
+
+Configuration:
+    RUN_ANALYTICS_DIR   Store directory (default ".run_analytics")
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import hash_store
+import planner
+import run_history
+
+DEFAULT_DIR = os.environ.get("RUN_ANALYTICS_DIR", ".run_analytics")
+META_FILE = "meta.json"
+SUMMARY_FILE = "summary.json"  # Planner statistics, recomputed by sync
+PERCENTILES = (50, 95, 99)
+GROUP_KEYS = ("script", "args", "log", "day")
+# Row ids a missing run-history row may trail the last copied one by and
+# still be copied: longer than any insert transaction stays open
+SYNC_WINDOW = 100000
+
+# Column name -> dtype
+COLUMNS = {
+    "script": "int32",
+    "args": "uint64",
+    "log": "int32",
+    "result": "int8",
+    "start_time": "float64",
+    "duration": "float64",
+}
+
+
+def available():
+    return np is not None
+
+
+class ColumnStore:
+    """
+    Run-history executions in columnar files under directory.
+
+    Raises:
+        RuntimeError: If NumPy is not installed
+    """
+    def __init__(self, directory=None):
+        if np is None:
+            raise RuntimeError("Run analytics needs NumPy (pip install numpy)")
+        self.directory = directory or DEFAULT_DIR
+        self.meta = self._load_meta()
+        self._script_ids = {name: i for i, name in enumerate(self.meta["scripts"])}
+        self._log_ids = {log_id: i for i, log_id in enumerate(self.meta["logs"])}
+
+    @property
+    def rows(self):
+        return self.meta["rows"]
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _load_meta(self):
+        try:
+            with open(self._path(META_FILE), 'r') as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            return self._empty_meta()
+        if "synced_row" not in meta:
+            # Synced by end time before rows were tracked: copy the history again
+            print(f"Run analytics store {self.directory} predates row tracking, it is rebuilt on sync")
+            return self._empty_meta()
+        meta.setdefault("gaps", [])
+        return meta
+
+    @staticmethod
+    def _empty_meta():
+        # synced_until: time of the last sync; synced_row: highest run-history row copied;
+        # gaps: [first, last] row id ranges below synced_row not seen yet
+        return {"rows": 0, "synced_until": 0.0, "synced_row": 0, "gaps": [],
+                "scripts": [], "logs": [], "args": {}}
+
+    def _save_meta(self):
+        temp_path = self._path(META_FILE + ".tmp")
+        with open(temp_path, 'w') as f:
+            json.dump(self.meta, f)
+        os.replace(temp_path, self._path(META_FILE))
+
+    def column(self, name):
+        """Read-only memory map of a column (an empty array for an empty store)."""
+        if not self.rows:
+            return np.empty(0, dtype=COLUMNS[name])
+        return np.memmap(self._path(f"{name}.bin"), dtype=COLUMNS[name], mode='r', shape=(self.rows,))
+
+    def _encode(self, ids, values, key):
+        encoded = []
+        for value in values:
+            if value not in ids:
+                ids[value] = len(self.meta[key])
+                self.meta[key].append(value)
+            encoded.append(ids[value])
+        return encoded
+
+    def append(self, executions, synced_row, gaps):
+        """
+        Append (log_id, script_name, args, result, start_time, end_time) tuples,
+        copied from the run history up to row synced_row except the gaps.
+
+        Column files are cut back to the committed row count first, so rows
+        of an append interrupted before meta.json was saved are dropped.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        if executions:
+            arg_keys = []
+            for _, _, args, _, _, _ in executions:
+                key = planner.args_key(args)
+                self.meta["args"].setdefault(f"{key:016x}", args)
+                arg_keys.append(key)
+            values = {
+                "script": self._encode(self._script_ids, [e[1] for e in executions], "scripts"),
+                "args": arg_keys,
+                "log": self._encode(self._log_ids, [e[0] for e in executions], "logs"),
+                "result": [0 if e[3] == 0 else 1 for e in executions],
+                "start_time": [e[4] for e in executions],
+                "duration": [e[5] - e[4] for e in executions],
+            }
+            for name, dtype in COLUMNS.items():
+                path = self._path(f"{name}.bin")
+                with open(path, 'ab') as f:
+                    f.truncate(self.rows * np.dtype(dtype).itemsize)
+                    f.write(np.asarray(values[name], dtype=dtype).tobytes())
+            self.meta["rows"] += len(executions)
+        self.meta["synced_row"] = synced_row
+        self.meta["gaps"] = [list(gap) for gap in gaps]
+        self.meta["synced_until"] = time.time()
+        self._save_meta()
+
+    def sync(self, history_store):
+        """
+        Append the executions recorded since the last sync.
+
+        Returns:
+            int: Number of rows appended
+        """
+        synced_row = self.meta["synced_row"]
+        gaps = [tuple(gap) for gap in self.meta["gaps"]]
+        appended = 0
+        for rows in history_store.iter_executions_after(gaps[0][0] - 1 if gaps else synced_row):
+            executions = []
+            for row_id, execution in rows:
+                if row_id > synced_row:
+                    if row_id > synced_row + 1:
+                        gaps.append((synced_row + 1, row_id - 1))
+                    synced_row = row_id
+                elif not _fill_gap(gaps, row_id):
+                    continue  # Copied by an earlier sync
+                if execution is not None:
+                    executions.append(execution)
+            # Ids missing for too long belong to rolled back inserts
+            gaps = [gap for gap in gaps if gap[1] > synced_row - SYNC_WINDOW]
+            self.append(executions, synced_row, gaps)
+            appended += len(executions)
+        self.append([], synced_row, gaps)
+        if appended or not os.path.exists(self._path(SUMMARY_FILE)):
+            self.write_summary()
+        return appended
+
+    def _summarize(self, by):
+        """{key: [p50, runs, failures]} for group keys ('script',) or ('script', 'args')"""
+        stats = self.group_stats(by)
+        summary = {}
+        for i, script_id in enumerate(stats["keys"][0]):
+            name = self.meta["scripts"][script_id]
+            key = name if len(by) == 1 else f"{name}:{int(stats['keys'][1][i]):016x}"
+            summary[key] = [float(stats["p50"][i]), int(stats["runs"][i]), int(stats["failures"][i])]
+        return summary
+
+    def write_summary(self):
+        """Store the per-script and per-argument-list statistics read by estimates()."""
+        summary = {
+            "rows": self.rows,
+            "script": self._summarize(("script",)),
+            "script_args": self._summarize(("script", "args")),
+        }
+        temp_path = self._path(SUMMARY_FILE + ".tmp")
+        with open(temp_path, 'w') as f:
+            json.dump(summary, f)
+        os.replace(temp_path, self._path(SUMMARY_FILE))
+        return summary
+
+    def group_stats(self, by=("script",), scripts=None, since=None):
+        """
+        Runs, failures, mean and percentile durations per group.
+
+        Args:
+            by (tuple): Group keys from GROUP_KEYS, in order
+            scripts: Only these script names (default: all)
+            since (float): Only executions started at or after this epoch time
+
+        Returns:
+            dict: 'keys' (one array per group key), 'runs', 'failures', 'mean'
+                  and 'p<N>' for each of PERCENTILES; one entry per group,
+                  sorted by the group keys
+        """
+        mask = np.ones(self.rows, dtype=bool)
+        script = self.column("script")
+        if scripts is not None:
+            ids = [self._script_ids[name] for name in scripts if name in self._script_ids]
+            mask &= np.isin(script, ids)
+        start_time = self.column("start_time")
+        if since is not None:
+            mask &= start_time >= since
+
+        key_columns = {
+            "script": lambda: script[mask],
+            "args": lambda: self.column("args")[mask],
+            "log": lambda: self.column("log")[mask],
+            "day": lambda: (start_time[mask] // 86400).astype(np.int64),
+        }
+        keys = [key_columns[key]() for key in by]
+        duration = self.column("duration")[mask]
+        failed = self.column("result")[mask] != 0
+
+        stats = {"keys": [], "runs": np.empty(0, dtype=np.int64), "failures": np.empty(0),
+                 "mean": np.empty(0)}
+        stats.update({f"p{q}": np.empty(0) for q in PERCENTILES})
+        if not len(duration):
+            stats["keys"] = [key[:0] for key in keys]
+            return stats
+
+        # Sort by the group keys (first one primary), then by duration within each group
+        order = np.lexsort([duration] + keys[::-1])
+        keys = [key[order] for key in keys]
+        duration = duration[order]
+        failed = failed[order]
+
+        boundary = np.zeros(len(duration), dtype=bool)
+        boundary[0] = True
+        for key in keys:
+            boundary[1:] |= key[1:] != key[:-1]
+        starts = np.flatnonzero(boundary)
+        runs = np.diff(np.append(starts, len(duration)))
+
+        stats["keys"] = [key[starts] for key in keys]
+        stats["runs"] = runs
+        stats["failures"] = np.add.reduceat(failed.astype(np.int64), starts)
+        stats["mean"] = np.add.reduceat(duration, starts) / runs
+        for q in PERCENTILES:
+            # Linear interpolation between the closest ranks, as numpy.percentile
+            position = starts + (runs - 1) * (q / 100.0)
+            lower = np.floor(position).astype(np.int64)
+            upper = np.minimum(lower + 1, starts + runs - 1)
+            fraction = position - lower
+            stats[f"p{q}"] = duration[lower] + (duration[upper] - duration[lower]) * fraction
+        return stats
+
+    def estimates(self, script_names):
+        """
+        Planner estimates of the given scripts (see planner.HistoryEstimator),
+        from the statistics stored by the last sync.
+
+        Returns:
+            tuple: ({script_name: Estimate}, {(script_name, args_key): Estimate})
+        """
+        try:
+            with open(self._path(SUMMARY_FILE), 'r') as f:
+                summary = json.load(f)
+        except FileNotFoundError:
+            summary = None
+        if summary is None or summary["rows"] != self.rows:
+            summary = self.write_summary()
+
+        def estimate(p50, runs, failures):
+            return planner.Estimate(p50, (runs - failures + 1) / (runs + 2), runs)
+
+        script_names = set(script_names)
+        by_script = {name: estimate(*values) for name, values in summary["script"].items()
+                     if name in script_names}
+        by_args = {}
+        for key, values in summary["script_args"].items():
+            name, _, arg_key = key.rpartition(':')
+            if name in script_names:
+                by_args[(name, int(arg_key, 16))] = estimate(*values)
+        return by_script, by_args
+
+    def label(self, key, value):
+        """Readable value of a group key."""
+        if key == "script":
+            return self.meta["scripts"][value]
+        if key == "log":
+            return self.meta["logs"][value]
+        if key == "args":
+            return ",".join(self.meta["args"].get(f"{int(value):016x}", ["?"]))
+        return time.strftime("%Y-%m-%d", time.gmtime(int(value) * 86400))
+
+
+def _fill_gap(gaps, row_id):
+    """Remove row_id from the sorted gap ranges; returns False if it was not in one."""
+    for i, (first, last) in enumerate(gaps):
+        if first <= row_id <= last:
+            gaps[i:i + 1] = [gap for gap in ((first, row_id - 1), (row_id + 1, last)) if gap[0] <= gap[1]]
+            return True
+    return False
+
+
+def print_report(column_store, stats, by, limit=None):
+    header = "  ".join(f"{key:<24}" for key in by)
+    print(f"{header}  {'runs':>8} {'fail%':>6} {'mean':>9} " + " ".join(f"{f'p{q}':>9}" for q in PERCENTILES))
+    groups = len(stats["runs"])
+    for i in range(groups if limit is None else min(groups, limit)):
+        labels = "  ".join(f"{column_store.label(key, stats['keys'][k][i]):<24}" for k, key in enumerate(by))
+        failure_rate = 100.0 * stats["failures"][i] / stats["runs"][i]
+        percentiles = " ".join(f"{stats[f'p{q}'][i]:8.3f}s" for q in PERCENTILES)
+        print(f"{labels}  {stats['runs'][i]:>8} {failure_rate:5.1f}% {stats['mean'][i]:8.3f}s {percentiles}")
+    if limit is not None and groups > limit:
+        print(f"... {groups - limit} more group(s)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Columnar run-history analytics.")
+    parser.add_argument("--dir", default=None, help=f"Store directory (default: {DEFAULT_DIR})")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("sync", help="Append new executions from the run history")
+    report = subparsers.add_parser("report", help="Failure rate and p50/p95/p99 runtimes per group")
+    report.add_argument("--by", default="script", help=f"Comma-separated group keys among {', '.join(GROUP_KEYS)}")
+    report.add_argument("--scripts", help="Comma-separated script names (default: all)")
+    report.add_argument("--since-days", type=float, help="Only executions of the last N days")
+    report.add_argument("--limit", type=int, help="Print at most N groups")
+    args = parser.parse_args(argv)
+
+    if not available():
+        print("Error: Run analytics needs NumPy (pip install numpy)")
+        return 1
+    column_store = ColumnStore(args.dir)
+
+    if args.command == "sync":
+        history_store = run_history.RunHistoryStore(hash_store.get_hash_store())
+        started = time.perf_counter()
+        appended = column_store.sync(history_store)
+        print(f"Appended {appended} execution(s) in {time.perf_counter() - started:.2f}s; "
+              f"{column_store.rows} in {column_store.directory}")
+        return 0
+
+    by = tuple(key.strip() for key in args.by.split(',') if key.strip())
+    unknown = [key for key in by if key not in GROUP_KEYS]
+    if unknown or not by:
+        print(f"Error: Invalid group key(s) {', '.join(unknown) or '(none)'}; expected {', '.join(GROUP_KEYS)}")
+        return 1
+    since = time.time() - args.since_days * 86400 if args.since_days is not None else None
+    started = time.perf_counter()
+    stats = column_store.group_stats(by, args.scripts.split(',') if args.scripts else None, since)
+    elapsed = time.perf_counter() - started
+    print_report(column_store, stats, by, args.limit)
+    print(f"\n{int(stats['runs'].sum())} execution(s) in {len(stats['runs'])} group(s), "
+          f"aggregated in {elapsed * 1000:.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,68 @@
+import contextlib
+import contextvars
+import threading
+
+# Listeners called for every run event, e.g. the run-history writer
+_listeners = []
+_listeners_lock = threading.Lock()
+
+# Details of the script execution in progress (captured output, metrics...),
+# reported with its 'node_end' event
+_current_record = contextvars.ContextVar("current_record", default=None)
+
+def add_listener(listener):
+    """
+    Register a function called as listener(event_type, payload) for every event.
+
+    Listeners run synchronously on the thread that emits the event, so they
+    must be cheap (typically they just hand the payload to a queue).
+    """
+    with _listeners_lock:
+        _listeners.append(listener)
+
+def remove_listener(listener):
+    """Unregister a listener added with add_listener."""
+    with _listeners_lock:
+        if listener in _listeners:
+            _listeners.remove(listener)
+
+def emit(event_type, payload):
+    """
+    Send an event to every registered listener.
+
+    Args:
+        event_type (str): Name of the event, e.g. 'node_end'
+        payload (dict): Event fields
+    """
+    if not _listeners:
+        return
+    with _listeners_lock:
+        listeners = list(_listeners)
+    for listener in listeners:
+        try:
+            listener(event_type, payload)
+        except Exception as e:
+            # A broken listener must never change the outcome of a run
+            print(f"Warning: run event listener failed on '{event_type}': {e}")
+
+@contextlib.contextmanager
+def node_record():
+    """
+    Collect the details of one script execution.
+
+    Code running inside the block, including executor threads started with
+    a copy of the context, adds fields with annotate(); the block yields the
+    dictionary they are added to.
+    """
+    record = {}
+    token = _current_record.set(record)
+    try:
+        yield record
+    finally:
+        _current_record.reset(token)
+
+def annotate(**fields):
+    """Add fields to the record of the script execution in progress, if any."""
+    record = _current_record.get()
+    if record is not None:
+        record.update(fields)
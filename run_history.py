@@ -0,0 +1,383 @@
+import atexit
+import json
+import queue
+import threading
+import time
+
+import hash_store
+import run_events
+
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_FLUSH_INTERVAL = 0.5  # seconds
+
+# Column order of a run-history row
+COLUMNS = ("log_id", "node_path", "script_name", "args", "result", "start_time", "end_time", "details")
+
+# Column order of a run row (one per foo.py invocation)
+RUN_COLUMNS = ("log_id", "expression", "folder_hashes", "start_time", "verification_tiers")
+
+# Columns added after a table was first created, as (table, column, SQL Server
+# type, SQLite type or None if not needed); ensure_schema adds them to tables
+# that predate them
+ADDED_COLUMNS = (
+    ("Aman_run_history", "details", "NVARCHAR(MAX) NULL", "TEXT"),
+    # SQLite tables have an implicit, increasing rowid instead
+    ("Aman_run_history", "row_id", "BIGINT IDENTITY(1,1) NOT NULL", None),
+    ("Aman_runs", "verification_tiers", "NVARCHAR(MAX) NULL", "TEXT"),
+)
+
+
+class RunHistoryStore:
+    """
+    Per-node run results, stored next to the hash table.
+
+    Uses the connection pool and backend (SQL Server or SQLite) of the
+    given hash store, so no extra connections are configured.
+    """
+    def __init__(self, store):
+        self.store = store
+        self.pool = store.pool
+        if store.backend_name == "pyodbc":
+            self.table_name = "INTERN.Aman_run_history"
+            self.runs_table_name = "INTERN.Aman_runs"
+        else:
+            self.table_name = "Aman_run_history"
+            self.runs_table_name = "Aman_runs"
+
+    def create_table_query(self):
+        if self.store.backend_name == "pyodbc":
+            return """
+            IF NOT EXISTS (SELECT * FROM sys.tables t JOIN sys.schemas s ON t.schema_id = s.schema_id
+                          WHERE s.name = 'INTERN' AND t.name = 'Aman_run_history')
+            BEGIN
+                CREATE TABLE INTERN.Aman_run_history (
+                    log_id VARCHAR(100) NOT NULL,
+                    node_path VARCHAR(400) NOT NULL,
+                    script_name VARCHAR(50) NOT NULL,
+                    args NVARCHAR(MAX) NOT NULL,
+                    result INT NOT NULL,
+                    start_time FLOAT NOT NULL,
+                    end_time FLOAT NOT NULL,
+                    details NVARCHAR(MAX) NULL,
+                    row_id BIGINT IDENTITY(1,1) NOT NULL
+                );
+                CREATE INDEX IX_Aman_run_history_log_id ON INTERN.Aman_run_history (log_id);
+            END
+            IF NOT EXISTS (SELECT * FROM sys.tables t JOIN sys.schemas s ON t.schema_id = s.schema_id
+                          WHERE s.name = 'INTERN' AND t.name = 'Aman_runs')
+            BEGIN
+                CREATE TABLE INTERN.Aman_runs (
+                    log_id VARCHAR(100) NOT NULL,
+                    expression NVARCHAR(MAX) NOT NULL,
+                    folder_hashes NVARCHAR(MAX) NOT NULL,
+                    start_time FLOAT NOT NULL,
+                    verification_tiers NVARCHAR(MAX) NULL
+                );
+                CREATE INDEX IX_Aman_runs_log_id ON INTERN.Aman_runs (log_id);
+            END
+            """
+        return """
+        CREATE TABLE IF NOT EXISTS Aman_run_history (
+            log_id VARCHAR(100) NOT NULL,
+            node_path VARCHAR(400) NOT NULL,
+            script_name VARCHAR(50) NOT NULL,
+            args TEXT NOT NULL,
+            result INTEGER NOT NULL,
+            start_time REAL NOT NULL,
+            end_time REAL NOT NULL,
+            details TEXT
+        );
+        CREATE INDEX IF NOT EXISTS IX_Aman_run_history_log_id ON Aman_run_history (log_id);
+        CREATE TABLE IF NOT EXISTS Aman_runs (
+            log_id VARCHAR(100) NOT NULL,
+            expression TEXT NOT NULL,
+            folder_hashes TEXT NOT NULL,
+            start_time REAL NOT NULL,
+            verification_tiers TEXT
+        );
+        CREATE INDEX IF NOT EXISTS IX_Aman_runs_log_id ON Aman_runs (log_id)
+        """
+
+    def ensure_schema(self):
+        """Create the run-history tables if they do not exist yet, or add the columns they lack."""
+        with self.pool.connection() as cnxn:
+            cursor = cnxn.cursor()
+            if self.store.backend_name == "pyodbc":
+                cursor.execute(self.create_table_query())
+            else:
+                for statement in self.create_table_query().split(';'):
+                    cursor.execute(statement)
+            self._add_missing_columns(cursor)
+            if self.store.backend_name == "pyodbc":
+                cursor.execute("""
+                IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = 'IX_Aman_run_history_row_id'
+                               AND object_id = OBJECT_ID('INTERN.Aman_run_history'))
+                    CREATE INDEX IX_Aman_run_history_row_id ON INTERN.Aman_run_history (row_id)
+                """)
+            cnxn.commit()
+            cursor.close()
+
+    def _add_missing_columns(self, cursor):
+        for table, column, server_type, sqlite_type in ADDED_COLUMNS:
+            if self.store.backend_name == "pyodbc":
+                table = f"INTERN.{table}"
+                cursor.execute("SELECT COUNT(*) FROM sys.columns WHERE object_id = OBJECT_ID(?) AND name = ?",
+                               (table, column))
+                if cursor.fetchone()[0] == 0:
+                    cursor.execute(f"ALTER TABLE {table} ADD {column} {server_type}")
+            elif sqlite_type is not None:
+                cursor.execute(f"PRAGMA table_info({table})")
+                if column not in [row[1] for row in cursor.fetchall()]:
+                    cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {sqlite_type}")
+
+    def insert_rows(self, rows, runs=()):
+        """
+        Insert many rows in one batch.
+
+        Args:
+            rows (list): Node rows (tuples in COLUMNS order)
+            runs (list): Run rows (tuples in RUN_COLUMNS order)
+        """
+        with self.pool.connection() as cnxn:
+            cursor = cnxn.cursor()
+            if self.store.backend_name == "pyodbc":
+                cursor.fast_executemany = True
+            for table_name, columns, batch in ((self.runs_table_name, RUN_COLUMNS, runs),
+                                               (self.table_name, COLUMNS, rows)):
+                if batch:
+                    placeholders = ", ".join("?" for _ in columns)
+                    cursor.executemany(
+                        f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({placeholders})", batch)
+            cnxn.commit()
+            cursor.close()
+
+    def fetch_run_info(self, log_id):
+        """
+        Fetch the expression and verified folder hashes recorded for a run.
+
+        Returns:
+            dict: Keys 'log_id', 'expression', 'folder_hashes', 'start_time' and
+                  'verification_tiers', or None if the run was never recorded
+        """
+        with self.pool.connection() as cnxn:
+            cursor = cnxn.cursor()
+            cursor.execute(
+                f"SELECT {', '.join(RUN_COLUMNS)} FROM {self.runs_table_name} WHERE log_id = ? "
+                f"ORDER BY start_time DESC", (log_id,))
+            row = cursor.fetchone()
+            cursor.close()
+        if row is None:
+            return None
+        run_info = dict(zip(RUN_COLUMNS, row))
+        run_info["folder_hashes"] = json.loads(run_info["folder_hashes"])
+        run_info["verification_tiers"] = json.loads(run_info["verification_tiers"] or "{}")
+        return run_info
+
+    def fetch_run(self, log_id):
+        """
+        Fetch every recorded node of a run.
+
+        Returns:
+            list: One dictionary per row, in insertion order
+        """
+        with self.pool.connection() as cnxn:
+            cursor = cnxn.cursor()
+            cursor.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM {self.table_name} WHERE log_id = ? ORDER BY start_time",
+                (log_id,))
+            rows = [dict(zip(COLUMNS, row)) for row in cursor.fetchall()]
+            cursor.close()
+        for row in rows:
+            row["args"] = json.loads(row["args"])
+            row["details"] = json.loads(row["details"]) if row["details"] else {}
+        return rows
+
+    def fetch_script_executions(self, script_names):
+        """
+        Fetch the outcome of every recorded execution of the given scripts,
+        leaving out nodes skipped by a resumed run.
+
+        Returns:
+            list: (script_name, args, result, duration) tuples, oldest first
+        """
+        script_names = list(script_names)
+        if not script_names:
+            return []
+        placeholders = ", ".join("?" for _ in script_names)
+        with self.pool.connection() as cnxn:
+            cursor = cnxn.cursor()
+            cursor.execute(
+                f"SELECT script_name, args, result, start_time, end_time, details FROM {self.table_name} "
+                f"WHERE script_name IN ({placeholders}) ORDER BY start_time", script_names)
+            rows = cursor.fetchall()
+            cursor.close()
+        executions = []
+        for script_name, args, result, start_time, end_time, details in rows:
+            if details and json.loads(details).get("resumed"):
+                continue
+            executions.append((script_name, json.loads(args), result, end_time - start_time))
+        return executions
+
+    @property
+    def row_id_column(self):
+        """Column numbering the history rows in insertion order."""
+        return "row_id" if self.store.backend_name == "pyodbc" else "rowid"
+
+    def iter_executions_after(self, after_row_id, chunk_size=50000):
+        """
+        Iterate over the rows recorded after row after_row_id (see
+        row_id_column), in row id order.
+
+        On SQL Server the row id is an IDENTITY value, taken at insert time:
+        a row can commit after rows with higher ids, so callers keeping a
+        high-water mark have to look below it again (see run_analytics).
+
+        Yields:
+            list: (row_id, execution) per row of a chunk, execution being a
+                  (log_id, script_name, args, result, start_time, end_time)
+                  tuple, or None for nodes skipped by a resumed run
+        """
+        with self.pool.connection() as cnxn:
+            cursor = cnxn.cursor()
+            cursor.execute(
+                f"SELECT {self.row_id_column}, log_id, script_name, args, result, start_time, end_time, details "
+                f"FROM {self.table_name} WHERE {self.row_id_column} > ? ORDER BY {self.row_id_column}",
+                (after_row_id,))
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield [
+                    (row_id, None if details and json.loads(details).get("resumed")
+                     else (log_id, script_name, json.loads(args), result, start_time, end_time))
+                    for row_id, log_id, script_name, args, result, start_time, end_time, details in rows]
+            cursor.close()
+
+
+class RunHistoryWriter:
+    """
+    Background thread that batches run-history inserts.
+
+    record() only puts the row on a queue, so persisting never adds latency
+    to script execution. Rows are written when batch_size rows are queued or
+    flush_interval seconds have passed, and close() flushes what is left.
+    """
+    _STOP = object()
+
+    def __init__(self, history_store, batch_size=DEFAULT_BATCH_SIZE, flush_interval=DEFAULT_FLUSH_INTERVAL):
+        self.history_store = history_store
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.rows_written = 0
+        self.rows_failed = 0
+        self._queue = queue.Queue()
+        self._closed = False
+        # Daemon thread: the atexit hook, not thread joining, drives the final flush
+        self._thread = threading.Thread(target=self._run, name="run-history-writer", daemon=True)
+        self._thread.start()
+
+    def record(self, row):
+        """Queue one node row (tuple in COLUMNS order) for writing."""
+        if not self._closed:
+            self._queue.put(("node", row))
+
+    def record_run(self, row):
+        """Queue one run row (tuple in RUN_COLUMNS order) for writing."""
+        if not self._closed:
+            self._queue.put(("run", row))
+
+    def _write(self, batch):
+        rows = [row for kind, row in batch if kind == "node"]
+        runs = [row for kind, row in batch if kind == "run"]
+        try:
+            self.history_store.insert_rows(rows, runs)
+            self.rows_written += len(batch)
+        except Exception as e:
+            self.rows_failed += len(batch)
+            print(f"Warning: Could not persist {len(batch)} run-history row(s): {e}")
+
+    def _run(self):
+        batch = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is self._STOP:
+                if batch:
+                    self._write(batch)
+                return
+
+            if item is not None:
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+
+            if batch and (len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                self._write(batch)
+                batch = []
+                deadline = None
+
+    def close(self):
+        """Flush every queued row and stop the writer thread. Safe to call twice."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(self._STOP)
+        self._thread.join()
+
+
+def node_end_row(log_id, payload):
+    """Build a run-history row from a 'node_end' event payload."""
+    return (
+        log_id,
+        payload["node_path"],
+        payload["script"],
+        json.dumps(payload["args"]),
+        payload["result"],
+        payload["start_time"],
+        payload["end_time"],
+        # Captured output, metrics... of the execution (see run_events.node_record)
+        json.dumps(payload["details"]) if payload.get("details") else None,
+    )
+
+def run_row(log_id, expression, folder_hashes, verification_tiers=None):
+    """Build a run row from the expression, its verified folder hashes and how each was verified."""
+    return (log_id, expression, json.dumps(folder_hashes, sort_keys=True), time.time(),
+            json.dumps(verification_tiers or {}, sort_keys=True))
+
+def start_run_history(log_id, store=None):
+    """
+    Persist every node outcome of this process's run under log_id.
+
+    Registers a run-event listener feeding a RunHistoryWriter and an atexit
+    hook that flushes it, so rows are written even when the run ends through
+    sys.exit. Persistence problems only print a warning.
+
+    Returns:
+        RunHistoryWriter: The writer, or None if the store is unavailable
+    """
+    try:
+        history_store = RunHistoryStore(store or hash_store.get_hash_store())
+        history_store.ensure_schema()
+    except Exception as e:
+        print(f"Warning: Run history disabled, store unavailable: {e}")
+        return None
+
+    writer = RunHistoryWriter(history_store)
+
+    def on_event(event_type, payload):
+        if event_type == "node_end":
+            writer.record(node_end_row(log_id, payload))
+
+    run_events.add_listener(on_event)
+
+    def stop():
+        run_events.remove_listener(on_event)
+        writer.close()
+
+    atexit.register(stop)
+    return writer
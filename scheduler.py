@@ -0,0 +1,157 @@
+import asyncio
+import collections
+import os
+import time
+
+ENV_RESOURCES = "SCRIPT_RESOURCES"
+
+# Pool every script draws one unit from unless it declares otherwise: a global concurrency limit
+SLOTS_POOL = "slots"
+
+
+def parse_pools(spec):
+    """
+    Parse a pool specification such as "slots=8,cpu=8,db=2".
+
+    Raises:
+        ValueError: If an entry is not name=<positive integer>
+    """
+    pools = {}
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        name, sep, value = item.partition('=')
+        if not sep or not name.strip() or not value.strip().isdigit() or int(value) < 1:
+            raise ValueError(f"Invalid resource pool '{item}', expected name=<positive integer>")
+        pools[name.strip()] = int(value)
+    return pools
+
+
+class ResourceScheduler:
+    """
+    Admits script executions against named resource pools.
+
+    Each execution requests some units of some pools (declared under
+    "resources" in the script's sidecar config, see script_config). Requests
+    are admitted strictly in arrival order: a request that does not fit
+    waits, and later ones wait behind it, so heavy scripts are never starved
+    by a stream of light ones. Runs on one asyncio event loop.
+    """
+    def __init__(self, capacities):
+        self.capacities = dict(capacities)
+        self.available = dict(capacities)
+        self._queue = collections.deque()  # (future, request), in arrival order
+        self.waits = []  # (script_name, args, request, seconds waited)
+
+    def normalize_request(self, script_name, declared):
+        """
+        Turn a script's declared resources into a request the pools can satisfy.
+
+        Undeclared scripts take one slot. Unknown pools, units that are not a
+        non-negative integer and a "resources" value that is not an object
+        are ignored, so the default applies instead; requests above a pool's
+        capacity are capped to it. Each case prints a warning.
+        """
+        request = {}
+        if declared is None:
+            declared = {}
+        elif not isinstance(declared, dict):
+            print(f"Warning: {script_name} declares invalid resources {declared!r}, "
+                  f"expected an object of pool: units")
+            declared = {}
+        valid = {}
+        for pool, units in declared.items():
+            if pool not in self.capacities:
+                print(f"Warning: {script_name} declares unknown resource '{pool}', ignored")
+            elif isinstance(units, bool) or not isinstance(units, int) or units < 0:
+                print(f"Warning: {script_name} declares invalid units {units!r} of '{pool}', ignored")
+            else:
+                valid[pool] = units
+        if SLOTS_POOL in self.capacities:
+            valid.setdefault(SLOTS_POOL, 1)
+        for pool, units in valid.items():
+            if units > self.capacities[pool]:
+                print(f"Warning: {script_name} requests {units} {pool}, capped to the pool size "
+                      f"{self.capacities[pool]}")
+                units = self.capacities[pool]
+            if units > 0:
+                request[pool] = units
+        return request
+
+    def _fits(self, request):
+        return all(self.available[pool] >= units for pool, units in request.items())
+
+    def _admit(self):
+        while self._queue:
+            future, request = self._queue[0]
+            if future.done():  # Cancelled while waiting
+                self._queue.popleft()
+                continue
+            if not self._fits(request):
+                break
+            self._queue.popleft()
+            for pool, units in request.items():
+                self.available[pool] -= units
+            future.set_result(None)
+
+    async def acquire(self, request):
+        """Wait until request can be admitted and take its units."""
+        future = asyncio.get_running_loop().create_future()
+        self._queue.append((future, request))
+        self._admit()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release(request)  # Admitted just before the cancellation
+            else:
+                self._admit()
+            raise
+
+    def release(self, request):
+        for pool, units in request.items():
+            self.available[pool] += units
+        self._admit()
+
+    def wrap(self, executor_func, config_func):
+        """
+        Put the scheduler in front of an async executor function.
+
+        Args:
+            executor_func: Coroutine function with the signature of
+                           dynamic_import_and_run_async
+            config_func: config_func(script_name) -> sidecar config dict
+
+        Returns:
+            Coroutine function with the same signature
+        """
+        async def scheduled(script_name, args, verify_hash=False, expected_hash=None):
+            request = self.normalize_request(script_name, config_func(script_name).get("resources"))
+            queued_at = time.monotonic()
+            await self.acquire(request)
+            self.waits.append((script_name, list(args), request, time.monotonic() - queued_at))
+            try:
+                return await executor_func(script_name, args, verify_hash, expected_hash)
+            finally:
+                self.release(request)
+        return scheduled
+
+    def print_summary(self):
+        """Print the queue wait of every admitted execution."""
+        pools = ", ".join(f"{pool}={units}" for pool, units in self.capacities.items())
+        print(f"\n=== SCHEDULER SUMMARY ({pools}) ===")
+        for script_name, args, request, waited in self.waits:
+            label = f"{script_name}:{','.join(args)}" if args else script_name
+            needs = ", ".join(f"{pool}={units}" for pool, units in request.items()) or "nothing"
+            print(f"  {label:<30} waited {waited:8.3f}s  (needs {needs})")
+        if self.waits:
+            total = sum(waited for _, _, _, waited in self.waits)
+            longest = max(waited for _, _, _, waited in self.waits)
+            print(f"  {len(self.waits)} execution(s), total wait {total:.3f}s, longest {longest:.3f}s")
+
+
+def pools_from_env():
+    """Pools configured by SCRIPT_RESOURCES, or None."""
+    spec = os.environ.get(ENV_RESOURCES)
+    return parse_pools(spec) if spec else None
@@ -0,0 +1,159 @@
+import hashlib
+import io
+import os
+import tempfile
+import zipfile
+
+import directory_hash
+import script_loader
+
+# Fixed timestamp and permissions so the same folder always packs to the same bytes
+_ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+_ZIP_FILE_MODE = 0o644 << 16
+_ZIP_DIR_MODE = (0o40755 << 16) | 0x10
+
+def bundle_path(bundle_dir, hash_value):
+    """Path of the bundle archive for a folder hash."""
+    return os.path.join(bundle_dir, f"{hash_value}.zip")
+
+def create_bundle(script_folder, bundle_dir, exclude_dirs=None):
+    """
+    Pack a script folder into a content-addressed zip bundle.
+
+    The archive holds <name>/... for every file and directory that
+    calculate_directory_hash would include, and is named <hash>.zip after
+    the folder's directory hash, so the value registered in the hash store
+    identifies the bundle. Writing is atomic (temporary file + rename).
+
+    Args:
+        script_folder (str): Path to the script folder
+        bundle_dir (str): Directory receiving the bundle
+        exclude_dirs (list): List of directory names to exclude
+
+    Returns:
+        str: Directory hash (bundle name without .zip), or None if the folder is empty
+    """
+    script_name = os.path.basename(os.path.normpath(script_folder))
+    hash_value = directory_hash.calculate_directory_hash(script_folder, exclude_dirs, verbose=False)
+    if hash_value is None:
+        return None
+
+    target = bundle_path(bundle_dir, hash_value)
+    if os.path.exists(target):
+        return hash_value  # Same content is already deployed
+
+    os.makedirs(bundle_dir, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=bundle_dir, suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f, zipfile.ZipFile(f, 'w', zipfile.ZIP_DEFLATED) as zf:
+            for root, rel_dir_path, files in directory_hash.walk_directory(script_folder, exclude_dirs):
+                arc_dir = script_name if rel_dir_path == '.' else \
+                    f"{script_name}/{rel_dir_path.replace(os.sep, '/')}"
+
+                info = zipfile.ZipInfo(f"{arc_dir}/", _ZIP_DATE_TIME)
+                info.external_attr = _ZIP_DIR_MODE
+                zf.writestr(info, b"")
+
+                for filename in files:
+                    file_path = os.path.join(root, filename)
+                    if not os.access(file_path, os.R_OK):
+                        continue
+                    with open(file_path, 'rb') as src:
+                        data = src.read()
+                    info = zipfile.ZipInfo(f"{arc_dir}/{filename}", _ZIP_DATE_TIME)
+                    info.external_attr = _ZIP_FILE_MODE
+                    info.compress_type = zipfile.ZIP_DEFLATED
+                    zf.writestr(info, data)
+        os.replace(temp_path, target)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    return hash_value
+
+def calculate_bundle_hash(bundle_data, script_name):
+    """
+    Calculate the directory hash of a bundle held in memory.
+
+    Produces the same value calculate_directory_hash gives for the loose
+    folder the bundle was packed from.
+
+    Args:
+        bundle_data (bytes): Contents of the bundle archive
+        script_name (str): Name of the script (top-level folder in the archive)
+
+    Returns:
+        str: Directory hash, or None if the bundle has no entries for the script
+    """
+    prefix = f"{script_name}/"
+    directory_entries = []
+    with zipfile.ZipFile(io.BytesIO(bundle_data)) as zf:
+        for info in zf.infolist():
+            if not info.filename.startswith(prefix):
+                continue
+            rel_path = info.filename[len(prefix):]
+            if info.is_dir():
+                rel_path = rel_path.rstrip('/')
+                if rel_path:
+                    directory_entries.append(f"DIR:{rel_path.replace('/', os.sep)}")
+            else:
+                content_hash = hashlib.md5(zf.read(info)).hexdigest()
+                directory_entries.append(f"FILE:{rel_path.replace('/', os.sep)}:{content_hash}")
+    return directory_hash.combine_entries(directory_entries)
+
+def read_verified_bundle(bundle_dir, script_name, expected_hash):
+    """
+    Read a bundle with one sequential read and verify it against expected_hash.
+
+    Returns:
+        bytes: The verified bundle contents, or None if the bundle is missing,
+               unreadable or does not match
+    """
+    path = bundle_path(bundle_dir, expected_hash)
+    try:
+        with open(path, 'rb') as f:
+            bundle_data = f.read()
+        actual_hash = calculate_bundle_hash(bundle_data, script_name)
+    except (OSError, zipfile.BadZipFile) as e:
+        print(f"Error reading bundle {path}: {e}")
+        return None
+
+    if actual_hash != expected_hash:
+        print(f"Bundle verification FAILED for {path}")
+        print(f"  Expected: {expected_hash}")
+        print(f"  Actual:   {actual_hash}")
+        return None
+    return bundle_data
+
+def load_script_module(script_name, bundle_data, bundle_file="<bundle>"):
+    """
+    Load <script_name>/<script_name>.py straight from verified bundle bytes.
+
+    Raises:
+        KeyError: If the bundle does not contain the script file
+    """
+    with zipfile.ZipFile(io.BytesIO(bundle_data)) as zf:
+        source = zf.read(f"{script_name}/{script_name}.py")
+    filename = os.path.join(bundle_file, script_name, f"{script_name}.py")
+    # The source comes from a verified bundle, so its hash can key the bytecode cache
+    return script_loader.module_from_source(
+        script_name, source, filename, hashlib.md5(source).hexdigest())
+
+# Pack script folders from the current directory into bundles
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) < 3:
+        print("Usage: python script_bundle.py <bundle_dir> <script_name> [<script_name> ...]")
+        print("This will pack each script folder into <bundle_dir>/<hash>.zip")
+        sys.exit(1)
+
+    bundle_dir = sys.argv[1]
+    for script_name in sys.argv[2:]:
+        script_folder = os.path.join(os.getcwd(), script_name)
+        if not os.path.isdir(script_folder):
+            print(f"Error: Script folder '{script_folder}' not found")
+            continue
+        hash_value = create_bundle(script_folder, bundle_dir)
+        print(f"{script_name}: {bundle_path(bundle_dir, hash_value) if hash_value else 'nothing to bundle'}")
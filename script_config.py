@@ -0,0 +1,64 @@
+import io
+import json
+import os
+import threading
+import zipfile
+
+# Sidecar configuration file inside each script folder (hashed with the folder)
+CONFIG_FILE = "script.json"
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def parse_config(data, source):
+    """Decode a sidecar config; a malformed one prints a warning and counts as empty."""
+    try:
+        config = json.loads(data)
+    except ValueError as e:
+        print(f"Warning: Ignoring invalid {source}: {e}")
+        return {}
+    if not isinstance(config, dict):
+        print(f"Warning: Ignoring {source}: expected a JSON object")
+        return {}
+    return config
+
+
+def load_script_config(script_name, base_dir=None, bundle_data=None):
+    """
+    Load the sidecar configuration of a script, e.g.
+    {"resources": {"cpu": 2, "db": 1}}.
+
+    The config is read from <base_dir>/<script_name>/script.json, or from the
+    verified bundle bytes when given, and cached per script for the process.
+
+    Returns:
+        dict: The configuration, or an empty dict if the script has none
+    """
+    with _cache_lock:
+        if script_name in _cache:
+            return _cache[script_name]
+
+    if bundle_data is not None:
+        member = f"{script_name}/{CONFIG_FILE}"
+        with zipfile.ZipFile(io.BytesIO(bundle_data)) as zf:
+            data = zf.read(member) if member in zf.namelist() else None
+        source = f"{member} in bundle"
+    else:
+        path = os.path.join(base_dir or os.getcwd(), script_name, CONFIG_FILE)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            data = None
+        source = path
+
+    config = parse_config(data, source) if data is not None else {}
+    with _cache_lock:
+        _cache[script_name] = config
+    return config
+
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
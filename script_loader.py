@@ -0,0 +1,102 @@
+import hashlib
+import os
+import threading
+import types
+
+import bytecode_cache
+
+# Memory budget for verified script sources (override with SCRIPT_SOURCE_CACHE_BYTES)
+DEFAULT_SOURCE_CACHE_BYTES = int(os.environ.get("SCRIPT_SOURCE_CACHE_BYTES", 64 * 1024 * 1024))
+
+def module_from_source(module_name, source, filename, source_hash=None):
+    """
+    Create and execute a module from source bytes held in memory.
+
+    The module runs exactly the given bytes; nothing is read from disk.
+
+    Args:
+        module_name (str): Name of the module to create
+        source (bytes): Python source code
+        filename (str): File name shown in tracebacks
+        source_hash (str): MD5 of source if it was verified; enables the
+                           hash-keyed bytecode cache so compilation is skipped
+
+    Returns:
+        module: The executed module
+    """
+    cache = bytecode_cache.get_bytecode_cache() if source_hash else None
+    if cache is not None:
+        code = cache.load_or_compile(source, source_hash, filename)
+    else:
+        code = compile(source, filename, 'exec')
+    module = types.ModuleType(module_name)
+    module.__file__ = filename
+    module.__loader__ = None
+    exec(code, module.__dict__)
+    return module
+
+
+class VerifiedSourceCache:
+    """
+    Script sources kept in memory from the hashing pass.
+
+    Holds the exact bytes that were hashed, up to max_bytes in total, so a
+    verified script runs without reading its file again. Sources that do not
+    fit only keep their MD5; they are re-read from disk at load time and
+    checked against it, so what runs is still what was verified.
+    """
+    def __init__(self, max_bytes=DEFAULT_SOURCE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.used_bytes = 0
+        self._sources = {}
+        self._digests = {}
+        self._lock = threading.Lock()
+
+    def add(self, script_name, source, source_hash):
+        """Keep a verified source if it fits in the budget; always keep its hash."""
+        with self._lock:
+            self._digests[script_name] = source_hash
+            if script_name in self._sources:
+                self.used_bytes -= len(self._sources.pop(script_name))
+            if self.used_bytes + len(source) <= self.max_bytes:
+                self._sources[script_name] = source
+                self.used_bytes += len(source)
+
+    def add_hash(self, script_name, source_hash):
+        """Record the verified hash of a source whose bytes were not read (re-read at load time)."""
+        with self._lock:
+            self._digests[script_name] = source_hash
+            if script_name in self._sources:
+                self.used_bytes -= len(self._sources.pop(script_name))
+
+    def get(self, script_name):
+        """Return the kept source bytes, or None if they were not kept."""
+        with self._lock:
+            return self._sources.get(script_name)
+
+    def get_hash(self, script_name):
+        """Return the MD5 of the verified source, or None if never verified."""
+        with self._lock:
+            return self._digests.get(script_name)
+
+    def load_module(self, script_name, script_path):
+        """
+        Load a verified script, from memory when possible.
+
+        Returns:
+            module: The executed module, or None if the script was not verified
+
+        Raises:
+            ValueError: If the file was re-read and no longer matches the verified hash
+        """
+        source = self.get(script_name)
+        if source is None:
+            expected_hash = self.get_hash(script_name)
+            if expected_hash is None:
+                return None
+            # Did not fit in memory: read it again and make sure it is unchanged
+            with open(script_path, 'rb') as f:
+                source = f.read()
+            if hashlib.md5(source).hexdigest() != expected_hash:
+                raise ValueError(f"{script_path} changed after hash verification")
+        return module_from_source(script_name, source, script_path, self.get_hash(script_name))
@@ -0,0 +1,173 @@
+"""
+Resource accounting of script executions.
+
+Every execution of a script function records:
+
+    wall_seconds              Elapsed time of the function call
+    user_seconds, sys_seconds CPU time (resource.getrusage, os.times without it)
+    peak_rss_bytes            High-water mark of the process RSS at the end of the call
+    read_bytes, write_bytes   Storage I/O (/proc/<self>/io, where available)
+    read_chars, write_chars   Bytes passed to read/write calls, including cached I/O
+    scope                     "thread" or "process"
+
+Functions running on their own thread (the synchronous engine, synchronous
+scripts on the async engine) are measured with per-thread counters
+(RUSAGE_THREAD, /proc/thread-self/io), so concurrent scripts do not count
+each other. Coroutine scripts share the event loop thread and are measured
+process-wide, as is everything on platforms without per-thread counters.
+The peak RSS is always the process' and is only accurate per script when
+the script runs alone, e.g. on an isolated worker.
+
+The measurements are added to the execution record (run_events.annotate)
+and so reach node_end events, the run history and remote coordinators.
+"""
+import functools
+import inspect
+import os
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+import run_events
+
+SCOPE_THREAD = "thread"
+SCOPE_PROCESS = "process"
+
+_RUSAGE_THREAD = getattr(resource, "RUSAGE_THREAD", None)
+# ru_maxrss is in kilobytes on Linux, in bytes on macOS
+_MAXRSS_UNIT = 1 if sys.platform == "darwin" else 1024
+
+_IO_FIELDS = {
+    "read_bytes": "read_bytes",
+    "write_bytes": "write_bytes",
+    "rchar": "read_chars",
+    "wchar": "write_chars",
+}
+
+
+def read_io_counters(scope):
+    """I/O counters of the calling thread or of the process, or {} where unavailable."""
+    path = "/proc/thread-self/io" if scope == SCOPE_THREAD else "/proc/self/io"
+    counters = {}
+    try:
+        with open(path, 'r') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key in _IO_FIELDS:
+                    counters[_IO_FIELDS[key]] = int(value)
+    except (OSError, ValueError):
+        return {}
+    return counters
+
+
+def _cpu_times(scope):
+    if resource is None:
+        times = os.times()
+        return times.user, times.system
+    usage = resource.getrusage(_RUSAGE_THREAD if scope == SCOPE_THREAD else resource.RUSAGE_SELF)
+    return usage.ru_utime, usage.ru_stime
+
+
+class _Measurement:
+    def __init__(self, scope):
+        if scope == SCOPE_THREAD and (_RUSAGE_THREAD is None or not os.path.exists("/proc/thread-self/io")):
+            scope = SCOPE_PROCESS
+        self.scope = scope
+        self.io = read_io_counters(scope)
+        self.user, self.sys = _cpu_times(scope)
+        self.wall = time.perf_counter()
+
+    def finish(self):
+        wall = time.perf_counter() - self.wall
+        user, sys_time = _cpu_times(self.scope)
+        metrics = {
+            "scope": self.scope,
+            "wall_seconds": round(wall, 6),
+            "user_seconds": round(user - self.user, 6),
+            "sys_seconds": round(sys_time - self.sys, 6),
+            "peak_rss_bytes": (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * _MAXRSS_UNIT
+                               if resource is not None else None),
+        }
+        io = read_io_counters(self.scope)
+        for key, start in self.io.items():
+            if key in io:
+                metrics[key] = io[key] - start
+        run_events.annotate(metrics=metrics)
+        return metrics
+
+
+def wrap(func):
+    """Return func with each call measured (a coroutine function stays one)."""
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def measured_coroutine(*args):
+            measurement = _Measurement(SCOPE_PROCESS)
+            try:
+                return await func(*args)
+            finally:
+                measurement.finish()
+        return measured_coroutine
+
+    @functools.wraps(func)
+    def measured(*args):
+        measurement = _Measurement(SCOPE_THREAD)
+        try:
+            return func(*args)
+        finally:
+            measurement.finish()
+    return measured
+
+
+def _format_bytes(value):
+    if value is None:
+        return "-"
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if abs(value) < 1024 or unit == "GiB":
+            return f"{value:.0f}{unit}" if unit == "B" else f"{value:.1f}{unit}"
+        value /= 1024
+
+
+class MetricsSummary:
+    """
+    Run event listener collecting the metrics of every finished node, for
+    the end-of-run summary (foo.py --resource-summary):
+
+        summary = MetricsSummary()
+        run_events.add_listener(summary.on_event)
+        ...
+        summary.print_summary()
+    """
+    def __init__(self):
+        self.executions = []  # (script_name, args, result, metrics)
+
+    def on_event(self, event_type, payload):
+        if event_type != "node_end":
+            return
+        metrics = (payload.get("details") or {}).get("metrics")
+        if metrics:
+            self.executions.append((payload["script"], payload["args"], payload["result"], metrics))
+
+    def print_summary(self, limit=20):
+        """Print the costliest executions (by CPU time) and the totals."""
+        if not self.executions:
+            return
+        print(f"\n=== RESOURCE SUMMARY ===")
+        print(f"  {'script':<30} {'result':>6} {'wall':>9} {'user':>9} {'sys':>9} {'peak rss':>10} "
+              f"{'read':>10} {'write':>10}")
+        by_cpu = sorted(self.executions, key=lambda e: e[3]["user_seconds"] + e[3]["sys_seconds"], reverse=True)
+        for script_name, args, result, metrics in by_cpu[:limit]:
+            label = f"{script_name}:{','.join(args)}" if args else script_name
+            print(f"  {label:<30} {result:>6} {metrics['wall_seconds']:8.3f}s {metrics['user_seconds']:8.3f}s "
+                  f"{metrics['sys_seconds']:8.3f}s {_format_bytes(metrics.get('peak_rss_bytes')):>10} "
+                  f"{_format_bytes(metrics.get('read_bytes')):>10} {_format_bytes(metrics.get('write_bytes')):>10}")
+        if len(by_cpu) > limit:
+            print(f"  ... {len(by_cpu) - limit} more execution(s)")
+        total_wall = sum(m["wall_seconds"] for _, _, _, m in self.executions)
+        total_cpu = sum(m["user_seconds"] + m["sys_seconds"] for _, _, _, m in self.executions)
+        peak = max((m.get("peak_rss_bytes") or 0 for _, _, _, m in self.executions), default=0)
+        print(f"  {len(self.executions)} execution(s), {total_wall:.3f}s wall, {total_cpu:.3f}s CPU, "
+              f"peak RSS {_format_bytes(peak or None)}")
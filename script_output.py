@@ -0,0 +1,231 @@
+"""
+Bounded capture of what scripts write to sys.stdout and sys.stderr.
+
+Capture is off unless enabled (foo.py --capture-output, or
+SCRIPT_OUTPUT_CAP_BYTES); script output is then written straight through.
+While a script runs inside an enabled capture(), its writes go to a
+per-stream ring buffer that keeps the first and the last cap/2 bytes. Once
+a stream outgrows the cap, everything it writes (from the first byte) is
+also streamed to a gzip file in the spill directory, so nothing is lost and
+memory stays bounded. At the end the kept head and tail are printed as one
+block. The execution's record (see run_events.annotate), and so the run
+history and run events, only gets the last RECORD_TAIL_CHARS characters of
+each stream, its size and the spill file.
+
+Routing is per context (contextvars), so concurrent scripts on the async
+engine each get their own buffers. Output written at the file-descriptor
+level (e.g. by subprocesses) and by threads the script starts itself is
+not captured.
+
+Configuration:
+    SCRIPT_OUTPUT_CAP_BYTES   Bytes kept per stream (default 0: capture disabled)
+    SCRIPT_OUTPUT_SPILL_DIR   Where truncated output is spilled (default <tmp>/script_output)
+    SCRIPT_OUTPUT_TEE         Also pass output through as it is written (default off)
+"""
+import collections
+import contextlib
+import contextvars
+import gzip
+import itertools
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import run_events
+import speculation
+
+# Bytes kept per stream when capture is enabled without a size
+ENABLED_CAP_BYTES = 64 * 1024
+# Characters of each stream's kept output stored in the execution record
+RECORD_TAIL_CHARS = 2048
+
+DEFAULT_SPILL_DIR = os.environ.get("SCRIPT_OUTPUT_SPILL_DIR",
+                                   os.path.join(tempfile.gettempdir(), "script_output"))
+TEE = os.environ.get("SCRIPT_OUTPUT_TEE", "").lower() in ("1", "true", "yes")
+
+_active = contextvars.ContextVar("active_capture", default=None)
+_spill_counter = itertools.count(1)
+_install_lock = threading.Lock()
+_cap_bytes = int(os.environ.get("SCRIPT_OUTPUT_CAP_BYTES", 0))
+
+
+class RingBuffer:
+    """
+    Keeps the head and the tail of a byte stream within cap_bytes.
+
+    Args:
+        cap_bytes (int): Bytes kept in memory (half head, half tail)
+        spill_path (str): gzip file receiving the whole stream once it is truncated
+    """
+    def __init__(self, cap_bytes, spill_path):
+        self.head_limit = cap_bytes // 2
+        self.tail_limit = cap_bytes - self.head_limit
+        self.spill_path = spill_path
+        self.head = bytearray()
+        self.tail = collections.deque()
+        self.tail_size = 0
+        self.total = 0
+        self.spilled = False
+        self._spill = None
+        self._lock = threading.Lock()
+
+    def write(self, data):
+        with self._lock:
+            self.total += len(data)
+            if self._spill is not None:
+                self._spill.write(data)
+
+            room = self.head_limit - len(self.head)
+            if room > 0:
+                self.head += data[:room]
+                data = data[room:]
+            if not data:
+                return
+            self.tail.append(data)
+            self.tail_size += len(data)
+            if self.tail_size <= self.tail_limit:
+                return
+
+            if self._spill is None:
+                # First truncation: nothing was dropped yet, so head + tail is the whole stream
+                os.makedirs(os.path.dirname(self.spill_path), exist_ok=True)
+                self._spill = gzip.open(self.spill_path, 'wb')
+                self._spill.write(self.head)
+                for chunk in self.tail:
+                    self._spill.write(chunk)
+                self.spilled = True
+            while self.tail_size - len(self.tail[0]) >= self.tail_limit:
+                self.tail_size -= len(self.tail.popleft())
+            excess = self.tail_size - self.tail_limit
+            if excess > 0:
+                self.tail[0] = self.tail[0][excess:]
+                self.tail_size -= excess
+
+    @property
+    def dropped(self):
+        return self.total - len(self.head) - self.tail_size
+
+    def close(self):
+        with self._lock:
+            if self._spill is not None:
+                self._spill.close()
+                self._spill = None
+
+    def text(self):
+        """The kept output, with a marker where bytes were dropped."""
+        head = bytes(self.head).decode('utf-8', 'replace')
+        if not self.dropped:
+            return head + b"".join(self.tail).decode('utf-8', 'replace')
+        marker = f"\n... [{self.dropped} bytes truncated, full output in {self.spill_path}] ...\n"
+        return head + marker + b"".join(self.tail).decode('utf-8', 'replace')
+
+    def summary(self):
+        return {
+            "text": self.text(),
+            "bytes": self.total,
+            "truncated_bytes": self.dropped,
+            "spill_file": self.spill_path if self.spilled else None,
+        }
+
+
+class RoutingStream:
+    """
+    Replacement for sys.stdout / sys.stderr sending writes to the capture
+    of the current context, or to the original stream outside captures.
+    """
+    def __init__(self, stream, name):
+        self._stream = stream
+        self._name = name
+
+    def write(self, text):
+        captured = _active.get()
+        if captured is None:
+            return self._stream.write(text)
+        buffer = captured[self._name]
+        buffer.write(text.encode('utf-8', 'replace'))
+        if TEE:
+            self._stream.write(text)
+        return len(text)
+
+    def flush(self):
+        if _active.get() is None or TEE:
+            self._stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+def install():
+    """Route sys.stdout and sys.stderr through RoutingStream (idempotent)."""
+    with _install_lock:
+        if not isinstance(sys.stdout, RoutingStream):
+            sys.stdout = RoutingStream(sys.stdout, "stdout")
+        if not isinstance(sys.stderr, RoutingStream):
+            sys.stderr = RoutingStream(sys.stderr, "stderr")
+
+
+@contextlib.contextmanager
+def capture(script_name, cap_bytes=None, spill_dir=None):
+    """
+    Capture a script's output for the duration of the block.
+
+    Does nothing when cap_bytes (by default the process-wide setting, see
+    set_cap_bytes) is 0. On exit the kept output is printed as one block and
+    its tail recorded as the 'output' field of the current execution record.
+    """
+    cap_bytes = _cap_bytes if cap_bytes is None else cap_bytes
+    if cap_bytes <= 0:
+        yield None
+        return
+
+    install()
+    spill_dir = spill_dir or DEFAULT_SPILL_DIR
+    stem = f"{script_name}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{next(_spill_counter)}"
+    buffers = {
+        "stdout": RingBuffer(cap_bytes, os.path.join(spill_dir, f"{stem}.stdout.gz")),
+        "stderr": RingBuffer(cap_bytes, os.path.join(spill_dir, f"{stem}.stderr.gz")),
+    }
+    token = _active.set(buffers)
+    try:
+        yield buffers
+    finally:
+        _active.reset(token)
+        for buffer in buffers.values():
+            buffer.close()
+        output = {name: buffer.summary() for name, buffer in buffers.items()}
+        run_events.annotate(output={name: _record_summary(summary) for name, summary in output.items()})
+        # A speculative execution only shows its output once it is committed
+        speculation.report(print_output, script_name, output)
+
+
+def _record_summary(summary):
+    """summary with only the tail of its text, for records that are stored or sent."""
+    text = summary["text"]
+    if len(text) <= RECORD_TAIL_CHARS:
+        return summary
+    return dict(summary, text=text[-RECORD_TAIL_CHARS:], omitted_chars=len(text) - RECORD_TAIL_CHARS)
+
+
+def get_cap_bytes():
+    """Bytes kept per stream by capture(); 0 when capture is disabled."""
+    return _cap_bytes
+
+
+def set_cap_bytes(cap_bytes):
+    """Enable capture with cap_bytes per stream for this process, or disable it with 0."""
+    global _cap_bytes
+    _cap_bytes = cap_bytes
+
+
+def print_output(script_name, output):
+    """Print captured output as one block, so concurrent scripts do not interleave."""
+    for name in ("stdout", "stderr"):
+        stream = output[name]
+        if not stream["bytes"]:
+            continue
+        note = f", {stream['truncated_bytes']} truncated" if stream["truncated_bytes"] else ""
+        block = stream["text"] if stream["text"].endswith("\n") else stream["text"] + "\n"
+        target = sys.stdout if name == "stdout" else sys.stderr
+        target.write(f"--- {script_name} {name} ({stream['bytes']} bytes{note}) ---\n{block}")
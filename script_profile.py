@@ -0,0 +1,307 @@
+"""
+Opt-in profiling of individual scripts.
+
+    python foo.py <log_id> "<expression>" --profile A,C
+    python foo.py <log_id> "<expression>" --profile all --profile-mode sample
+
+Profiles are aggregated per script across executions and runs in the
+profile directory:
+
+    <script>.pstats     cProfile statistics (cprofile mode), for pstats / snakeviz
+    <script>.collapsed  Collapsed stacks ("frame;frame;frame microseconds"),
+                        for flamegraph.pl, speedscope or inferno
+
+In cprofile mode (default) the collapsed stacks are derived from the call
+graph, splitting each function's time between its callers in proportion.
+sample mode records real stacks every SCRIPT_PROFILE_INTERVAL seconds from
+a background thread, with much lower overhead. Coroutine scripts on the
+async engine are always sampled: a deterministic profiler on the event
+loop thread would also record every other script sharing the loop.
+
+Only one execution at a time is profiled with cProfile: from Python 3.12
+cProfile uses sys.monitoring, which allows one active profiler per process
+(enabling a second raises ValueError). Executions overlapping it (--async,
+--resources, workers), or starting while another profiling tool is active,
+are sampled instead and only get a .collapsed contribution. On 3.12+ a
+cProfile profile also includes what other threads run meanwhile, so use
+sample mode for concurrent runs.
+
+Scripts that are not selected run exactly as before (the executor checks
+one module variable).
+
+Configuration:
+    SCRIPT_PROFILE_DIR        Profile directory (default "profiles")
+    SCRIPT_PROFILE_INTERVAL   Sampling interval in seconds (default 0.005)
+"""
+import collections
+import cProfile
+import functools
+import inspect
+import os
+import pstats
+import sys
+import threading
+import time
+
+import run_events
+
+MODE_CPROFILE = "cprofile"
+MODE_SAMPLE = "sample"
+MODES = (MODE_CPROFILE, MODE_SAMPLE)
+ALL_SCRIPTS = "all"
+
+DEFAULT_OUTPUT_DIR = os.environ.get("SCRIPT_PROFILE_DIR", "profiles")
+DEFAULT_INTERVAL = float(os.environ.get("SCRIPT_PROFILE_INTERVAL", 0.005))
+
+# Call-graph paths are not followed deeper than this (recursion, huge graphs)
+MAX_STACK_DEPTH = 64
+
+_profiler = None
+_profiler_lock = threading.Lock()
+
+
+def parse_selection(spec):
+    """
+    Parse a --profile value: "all" or comma separated script names.
+
+    Returns:
+        str or frozenset: ALL_SCRIPTS or the selected names
+
+    Raises:
+        ValueError: If no script is named
+    """
+    if spec.strip().lower() == ALL_SCRIPTS:
+        return ALL_SCRIPTS
+    names = frozenset(name.strip() for name in spec.split(',') if name.strip())
+    if not names:
+        raise ValueError(f"Invalid profile selection '{spec}', expected 'all' or script names")
+    return names
+
+
+def frame_label(filename, lineno, funcname):
+    """Flamegraph frame name, shared by both modes so their stacks merge."""
+    if filename == "~":  # Built-in function in cProfile statistics
+        return funcname
+    return f"{funcname} ({os.path.basename(filename)}:{lineno})"
+
+
+def collapse_stats(stats):
+    """
+    Derive collapsed stacks from cProfile statistics.
+
+    Starting from the functions that have no profiled caller, the time of a
+    function reached along a path is split between its callees in
+    proportion to the cumulative time each call edge accounts for.
+
+    Returns:
+        Counter: {(frame, ...): microseconds}
+    """
+    callees = collections.defaultdict(list)
+    for func, (_, _, _, _, callers) in stats.items():
+        for caller, edge in callers.items():
+            callees[caller].append((func, edge[3]))
+
+    stacks = collections.Counter()
+
+    def visit(func, path, funcs, inclusive):
+        _, _, own_time, cumulative, _ = stats[func]
+        share = inclusive / cumulative if cumulative else 0.0
+        self_us = int(own_time * share * 1e6)
+        if self_us > 0:
+            stacks[path] += self_us
+        if len(path) >= MAX_STACK_DEPTH:
+            return
+        for callee, edge_time in callees.get(func, ()):
+            if callee in funcs or edge_time * share < 1e-6:
+                continue
+            visit(callee, path + (frame_label(*callee),), funcs | {callee}, edge_time * share)
+
+    for func, (_, _, _, cumulative, callers) in stats.items():
+        if not callers and "_lsprof.Profiler" not in func[2]:
+            visit(func, (frame_label(*func),), frozenset((func,)), cumulative)
+    return stacks
+
+
+class _Sampler:
+    """
+    Background thread recording the stacks of profiled executions.
+
+    Executions register the frame of their wrapper; every interval the
+    stacks of all threads are walked up to a registered frame, so each
+    sample is attributed to the execution that is really running (also for
+    coroutines interleaved on one event loop thread).
+    """
+    def __init__(self, interval):
+        self.interval = interval
+        self._active = {}  # wrapper frame -> Counter of stacks
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self, frame):
+        stacks = collections.Counter()
+        with self._lock:
+            self._active[frame] = stacks
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="script-profiler", daemon=True)
+                self._thread.start()
+        return stacks
+
+    def stop(self, frame):
+        with self._lock:
+            self._active.pop(frame, None)
+
+    def _run(self):
+        sample_us = int(self.interval * 1e6)
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._active:
+                    self._thread = None
+                    return
+                active = dict(self._active)
+            for frame in sys._current_frames().values():
+                path = []
+                while frame is not None and frame not in active:
+                    code = frame.f_code
+                    path.append(frame_label(code.co_filename, code.co_firstlineno, code.co_name))
+                    frame = frame.f_back
+                if frame is not None:
+                    active[frame][tuple(reversed(path))] += sample_us
+
+
+class ScriptProfiler:
+    """
+    Profiles the selected scripts and merges each execution into the
+    profile files of its script.
+
+    Args:
+        selection: ALL_SCRIPTS or a set of script names (see parse_selection)
+        mode (str): MODE_CPROFILE or MODE_SAMPLE
+        output_dir (str): Profile directory
+        interval (float): Sampling interval in seconds
+    """
+    def __init__(self, selection, mode=MODE_CPROFILE, output_dir=None, interval=None):
+        if mode not in MODES:
+            raise ValueError(f"Invalid profile mode '{mode}', expected one of {', '.join(MODES)}")
+        self.selection = selection
+        self.mode = mode
+        self.output_dir = output_dir or DEFAULT_OUTPUT_DIR
+        self._sampler = _Sampler(interval or DEFAULT_INTERVAL)
+        self._write_lock = threading.Lock()
+        self._cprofile_lock = threading.Lock()  # Held by the execution profiled with cProfile
+
+    def wants(self, script_name):
+        return self.selection == ALL_SCRIPTS or script_name in self.selection
+
+    def wrap(self, script_name, func, reports=None):
+        """
+        Return func profiled as script_name (a coroutine function stays one).
+
+        The lines reporting where each profile was saved are appended to
+        reports if given, for the caller to print once the script's output
+        is no longer captured (see script_output.capture), else printed.
+        """
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def sampled_coroutine(*args):
+                frame = sys._getframe()
+                stacks = self._sampler.start(frame)
+                try:
+                    return await func(*args)
+                finally:
+                    self._sampler.stop(frame)
+                    self._save(script_name, None, stacks, reports)
+            return sampled_coroutine
+
+        @functools.wraps(func)
+        def sampled(*args):
+            frame = sys._getframe()
+            stacks = self._sampler.start(frame)
+            try:
+                return func(*args)
+            finally:
+                self._sampler.stop(frame)
+                self._save(script_name, None, stacks, reports)
+
+        if self.mode == MODE_SAMPLE:
+            return sampled
+
+        @functools.wraps(func)
+        def profiled(*args):
+            if not self._cprofile_lock.acquire(blocking=False):
+                return sampled(*args)  # Another execution is being profiled
+            try:
+                profile = cProfile.Profile()
+                try:
+                    profile.enable()
+                except ValueError:  # Another profiling tool is active (Python 3.12+)
+                    return sampled(*args)
+                try:
+                    return func(*args)
+                finally:
+                    profile.disable()
+                    self._save(script_name, profile, None, reports)
+            finally:
+                self._cprofile_lock.release()
+        return profiled
+
+    def _save(self, script_name, profile, stacks, reports=None):
+        """Merge one execution into <script>.pstats / <script>.collapsed."""
+        os.makedirs(self.output_dir, exist_ok=True)
+        pstats_path = os.path.join(self.output_dir, f"{script_name}.pstats")
+        collapsed_path = os.path.join(self.output_dir, f"{script_name}.collapsed")
+        written = []
+        try:
+            with self._write_lock:
+                if profile is not None:
+                    stats = pstats.Stats(profile)
+                    stacks = collapse_stats(stats.stats)
+                    if os.path.exists(pstats_path):
+                        stats.add(pstats_path)
+                    stats.dump_stats(pstats_path + ".tmp")
+                    os.replace(pstats_path + ".tmp", pstats_path)
+                    written.append(pstats_path)
+                merge_collapsed(collapsed_path, stacks)
+                written.append(collapsed_path)
+        except (OSError, TypeError, ValueError) as e:
+            # Profiling must never change the outcome of a run
+            _report(f"Warning: Could not save the profile of {script_name}: {e}", reports)
+            return
+        _report(f"Profile of {script_name} added to {', '.join(written)}", reports)
+        run_events.annotate(profile=written)
+
+
+def _report(line, reports):
+    if reports is None:
+        print(line)
+    else:
+        reports.append(line)
+
+
+def merge_collapsed(path, stacks):
+    """Add stacks ({(frame, ...): microseconds}) to a collapsed-stack file."""
+    totals = collections.Counter()
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                stack, _, value = line.rstrip('\n').rpartition(' ')
+                if stack and value.isdigit():
+                    totals[stack] += int(value)
+    for stack, value in stacks.items():
+        if stack:
+            totals[";".join(stack)] += value
+    with open(path + ".tmp", 'w', encoding='utf-8') as f:
+        for stack, value in sorted(totals.items()):
+            f.write(f"{stack} {value}\n")
+    os.replace(path + ".tmp", path)
+
+
+def get_profiler():
+    """The process-wide ScriptProfiler, or None when profiling is off."""
+    return _profiler
+
+
+def set_profiler(profiler):
+    global _profiler
+    with _profiler_lock:
+        _profiler = profiler
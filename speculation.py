@@ -0,0 +1,109 @@
+"""
+Speculative execution of circuit-breaking nodes ('&&', '||') on the async engine.
+
+    python foo.py <log_id> "<expression>" --speculate
+
+Children of '&&' / '||' normally run one after another, so the first
+decisive result can stop the rest. With speculation the following children
+start while the current one runs, as long as every script involved is
+declared side-effect-free in its script.json (hashed with the folder):
+
+    {"side_effect_free": true}
+
+Speculation never starts past a child with side effects, since later
+checks may depend on what it does. Results are still committed in textual
+order; once the outcome is decided the remaining speculative work is
+cancelled.
+
+Everything a speculative branch reports officially (the stderr result
+codes, run events and so the run history, captured output blocks) is held
+in a Deferral and replayed when the branch is committed, so cancelled
+branches leave no trace there. Human-readable progress on stdout is not
+deferred. A synchronous script already running in an executor thread
+cannot be interrupted: it runs to completion and its result is discarded.
+"""
+import contextvars
+import threading
+
+import planner
+
+CONFIG_KEY = "side_effect_free"
+
+_current = contextvars.ContextVar("speculation_deferral", default=None)
+
+_policy = None
+_policy_lock = threading.Lock()
+
+
+class Deferral:
+    """
+    Official reports of a speculative branch, held until it is committed.
+
+    Deferrals nest: a committed inner branch hands its reports to the
+    deferral of the branch it runs in.
+    """
+    def __init__(self):
+        self.parent = _current.get()
+        self.live = False
+        self._pending = []
+
+    def add(self, func, args):
+        if not self.live:
+            self._pending.append((func, args))
+        elif self.parent is not None:
+            self.parent.add(func, args)
+        else:
+            func(*args)
+
+    def commit(self):
+        """Replay the held reports in order; later reports pass straight through."""
+        self.live = True
+        pending, self._pending = self._pending, []
+        for func, args in pending:
+            self.add(func, args)
+
+
+def report(func, *args):
+    """Call func(*args) now, or when the speculative branch running this is committed."""
+    deferral = _current.get()
+    if deferral is None:
+        func(*args)
+    else:
+        deferral.add(func, args)
+
+
+async def run_deferred(deferral, awaitable):
+    """Await awaitable (in its own task) with its reports held by deferral."""
+    _current.set(deferral)
+    return await awaitable
+
+
+class SpeculationPolicy:
+    """
+    Decides which subtrees may run speculatively.
+
+    Args:
+        config_func: config_func(script_name) -> sidecar config dict
+    """
+    def __init__(self, config_func):
+        self.config_func = config_func
+        self._speculable = {}  # node path -> bool
+
+    def speculable(self, node):
+        """True if every script below node is declared side-effect-free."""
+        if node.path not in self._speculable:
+            self._speculable[node.path] = all(
+                self.config_func(script.name).get(CONFIG_KEY) is True
+                for script in planner.script_nodes(node).values())
+        return self._speculable[node.path]
+
+
+def get_policy():
+    """The process-wide SpeculationPolicy, or None when speculation is off."""
+    return _policy
+
+
+def set_policy(policy):
+    global _policy
+    with _policy_lock:
+        _policy = policy
@@ -0,0 +1,236 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+import directory_hash
+
+# Verification tiers, as recorded for each folder of a run
+TIER_FAST = "fast"            # stat manifest unchanged, stored hash reused
+TIER_CONTENT = "content"      # full content hash (no manifest, or the manifest differed)
+TIER_AUDIT = "audit"          # scheduled full content hash
+TIER_SENSITIVE = "sensitive"  # full content hash, fast path never allowed
+
+DEFAULT_MANIFEST_DIR = ".hash_manifests"
+DEFAULT_AUDIT_EVERY_RUNS = 20
+DEFAULT_AUDIT_EVERY_MINUTES = 60
+
+ENV_CONFIG_FILE = "VERIFY_POLICY_CONFIG"
+ENV_FAST_PATH = "VERIFY_FAST_PATH"
+ENV_MANIFEST_DIR = "VERIFY_MANIFEST_DIR"
+ENV_AUDIT_EVERY_RUNS = "VERIFY_AUDIT_RUNS"
+ENV_AUDIT_EVERY_MINUTES = "VERIFY_AUDIT_MINUTES"
+ENV_SENSITIVE = "VERIFY_SENSITIVE"
+
+
+def stat_manifest(directory_path, exclude_dirs=None):
+    """
+    Describe a folder by metadata only: the directories and, for every file,
+    (relpath, size, mtime_ns, inode, mode), over the files that are hashed.
+
+    Returns:
+        list: Manifest entries (JSON-compatible lists), in walk order
+    """
+    entries = []
+    for root, rel_dir_path, files in directory_hash.walk_directory(directory_path, exclude_dirs):
+        if rel_dir_path != '.':
+            entries.append([rel_dir_path])
+        for filename in files:
+            file_path = os.path.join(root, filename)
+            try:
+                st = os.stat(file_path)
+            except OSError:
+                continue
+            # The mode also covers files that become (un)readable, which changes the hash
+            entries.append([os.path.relpath(file_path, directory_path),
+                            st.st_size, st.st_mtime_ns, st.st_ino, st.st_mode])
+    return entries
+
+
+class VerificationPolicy:
+    """
+    Tiered folder hashing.
+
+    The fast path compares the folder's stat manifest with the one stored
+    after its last content hash and, if nothing differs, reuses that hash.
+    Any difference falls back to hashing the content. A full content audit
+    is forced every audit_every_runs verifications or audit_every_minutes,
+    and folders listed as sensitive are always content-hashed.
+
+    The returned hash is still compared with the registered one by the
+    caller; the policy only decides how the local hash is obtained.
+    """
+    def __init__(self, enabled=False, manifest_dir=DEFAULT_MANIFEST_DIR,
+                 audit_every_runs=DEFAULT_AUDIT_EVERY_RUNS,
+                 audit_every_minutes=DEFAULT_AUDIT_EVERY_MINUTES, sensitive=()):
+        self.enabled = enabled
+        self.manifest_dir = manifest_dir
+        self.audit_every_runs = audit_every_runs
+        self.audit_every_minutes = audit_every_minutes
+        self.sensitive = set(sensitive)
+
+    def manifest_dir_for(self, directory_path):
+        """Manifest directory of a script folder; a relative manifest_dir is in the script root."""
+        script_root = os.path.dirname(os.path.abspath(directory_path))
+        return os.path.join(script_root, self.manifest_dir)
+
+    def manifest_path(self, directory_path):
+        directory_path = os.path.abspath(directory_path)
+        name = os.path.basename(os.path.normpath(directory_path))
+        path_id = hashlib.md5(directory_path.encode('utf-8')).hexdigest()[:12]
+        return os.path.join(self.manifest_dir_for(directory_path), f"{name}-{path_id}.json")
+
+    def _load_state(self, directory_path):
+        try:
+            with open(self.manifest_path(directory_path), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save_state(self, directory_path, state):
+        manifest_dir = self.manifest_dir_for(directory_path)
+        os.makedirs(manifest_dir, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=manifest_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(state, f)
+            os.replace(temp_path, self.manifest_path(directory_path))
+        except BaseException:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+            raise
+
+    def choose_tier(self, name, state, now=None):
+        """Tier to attempt for a folder: fast unless sensitive or an audit is due."""
+        if name in self.sensitive:
+            return TIER_SENSITIVE
+        if state is None:
+            return TIER_CONTENT
+        now = time.time() if now is None else now
+        if (state.get("runs_since_audit", 0) >= self.audit_every_runs
+                or now - state.get("last_audit", 0) >= self.audit_every_minutes * 60):
+            return TIER_AUDIT
+        return TIER_FAST
+
+    def folder_hash(self, directory_path, exclude_dirs=None, on_file=None):
+        """
+        Hash a folder using the cheapest tier the policy allows.
+
+        Args:
+            directory_path (str): Path to the folder
+            exclude_dirs (list): List of directory names to exclude
+            on_file (callable): Passed to calculate_directory_hash; not called
+                                when the fast path is taken
+
+        Returns:
+            tuple: (hash_value, tier, file_hashes) where file_hashes maps each
+                   hashed file's relative path to its MD5
+        """
+        if not self.enabled:
+            file_hashes = {}
+            hash_value = directory_hash.calculate_directory_hash(
+                directory_path, exclude_dirs, verbose=False, on_file=_collect(file_hashes, on_file))
+            return hash_value, TIER_CONTENT, file_hashes
+
+        name = os.path.basename(os.path.normpath(directory_path))
+        state = self._load_state(directory_path)
+        tier = self.choose_tier(name, state)
+
+        # Taken before reading any content: a change made while hashing shows up next time
+        entries = stat_manifest(directory_path, exclude_dirs)
+        if tier == TIER_FAST:
+            if entries == state.get("entries"):
+                state["runs_since_audit"] = state.get("runs_since_audit", 0) + 1
+                self._save_state(directory_path, state)
+                return state["hash"], TIER_FAST, state.get("file_hashes", {})
+            tier = TIER_CONTENT
+
+        file_hashes = {}
+        hash_value = directory_hash.calculate_directory_hash(
+            directory_path, exclude_dirs, verbose=False, on_file=_collect(file_hashes, on_file))
+        if (tier == TIER_AUDIT and entries == state.get("entries")
+                and hash_value != state.get("hash")):
+            print(f"Warning: Audit of {directory_path} found content changes "
+                  f"that left file metadata untouched")
+
+        # Every content hash counts as an audit
+        self._save_state(directory_path, {
+            "path": os.path.abspath(directory_path),
+            "hash": hash_value,
+            "entries": entries,
+            "file_hashes": file_hashes,
+            "runs_since_audit": 0,
+            "last_audit": time.time(),
+        })
+        return hash_value, tier, file_hashes
+
+
+def _collect(file_hashes, on_file):
+    def collect(rel_path, content, content_hash):
+        file_hashes[rel_path] = content_hash
+        if on_file is not None:
+            on_file(rel_path, content, content_hash)
+    return collect
+
+
+def load_config(config=None):
+    """
+    Resolve the verification policy configuration.
+
+    Values come from, in increasing priority: built-in defaults, the JSON file
+    named by VERIFY_POLICY_CONFIG, the VERIFY_* environment variables and
+    finally the config dictionary passed in.
+
+    Returns:
+        dict: Keys 'enabled', 'manifest_dir', 'audit_every_runs',
+              'audit_every_minutes' and 'sensitive'
+    """
+    resolved = {
+        "enabled": False,
+        "manifest_dir": DEFAULT_MANIFEST_DIR,
+        "audit_every_runs": DEFAULT_AUDIT_EVERY_RUNS,
+        "audit_every_minutes": DEFAULT_AUDIT_EVERY_MINUTES,
+        "sensitive": [],
+    }
+
+    config_file = os.environ.get(ENV_CONFIG_FILE)
+    if config_file:
+        with open(config_file, 'r') as f:
+            resolved.update(json.load(f))
+
+    if os.environ.get(ENV_FAST_PATH):
+        resolved["enabled"] = os.environ[ENV_FAST_PATH].lower() not in ("0", "false", "no")
+    if os.environ.get(ENV_MANIFEST_DIR):
+        resolved["manifest_dir"] = os.environ[ENV_MANIFEST_DIR]
+    if os.environ.get(ENV_AUDIT_EVERY_RUNS):
+        resolved["audit_every_runs"] = int(os.environ[ENV_AUDIT_EVERY_RUNS])
+    if os.environ.get(ENV_AUDIT_EVERY_MINUTES):
+        resolved["audit_every_minutes"] = float(os.environ[ENV_AUDIT_EVERY_MINUTES])
+    if os.environ.get(ENV_SENSITIVE):
+        resolved["sensitive"] = [name for name in os.environ[ENV_SENSITIVE].split(',') if name]
+
+    if config:
+        resolved.update(config)
+    return resolved
+
+
+_policy = None
+_policy_lock = threading.Lock()
+
+def get_verification_policy():
+    """Return the process-wide verification policy, created from the configuration on first use."""
+    global _policy
+    with _policy_lock:
+        if _policy is None:
+            _policy = VerificationPolicy(**load_config())
+        return _policy
+
+def set_verification_policy(policy):
+    """Replace the process-wide verification policy (e.g. for benchmarks)."""
+    global _policy
+    with _policy_lock:
+        _policy = policy